@@ -13,7 +13,6 @@ PŁCIOWE (na razie jak bezpłciowe):
 TODO: 3. Dynamiczne priorytety (Priority 1, 2, 3)
 """
 from typing import List
-from datetime import datetime
 from src.models import SPA, Deal
 
 
@@ -51,16 +50,27 @@ class DealPrioritizer:
         Zwraca klucz sortowania dla deala
         
         Returns:
-            tuple: (priority_level, executing_date)
+            tuple: (priority_level, brak_daty, executing_date)
         """
         # 1. Priorytet SPA (niższy = lepszy)
         priority_level = self.PRIORITY_ORDER.get(deal.priority or "", 999)
         
-        # 2. Data EXECUTING (wcześniejsza = lepsza)
-        # Jeśli brak daty → użyj datetime.max (trafi na koniec)
-        executing_date = deal.executing_date if deal.executing_date else datetime.max
+        # 2. Data EXECUTING (wcześniejsza = lepsza), brak daty → na koniec
+        return (priority_level, *self._executing_sort_value(deal))
+    
+    @staticmethod
+    def _executing_sort_value(deal: Deal) -> tuple:
+        """
+        Część klucza dla daty EXECUTING: (brak_daty, znacznik czasu)
+        
+        Flaga zamiast datetime.max: daty z API mają strefę czasową
+        ("2025-10-01T10:00:00+03:00"), datetime.max nie - porównanie rzuca
+        TypeError. Znacznik czasu porównuje też daty naiwne ze strefowymi.
+        """
+        if not deal.executing_date:
+            return (True, 0.0)
         
-        return (priority_level, executing_date)
+        return (False, deal.executing_date.timestamp())
     
     def sort_genderless(self, deals: List[Deal]) -> List[Deal]:
         """
@@ -9,8 +9,13 @@ API REFERENCE (b24pysdk 0.1.0a1):
 - request.result                                        # Wynik requestu
 - request.as_list()                                     # Pełna lista (auto-pagination)
 - request.as_list_fast()                                # Generator (lazy loading)
+
+Przetwarzanie SPA (BitrixService) idzie przez jedną sesję HTTP z pulą
+połączeń keep-alive - patrz src/services/http_session.py. Klient SDK
+(get_bitrix_client) korzysta z własnego requestera b24pysdk.
 """
 import os
+import threading
 from dotenv import load_dotenv
 from b24pysdk import BitrixWebhook, Client
 
@@ -23,11 +28,53 @@ class BitrixConfig:
     
     def __init__(self):
         self.domain = os.getenv("BITRIX_DOMAIN", "ralengroup.bitrix24.pl")
+        # "http" tylko dla lokalnego zamiennika (src/testing/bitrix_standin.py)
+        self.scheme = os.getenv("BITRIX_SCHEME", "https")
         self.user_id = os.getenv("BITRIX_USER_ID", "25031")
         self.webhook_key = os.getenv("BITRIX_WEBHOOK_KEY", "6cg9uncuyvbxtiq3")
         
         # Webhook token w formacie: user_id/webhook_key
         self.auth_token = f"{self.user_id}/{self.webhook_key}"
+        
+        # Pula połączeń HTTP (keep-alive) i timeouty
+        self.pool_size = int(os.getenv("BITRIX_POOL_SIZE", "10"))
+        self.connect_timeout = float(os.getenv("BITRIX_CONNECT_TIMEOUT", "3.05"))
+        self.read_timeout = float(os.getenv("BITRIX_READ_TIMEOUT", "10"))
+        
+        # Limit requestów portalu (leaky bucket Bitrix24: 2/s, bufor 50)
+        self.rate_limit = float(os.getenv("BITRIX_RATE_LIMIT", "2"))
+        self.rate_burst = int(os.getenv("BITRIX_RATE_BURST", "50"))
+        self.max_backoff = float(os.getenv("BITRIX_MAX_BACKOFF", "60"))
+        self.max_throttle_retries = int(os.getenv("BITRIX_MAX_THROTTLE_RETRIES", "5"))
+        
+        # Odporność: deadline wywołania, ponowienia (idempotentne), circuit breaker
+        self.call_deadline = float(os.getenv("BITRIX_CALL_DEADLINE", "30"))
+        self.retry_attempts = int(os.getenv("BITRIX_RETRY_ATTEMPTS", "3"))
+        self.retry_base_delay = float(os.getenv("BITRIX_RETRY_BASE_DELAY", "0.5"))
+        self.retry_max_delay = float(os.getenv("BITRIX_RETRY_MAX_DELAY", "8"))
+        self.breaker_threshold = int(os.getenv("BITRIX_BREAKER_THRESHOLD", "5"))
+        self.breaker_reset = float(os.getenv("BITRIX_BREAKER_RESET", "30"))
+        
+        # Hedged reads: duplikat odczytu po przekroczeniu percentyla opóźnień (opcjonalne)
+        self.hedge_reads = os.getenv("BITRIX_HEDGE_READS", "0") == "1"
+        self.hedge_percentile = float(os.getenv("BITRIX_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_delay = float(os.getenv("BITRIX_HEDGE_MIN_DELAY", "0.2"))
+        self.hedge_budget = float(os.getenv("BITRIX_HEDGE_BUDGET", "0.1"))
+        
+        # Snapshoty odpowiedzi: nagrywanie / odtwarzanie bez portalu (opcjonalne)
+        self.record_path = os.getenv("BITRIX_RECORD_PATH", "")
+        self.replay_path = os.getenv("BITRIX_REPLAY_PATH", "")
+        self.replay_latency = os.getenv("BITRIX_REPLAY_LATENCY", "")
+    
+    @property
+    def base_url(self) -> str:
+        """Bazowy URL REST webhooka (bez nazwy metody)"""
+        return f"{self.scheme}://{self.domain}/rest/{self.auth_token}"
+    
+    @property
+    def timeout(self) -> tuple:
+        """Timeout dla requests: (connect, read)"""
+        return (self.connect_timeout, self.read_timeout)
     
     def get_client(self) -> Client:
         """
@@ -66,11 +113,29 @@ class BitrixConfig:
 
 # Singleton - jedna instancja dla całej aplikacji
 _config = None
+_client = None
+_lock = threading.RLock()
 
-def get_bitrix_client() -> Client:
-    """Zwraca globalnego klienta Bitrix24"""
+
+def get_bitrix_config() -> BitrixConfig:
+    """Zwraca globalną konfigurację Bitrix24"""
     global _config
     if _config is None:
-        _config = BitrixConfig()
-    return _config.get_client()
+        with _lock:
+            if _config is None:
+                _config = BitrixConfig()
+    return _config
 
+
+def get_bitrix_client() -> Client:
+    """
+    Zwraca globalnego klienta Bitrix24
+    
+    Klient jest tworzony raz na proces.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = get_bitrix_config().get_client()
+    return _client
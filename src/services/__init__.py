@@ -1,9 +1,14 @@
 """
 Services layer
 """
-from .bitrix_service import BitrixService
+from .bitrix_service import BitrixService, BitrixAPIError
+from .async_bitrix import AsyncBitrixService
+from .spa_processor import SPAProcessingResult, process_spa
 
 __all__ = [
     "BitrixService",
+    "BitrixAPIError",
+    "AsyncBitrixService",
+    "SPAProcessingResult",
+    "process_spa",
 ]
-
@@ -0,0 +1,274 @@
+"""
+AsyncBitrixService - asynchroniczna warstwa dostępu do Bitrix24
+
+Opakowuje BitrixService: każde wywołanie idzie do puli wątków
+(asyncio.to_thread), więc korzysta z tej samej sesji HTTP i puli połączeń.
+Semafor ogranicza liczbę równoległych requestów do rozmiaru puli,
+dzięki czemu niezależne odczyty i paczki update'ów lecą równolegle,
+ale nie zalewają portalu.
+
+Pojedyncze odczyty krytyczne dla czasu przebiegu mogą być "hedged"
+(duplikat po percentylu opóźnień) - patrz src/services/hedging.py.
+Idą wtedy do osobnej puli wątków, na którą asyncio.run() nie czeka.
+"""
+import asyncio
+import contextvars
+import functools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .bitrix_service import BitrixService
+from .hedging import HedgePolicy, get_hedge_executor, get_hedge_policy
+
+
+# Domyślna wartość `hedging` - polityka globalna (None wyłącza hedging)
+_GLOBAL_POLICY: Any = object()
+
+
+class AsyncBitrixService:
+    """Asynchroniczny odpowiednik BitrixService"""
+    
+    def __init__(
+        self,
+        service: Optional[BitrixService] = None,
+        max_concurrency: Optional[int] = None,
+        hedging: Optional[HedgePolicy] = _GLOBAL_POLICY
+    ):
+        """
+        Args:
+            service: Synchroniczny BitrixService (domyślnie nowy)
+            max_concurrency: Maks. liczba równoległych requestów
+                (domyślnie BITRIX_POOL_SIZE)
+            hedging: Polityka hedged reads (domyślnie globalna; None = wyłączone)
+        """
+        self.service = service or BitrixService()
+        self.max_concurrency = max_concurrency or self.service.config.pool_size
+        self.hedging = get_hedge_policy() if hedging is _GLOBAL_POLICY else hedging
+        self._semaphore = None
+    
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Semafor tworzony leniwie - musi należeć do działającej pętli"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+    
+    async def _run(self, func, *args, **kwargs):
+        """Wykonuje blokujące wywołanie BitrixService w puli wątków"""
+        async with self.semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+    
+    async def _run_detached(self, func, *args):
+        """
+        _run() w puli odczytów hedged (get_hedge_executor)
+        
+        asyncio.run() nie czeka na tę pulę - przegrany request kończy się
+        w tle, a przebieg zwraca wynik od razu. Kontekst (count_requests)
+        przechodzi do wątku jak w asyncio.to_thread.
+        """
+        call = functools.partial(contextvars.copy_context().run, func, *args)
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(get_hedge_executor(), call)
+    
+    async def _timed(self, operation: str, func, *args):
+        """_run_detached() z pomiarem opóźnienia udanego odczytu (do percentyli hedgingu)"""
+        started = self.hedging.clock()
+        result = await self._run_detached(func, *args)
+        self.hedging.tracker.record(operation, self.hedging.clock() - started)
+        return result
+    
+    async def _read(self, func, *args):
+        """
+        Odczyt jednym requestem - z duplikatem, jeśli się spóźnia (hedged read)
+        
+        Wygrywa pierwsza udana odpowiedź. Przegrany request kończy się
+        w tle (wątku nie da się przerwać), jego wynik jest pomijany.
+        """
+        if self.hedging is None:
+            return await self._run(func, *args)
+        
+        operation = func.__name__
+        delay = self.hedging.hedge_delay(operation)
+        primary = asyncio.ensure_future(self._timed(operation, func, *args))
+        
+        if delay is None:
+            return await primary
+        
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.hedging.try_hedge():
+            return await primary
+        
+        hedge = asyncio.ensure_future(self._timed(operation, func, *args))
+        pending = {primary, hedge}
+        
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        self.hedging.record_win()
+                    for loser in pending:
+                        loser.add_done_callback(self._discard)
+                    return task.result()
+        
+        # Obie próby zawiodły - zgłoś błąd pierwotnego requestu
+        return primary.result()
+    
+    @staticmethod
+    def _discard(task: asyncio.Task):
+        """Odbiera wynik przegranego requestu (bez ostrzeżeń o nieodebranym wyjątku)"""
+        if not task.cancelled():
+            task.exception()
+    
+    async def call(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Asynchroniczny BitrixService.call()"""
+        return await self._run(self.service.call, method, data)
+    
+    async def get_spa(self, spa_id: int) -> Dict[str, Any]:
+        """Asynchroniczny BitrixService.get_spa()"""
+        return await self._read(self.service.get_spa, spa_id)
+    
+    async def get_spa_with_first_page(
+        self,
+        spa_id: int,
+        filter: Dict[str, Any],
+        select: List[str]
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Asynchroniczny BitrixService.get_spa_with_first_page() (jeden batch)"""
+        return await self._read(self.service.get_spa_with_first_page, spa_id, filter, select)
+    
+    async def list_spas(
+        self,
+        filter: Dict[str, Any],
+        select: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Asynchroniczny odpowiednik BitrixService.list_spas()"""
+        return await self._run(self.service.list_spas, filter, select)
+    
+    async def list_deals(
+        self,
+        filter: Dict[str, Any],
+        select: List[str]
+    ) -> List[Dict[str, Any]]:
+        """Asynchroniczny BitrixService.list_deals() (pełna paginacja)"""
+        return await self._run(self.service.list_deals, filter, select)
+    
+    async def list_deals_parallel(
+        self,
+        filter: Dict[str, Any],
+        select: List[str],
+        after_id: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Pobiera wszystkie deale pasujące do filtra - zakresy ID równolegle
+        
+        1. Jedno zapytanie: total i najwyższe ID (BitrixService.probe_deals)
+        2. Zakres (after_id, max_id] dzielony na tyle części, ile stron
+           (nie więcej niż max_concurrency)
+        3. Każda część stronicowana keyset niezależnie, wszystkie naraz
+        
+        Tempo nadal ogranicza wspólny rate limiter sesji HTTP.
+        
+        Args:
+            filter: Filtr Bitrix24
+            select: Lista pól do pobrania
+            after_id: Pobieraj od ID większego niż podane
+        
+        Returns:
+            List[Dict]: Deale bez duplikatów, rosnąco po ID
+        """
+        total, top_page = await self._read(self.service.probe_deals, filter, select, after_id)
+        
+        if total <= len(top_page):
+            return self._merge([top_page])
+        
+        max_id = int(top_page[0]["ID"])
+        pages = -(-total // self.service.PAGE_SIZE)
+        partitions = max(1, min(pages, self.max_concurrency))
+        
+        bounds = [after_id + (max_id - after_id) * i // partitions for i in range(partitions + 1)]
+        
+        ranges = await asyncio.gather(*[
+            self._run(self.service.list_deals, {**filter, "<=ID": high}, select, low)
+            for low, high in zip(bounds, bounds[1:])
+        ])
+        
+        return self._merge([top_page, *ranges])
+    
+    async def list_deals_union(
+        self,
+        filters: List[Dict[str, Any]],
+        select: List[str],
+        after_id: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Deale pasujące do któregokolwiek z filtrów - filtry pobierane równolegle
+        
+        Returns:
+            List[Dict]: Deale bez duplikatów, rosnąco po ID
+        """
+        results = await asyncio.gather(*[
+            self.list_deals_parallel(filter, select, after_id)
+            for filter in filters
+        ])
+        return self._merge(results)
+    
+    async def list_deals_ordered_page(
+        self,
+        filter: Dict[str, Any],
+        select: List[str],
+        order: Dict[str, str],
+        start: int = 0
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Asynchroniczny BitrixService.list_deals_ordered_page() (jedna strona)"""
+        return await self._read(self.service.list_deals_ordered_page, filter, select, order, start)
+    
+    async def batch(
+        self,
+        commands: Dict[str, tuple],
+        halt: bool = False
+    ) -> Dict[str, Any]:
+        """Asynchroniczny BitrixService.batch()"""
+        return await self._run(self.service.batch, commands, halt)
+    
+    async def batch_update_stages(
+        self,
+        updates: List[Dict[str, str]],
+        on_chunk: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Batch update etapów - paczki po 50 wysyłane równolegle
+        
+        Args:
+            updates: Lista dict z kluczami 'id' i 'stage'
+            on_chunk: Wywoływane z wynikami każdej paczki zaraz po jej zakończeniu
+                (np. zapis do dziennika awansów)
+        
+        Returns:
+            Dict[str, Dict]: Mapowanie deal_id → {"success": bool, "error": Optional[str]}
+        """
+        size = self.service.MAX_BATCH_SIZE
+        chunks = [updates[i:i + size] for i in range(0, len(updates), size)]
+        
+        async def run_chunk(chunk):
+            result = await self._run(self.service.batch_update_stages, chunk)
+            if on_chunk is not None:
+                on_chunk(result)
+            return result
+        
+        chunk_results = await asyncio.gather(*[run_chunk(chunk) for chunk in chunks])
+        
+        results = {}
+        for chunk_result in chunk_results:
+            results.update(chunk_result)
+        
+        return results
+    
+    @staticmethod
+    def _merge(pages: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Scala strony dealów - bez duplikatów (po ID), rosnąco po ID"""
+        deals_by_id = {}
+        for page in pages:
+            for deal in page:
+                deals_by_id[deal["ID"]] = deal
+        
+        return sorted(deals_by_id.values(), key=lambda deal: int(deal["ID"]))
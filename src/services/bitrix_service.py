@@ -2,20 +2,44 @@
 BitrixService - wrapper na operacje Bitrix24
 
 Używa bezpośrednich requestów dla update (b24pysdk ma problemy z deferred calls)
+Requesty idą przez wspólną sesję HTTP z pulą połączeń (src/services/http_session.py)
 """
-import os
-import requests
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from b24pysdk.utils.encoding import encode_params
+from src.config import get_bitrix_config
+from .http_session import get_http_session
+from .recent_writes import get_recent_writes
+
+
+# Entity Type ID projektów SPA (Smart Process)
+SPA_ENTITY_TYPE_ID = 1032
+
+
+class BitrixAPIError(RuntimeError):
+    """Błąd zwrócony przez REST API Bitrix24 (pole 'error' w odpowiedzi)"""
+    
+    def __init__(self, method: str, error: str, description: str = ""):
+        super().__init__(f"Bitrix {method} error: {error} - {description}")
+        self.method = method
+        self.error = error
+        self.description = description
 
 
 class BitrixService:
     """Service do aktualizacji dealów w Bitrix24"""
     
+    # Bitrix przyjmuje maksymalnie 50 komend w jednym wywołaniu batch
+    MAX_BATCH_SIZE = 50
+    
+    # Metody *.list zwracają maksymalnie 50 rekordów na stronę
+    PAGE_SIZE = 50
+    
     def __init__(self):
-        self.domain = os.getenv("BITRIX_DOMAIN", "ralengroup.bitrix24.pl")
-        self.user_id = os.getenv("BITRIX_USER_ID", "25031")
-        self.webhook_key = os.getenv("BITRIX_WEBHOOK_KEY", "6cg9uncuyvbxtiq3")
-        self.base_url = f"https://{self.domain}/rest/{self.user_id}/{self.webhook_key}"
+        self.config = get_bitrix_config()
+        self.domain = self.config.domain
+        self.base_url = self.config.base_url
+        self.session = get_http_session()
+        self.recent_writes = get_recent_writes()
     
     def update_deal_stage(self, deal_id: str, new_stage: str) -> bool:
         """
@@ -28,8 +52,6 @@ class BitrixService:
         Returns:
             bool: True jeśli sukces
         """
-        url = f"{self.base_url}/crm.deal.update"
-        
         data = {
             "id": deal_id,
             "fields": {
@@ -37,32 +59,370 @@ class BitrixService:
             }
         }
         
-        response = requests.post(url, json=data, timeout=10)
-        result = response.json()
+        self.recent_writes.record([deal_id])
+        result = self.call("crm.deal.update", data)
         
         return result.get('result', False)
     
+    def get_spa(self, spa_id: int) -> Dict[str, Any]:
+        """
+        Pobiera projekt SPA (crm.item.get, entityTypeId=1032)
+        
+        Args:
+            spa_id: ID projektu SPA
+        
+        Returns:
+            Dict: Surowy wynik API (z kluczem "item") - do SPA.from_api()
+        """
+        payload = self.call("crm.item.get", {
+            "entityTypeId": SPA_ENTITY_TYPE_ID,
+            "id": spa_id,
+        })
+        return payload["result"]
+    
+    def get_spa_with_first_page(
+        self,
+        spa_id: int,
+        filter: Dict[str, Any],
+        select: List[str]
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Pobiera SPA i pierwszą stronę dealów (keyset) jednym wywołaniem `batch`
+        
+        Dla SPA z mniej niż 50 dealami to cały odczyt w jednym round trip.
+        Pełna strona (PAGE_SIZE) oznacza, że mogą być kolejne - wywołujący
+        decyduje jak je dociągnąć, znając już dane SPA.
+        
+        Args:
+            spa_id: ID projektu SPA
+            filter: Filtr dealów Bitrix24
+            select: Lista pól dealów do pobrania
+        
+        Returns:
+            Tuple[Dict, List[Dict]]: (surowe SPA - do SPA.from_api(), pierwsza strona dealów)
+        
+        Raises:
+            BitrixAPIError: Jeśli któraś komenda batch zwróciła błąd
+        """
+        batch_result = self.batch({
+            "spa": ("crm.item.get", {"entityTypeId": SPA_ENTITY_TYPE_ID, "id": spa_id}),
+            "deals": ("crm.deal.list", self.keyset_params(filter, select)),
+        })
+        
+        for key, method in (("spa", "crm.item.get"), ("deals", "crm.deal.list")):
+            error = batch_result["result_error"].get(key)
+            if error:
+                raise BitrixAPIError(method, *self._error_parts(error))
+        
+        return batch_result["result"]["spa"], list(batch_result["result"].get("deals") or [])
+    
+    def list_spas(
+        self,
+        filter: Dict[str, Any],
+        select: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Pobiera wszystkie projekty SPA pasujące do filtra (crm.item.list)
+        
+        Paginacja keyset po id (jak list_deals).
+        
+        Args:
+            filter: Filtr crm.item.list (np. {"stageId": SPAStage.IN_PROGRESS.value})
+            select: Lista pól (None = wszystkie pola)
+        
+        Returns:
+            List[Dict]: Surowe SPA (rosnąco po id) - do SPA.from_api({"item": ...})
+        """
+        items = []
+        last_id = 0
+        
+        while True:
+            params = {
+                "entityTypeId": SPA_ENTITY_TYPE_ID,
+                "filter": {**filter, ">id": last_id},
+                "order": {"id": "ASC"},
+                "start": -1,
+            }
+            if select is not None:
+                params["select"] = select
+            
+            payload = self.call("crm.item.list", params)
+            page = (payload.get("result") or {}).get("items", [])
+            items.extend(page)
+            
+            if len(page) < self.PAGE_SIZE:
+                return items
+            
+            last_id = int(page[-1]["id"])
+    
+    def list_deals(
+        self,
+        filter: Dict[str, Any],
+        select: List[str],
+        after_id: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Pobiera wszystkie deale pasujące do filtra (crm.deal.list)
+        
+        Paginacja keyset po ID zamiast offsetu:
+        - filtr ">ID" = ostatnie ID z poprzedniej strony, sortowanie po ID
+        - start=-1 wyłącza liczenie rekordów (COUNT) po stronie Bitrix
+        Strony nie przesuwają się ani nie dublują, gdy deal zmieni etap w trakcie pobierania.
+        
+        Args:
+            filter: Filtr Bitrix24 (np. {"STAGE_ID": [...], "UF_CRM_1740931330": ...})
+            select: Lista pól do pobrania
+            after_id: Pobieraj od ID większego niż podane (0 = od początku)
+        
+        Returns:
+            List[Dict]: Surowe dane dealów (rosnąco po ID) - do Deal.from_api()
+        """
+        deals = []
+        last_id = after_id
+        
+        while True:
+            page = self.list_deals_page(filter, select, after_id=last_id)
+            deals.extend(page)
+            
+            if len(page) < self.PAGE_SIZE:
+                return deals
+            
+            last_id = int(page[-1]["ID"])
+    
+    def list_deals_page(
+        self,
+        filter: Dict[str, Any],
+        select: List[str],
+        after_id: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Pobiera jedną stronę (do 50) dealów z ID > after_id
+        
+        Args:
+            filter: Filtr Bitrix24
+            select: Lista pól do pobrania
+            after_id: Ostatnie ID z poprzedniej strony (0 = od początku)
+        
+        Returns:
+            List[Dict]: Strona dealów rosnąco po ID
+        """
+        payload = self.call("crm.deal.list", self.keyset_params(filter, select, after_id))
+        return payload.get("result", [])
+    
+    def probe_deals(
+        self,
+        filter: Dict[str, Any],
+        select: List[str],
+        after_id: int = 0
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Liczba dealów z ID > after_id i strona o najwyższych ID (jedno zapytanie)
+        
+        Pozwala podzielić zakres ID na części pobierane równolegle
+        (AsyncBitrixService.list_deals_parallel).
+        
+        Args:
+            filter: Filtr Bitrix24
+            select: Lista pól do pobrania
+            after_id: Dolna granica ID (wyłącznie)
+        
+        Returns:
+            Tuple[int, List[Dict]]: (total, do 50 dealów malejąco po ID)
+        """
+        payload = self.call("crm.deal.list", {
+            "filter": {**filter, ">ID": after_id},
+            "select": select,
+            "order": {"ID": "DESC"},
+            "start": 0,
+        })
+        page = payload.get("result", [])
+        return int(payload.get("total", len(page))), page
+    
+    def list_deals_ordered_page(
+        self,
+        filter: Dict[str, Any],
+        select: List[str],
+        order: Dict[str, str],
+        start: int = 0
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Pobiera jedną stronę dealów w zadanej kolejności (paginacja offsetem)
+        
+        Dla sortowania po polach innych niż ID (np. priorytet, data EXECUTING),
+        gdzie keyset po ID nie zachowuje kolejności.
+        
+        Args:
+            filter: Filtr Bitrix24
+            select: Lista pól do pobrania
+            order: Sortowanie (np. {"UF_CRM_1741856527": "ASC", "ID": "ASC"})
+            start: Offset strony
+        
+        Returns:
+            Tuple[List[Dict], Optional[int]]: (strona dealów, offset następnej strony lub None)
+        """
+        payload = self.call("crm.deal.list", {
+            "filter": filter,
+            "select": select,
+            "order": order,
+            "start": start,
+        })
+        return payload.get("result", []), payload.get("next")
+    
+    @staticmethod
+    def keyset_params(
+        filter: Dict[str, Any],
+        select: List[str],
+        after_id: int = 0
+    ) -> Dict[str, Any]:
+        """Parametry crm.deal.list dla strony keyset (>ID, ORDER ID ASC, start=-1)"""
+        return {
+            "filter": {**filter, ">ID": after_id},
+            "select": select,
+            "order": {"ID": "ASC"},
+            "start": -1,
+        }
+    
+    def batch(
+        self,
+        commands: Dict[str, tuple],
+        halt: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Wykonuje do 50 metod REST w jednym wywołaniu `batch`
+        
+        Args:
+            commands: Mapowanie klucz → (metoda, parametry),
+                np. {"deal_1": ("crm.deal.update", {"id": "1", ...})}
+            halt: Czy przerwać batch po pierwszym błędzie
+        
+        Returns:
+            Dict z kluczami 'result', 'result_error', 'result_total', 'result_next'
+            (każdy indeksowany kluczami komend)
+        """
+        if len(commands) > self.MAX_BATCH_SIZE:
+            raise ValueError(f"Maksymalny rozmiar batch to {self.MAX_BATCH_SIZE}")
+        
+        data = {
+            "halt": 1 if halt else 0,
+            "cmd": {
+                key: f"{method}?{encode_params(params)}"
+                for key, (method, params) in commands.items()
+            }
+        }
+        
+        payload = self.call("batch", data)
+        
+        batch_result = payload.get("result", {})
+        
+        return {
+            "result": self._as_dict(batch_result.get("result")),
+            "result_error": self._as_dict(batch_result.get("result_error")),
+            "result_total": self._as_dict(batch_result.get("result_total")),
+            "result_next": self._as_dict(batch_result.get("result_next")),
+        }
+    
     def batch_update_stages(
-        self, 
+        self,
         updates: List[Dict[str, str]]
-    ) -> Dict[str, bool]:
+    ) -> Dict[str, Dict[str, Any]]:
         """
         Batch update etapów dealów
         
+        Pakuje do 50 komend `crm.deal.update` w jedno wywołanie `batch`.
+        Błąd pojedynczej komendy nie przerywa pozostałych (halt=0).
+        Deale trafiają do rejestru własnych zapisów przed wysłaniem paczki.
+        
         Args:
             updates: Lista dict z kluczami 'id' i 'stage'
             
         Returns:
-            Dict[str, bool]: Mapowanie deal_id → success
+            Dict[str, Dict]: Mapowanie deal_id → {"success": bool, "error": Optional[str]}
         """
         results = {}
         
-        for update in updates:
-            deal_id = update['id']
-            new_stage = update['stage']
+        for start in range(0, len(updates), self.MAX_BATCH_SIZE):
+            chunk = updates[start:start + self.MAX_BATCH_SIZE]
             
-            success = self.update_deal_stage(deal_id, new_stage)
-            results[deal_id] = success
+            commands = {
+                self._command_key(update['id']): (
+                    "crm.deal.update",
+                    {"id": update['id'], "fields": {"STAGE_ID": update['stage']}},
+                )
+                for update in chunk
+            }
+            self.recent_writes.record(update['id'] for update in chunk)
+            
+            try:
+                batch_result = self.batch(commands)
+            except Exception as e:
+                # Cały batch nie doszedł - każdy deal z tej paczki dostaje ten sam błąd
+                for update in chunk:
+                    results[update['id']] = {"success": False, "error": str(e)}
+                continue
+            
+            for update in chunk:
+                key = self._command_key(update['id'])
+                error = batch_result["result_error"].get(key)
+                
+                results[update['id']] = {
+                    "success": bool(batch_result["result"].get(key)) and not error,
+                    "error": self._format_error(error) if error else None,
+                }
         
         return results
-
+    
+    def call(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Wysyła metodę REST przez wspólną sesję HTTP
+        
+        Args:
+            method: Nazwa metody REST (np. 'crm.deal.update')
+            data: Parametry metody (JSON)
+        
+        Returns:
+            Dict: Zdekodowana odpowiedź JSON
+        
+        Raises:
+            BitrixAPIError: Jeśli odpowiedź zawiera pole 'error'
+        """
+        response = self.session.post(
+            f"{self.base_url}/{method}",
+            json=data,
+            timeout=self.config.timeout,
+        )
+        payload = response.json()
+        
+        if "error" in payload:
+            raise BitrixAPIError(method, payload["error"], payload.get("error_description", ""))
+        
+        return payload
+    
+    @staticmethod
+    def _command_key(deal_id: str) -> str:
+        """Klucz komendy w batch (pozwala zmapować wynik z powrotem na deal)"""
+        return f"deal_{deal_id}"
+    
+    @staticmethod
+    def _as_dict(value: Optional[Any]) -> Dict[str, Any]:
+        """
+        Bitrix zwraca pustą listę zamiast pustego obiektu - normalizujemy do dict
+        """
+        if isinstance(value, dict):
+            return value
+        if isinstance(value, list):
+            return {str(index): item for index, item in enumerate(value)}
+        return {}
+    
+    @staticmethod
+    def _error_parts(error: Any) -> Tuple[str, str]:
+        """Rozbija błąd komendy batch na (kod, opis) - do BitrixAPIError"""
+        if isinstance(error, dict):
+            return error.get("error", "ERROR"), error.get("error_description", "")
+        return str(error), ""
+    
+    @staticmethod
+    def _format_error(error: Any) -> str:
+        """Formatuje błąd pojedynczej komendy batch"""
+        if isinstance(error, dict):
+            return f"{error.get('error', 'ERROR')}: {error.get('error_description', '')}".strip()
+        return str(error)
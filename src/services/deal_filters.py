@@ -0,0 +1,84 @@
+"""
+Filtry kwalifikacji przeniesione do zapytania crm.deal.list
+
+Warunek daty przyjazdu z QualificationValidator zamieniamy na klauzulę
+filtra Bitrix24, żeby deale, które nigdy się nie zakwalifikują, nie były
+w ogóle pobierane.
+
+Semantyka "brak wartości → PASS" jest zachowana przez podział na rozłączne
+zapytania: ograniczone pole albo spełnia klauzulę, albo jest puste.
+
+Do filtra trafiają tylko pola, które Deal parsuje zawsze tak samo jak portal.
+Data przyjazdu to pole typu date - API zwraca ją w ISO, więc wartość
+niepusta w portalu jest niepusta także lokalnie. Wiek (double) zostaje
+tylko w walidatorze: Deal.parse_age zamienia np. "45.5" na None (PASS),
+a portal porównałby 45.5 z limitem i deal odrzucił - dwie ścieżki
+wybierałyby różne deale.
+
+Filtr jest celowo luźniejszy od walidatora (daty poszerzone o dzień -
+strefy czasowe i format dat w Bitrix) - QualificationValidator nadal
+sprawdza każdy deal, więc wynik jest identyczny.
+"""
+import itertools
+from datetime import timedelta
+from typing import List, Dict, Any, Optional
+from src.models import SPA, Deal
+from .projection import field_aliases
+
+
+ARRIVAL_FIELD = field_aliases(Deal, ("arrival_date",))[0]
+
+# Wartość "puste pole" w filtrze. Gdyby portal zignorował taki warunek,
+# zapytanie zwróci nadmiar dealów (deduplikacja po ID) - nigdy mniej.
+EMPTY = ""
+
+
+def arrival_clause(spa: SPA) -> Optional[Dict[str, Any]]:
+    """
+    Klauzula daty przyjazdu (check_arrival_date)
+    
+    - przyjazd >= arrival_from
+    - przyjazd <= min(arrival_to, training_date)
+    Granice poszerzone o dzień - dokładne porównanie robi walidator.
+    """
+    clause = {}
+    
+    if spa.arrival_from:
+        clause[f">={ARRIVAL_FIELD}"] = (spa.arrival_from - timedelta(days=1)).date().isoformat()
+    
+    upper_bounds = [date for date in (spa.arrival_to, spa.training_date) if date]
+    if upper_bounds:
+        clause[f"<={ARRIVAL_FIELD}"] = (min(upper_bounds) + timedelta(days=1)).date().isoformat()
+    
+    return clause or None
+
+
+def qualification_filters(spa: SPA) -> List[Dict[str, Any]]:
+    """
+    Rozłączne filtry dealów, które mogą przejść walidację SPA
+    
+    Dla każdego pola z klauzulą: (klauzula) lub (pole puste).
+    Wynik to iloczyn kartezjański tych alternatyw (limit wieku - bez
+    klauzuli, patrz opis modułu).
+    
+    Args:
+        spa: Projekt SPA
+    
+    Returns:
+        List[Dict]: Klauzule do dołączenia do filtra bazowego
+            ([{}] jeśli SPA nie ma żadnych ograniczeń)
+    """
+    alternatives = []
+    
+    clause = arrival_clause(spa)
+    if clause:
+        alternatives.append([clause, {ARRIVAL_FIELD: EMPTY}])
+    
+    filters = []
+    for combination in itertools.product(*alternatives):
+        merged = {}
+        for clause in combination:
+            merged.update(clause)
+        filters.append(merged)
+    
+    return filters
@@ -0,0 +1,126 @@
+"""
+Strumieniowy odczyt dealów dla SPA bezpłciowych (z wczesnym zakończeniem)
+
+Dla zamówień bezpłciowych wynik zależy tylko od początku posortowanej listy:
+SlotAllocator bierze pierwsze `free_all` dealów, a DealPromoter kolejne
+`2 * free_all` do rezerwy. Pozostałe deale nie są ruszane.
+
+Pobieramy więc deale od razu w kolejności DealPrioritizer i kończymy,
+gdy mamy `3 * free_all` kwalifikujących się:
+1. Priorytety P1 → P4, w każdym:
+   a) z datą EXECUTING - rosnąco po dacie, potem ID
+   b) bez daty - rosnąco po ID (datetime.max w sortowaniu → na koniec)
+2. Reszta (brak/nieznany priorytet) - pobierana w całości i sortowana lokalnie;
+   pierwsza strona z batcha (keyset, rosnąco po ID) nie jest pobierana ponownie
+
+Wynik to początek listy, nie wszystkie deale SPA - statystyki przebiegu
+(total_input, qualified, rejected) dotyczą tylko pobranej części
+(SPAProcessingResult.streamed).
+
+Każdy wiersz jest sprawdzany lokalnie (czy należy do segmentu), więc
+zignorowana przez portal klauzula filtra nie psuje kolejności.
+"""
+from typing import List, Dict, Any, Callable, Optional
+from src.models import Deal, DealPriority
+from src.business_logic import DealPrioritizer
+from .async_bitrix import AsyncBitrixService
+from .deal_filters import EMPTY
+from .projection import field_aliases
+
+
+PRIORITY_FIELD, EXECUTING_FIELD = field_aliases(Deal, ("priority", "executing_date"))
+
+# Kolejność priorytetów zgodna z DealPrioritizer.PRIORITY_ORDER
+PRIORITY_SEGMENTS = [DealPriority.P1, DealPriority.P2, DealPriority.P3, DealPriority.P4]
+
+
+def ordered_segments(base_filter: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Segmenty (filtr, sortowanie, warunek lokalny) w kolejności DealPrioritizer
+    
+    Args:
+        base_filter: Filtr bazowy (SPA, etapy)
+    
+    Returns:
+        List[Dict]: Segmenty z kluczami 'filter', 'order', 'matches'
+    """
+    segments = []
+    
+    for priority in PRIORITY_SEGMENTS:
+        segments.append({
+            "filter": {**base_filter, PRIORITY_FIELD: priority.value, f"!{EXECUTING_FIELD}": EMPTY},
+            "order": {EXECUTING_FIELD: "ASC", "ID": "ASC"},
+            "matches": lambda deal, p=priority.value: deal.priority == p and deal.executing_date is not None,
+        })
+        segments.append({
+            "filter": {**base_filter, PRIORITY_FIELD: priority.value, EXECUTING_FIELD: EMPTY},
+            "order": {"ID": "ASC"},
+            "matches": lambda deal, p=priority.value: deal.priority == p and deal.executing_date is None,
+        })
+    
+    return segments
+
+
+async def stream_genderless_deals(
+    bitrix: AsyncBitrixService,
+    base_filter: Dict[str, Any],
+    select: List[str],
+    qualifies: Callable[[Deal], bool],
+    target: int,
+    first_page: Optional[List[Dict[str, Any]]] = None
+) -> List[Deal]:
+    """
+    Pobiera deale w kolejności sortowania aż do `target` kwalifikujących się
+    
+    Args:
+        bitrix: Asynchroniczny klient
+        base_filter: Filtr bazowy (SPA, etapy)
+        select: Lista pól do pobrania
+        qualifies: Walidacja deala (QualificationValidator dla danego SPA)
+        target: Ile kwalifikujących się dealów wystarczy (3 * free_all)
+        first_page: Pierwsza strona keyset dla base_filter (już pobrana w batch)
+    
+    Returns:
+        List[Deal]: Deale w kolejności sortowania (kwalifikujące się i odrzucone)
+    """
+    deals = []
+    seen = set()
+    qualified = 0
+    
+    if target <= 0:
+        return deals
+    
+    # KROK 1: Segmenty P1-P4 - strona po stronie, aż do celu
+    for segment in ordered_segments(base_filter):
+        start = 0
+        
+        while start is not None:
+            page, start = await bitrix.list_deals_ordered_page(
+                segment["filter"], select, segment["order"], start
+            )
+            
+            for deal_data in page:
+                deal = Deal.from_api(deal_data)
+                if deal.id in seen or not segment["matches"](deal):
+                    continue
+                
+                seen.add(deal.id)
+                deals.append(deal)
+                
+                if qualifies(deal):
+                    qualified += 1
+                    if qualified >= target:
+                        return deals
+    
+    # KROK 2: Reszta (priorytet pusty lub nieznany) - cała, sortowana lokalnie
+    first_page = first_page or []
+    after_id = int(first_page[-1]["ID"]) if first_page else 0
+    remaining = await bitrix.list_deals_parallel(base_filter, select, after_id)
+    
+    known_priorities = {priority.value for priority in PRIORITY_SEGMENTS}
+    rest = [
+        deal for deal in map(Deal.from_api, first_page + remaining)
+        if deal.id not in seen and deal.priority not in known_priorities
+    ]
+    
+    return deals + DealPrioritizer().sort_genderless(rest)
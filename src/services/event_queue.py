@@ -0,0 +1,266 @@
+"""
+Kolejka SPA z debounce - przetwarzanie sterowane zdarzeniami Bitrix24
+
+Zdarzenia (ONCRMDEALUPDATE, ONCRMDEALADD, ONCRMDYNAMICITEMUPDATE) przychodzą
+seriami - np. zmiana etapu kilkunastu dealów jednego SPA. Kolejka zbiera je
+per SPA i uruchamia JEDNO przetwarzanie po wyciszeniu serii:
+- SPA jest gotowe `window` sekund po ostatnim zdarzeniu
+- ale najpóźniej `max_wait` sekund po pierwszym (ciągła seria nie blokuje)
+
+Zdarzenia dealów niosą tylko ID deala - SPA wszystkich oczekujących dealów
+ustalamy hurtowo (jedno crm.deal.list z filtrem ID IN [...]) przy opróżnianiu.
+
+Zdarzenia dealów zapisanych niedawno przez sam serwis są pomijane
+(src/services/recent_writes.py) - inaczej każde przetwarzanie z awansami
+zlecałoby kolejne przetwarzanie tego samego SPA.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .async_bitrix import AsyncBitrixService
+from .recent_writes import RecentWrites, get_recent_writes
+from .sweep import DEAL_SPA_FIELD
+
+
+logger = logging.getLogger("spa_webhook.event_queue")
+
+
+class DebouncedSPAQueue:
+    """Kolejka SPA łącząca serie zdarzeń w jedno przetwarzanie (bezpieczna wątkowo)"""
+    
+    def __init__(
+        self,
+        dispatch: Callable[[int], Any],
+        resolve_deals: Optional[Callable[[List[str]], Dict[str, int]]] = None,
+        window: float = 5.0,
+        max_wait: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        recent_writes: Optional[RecentWrites] = None,
+    ):
+        """
+        Args:
+            dispatch: Zleca przetwarzanie SPA (np. JobManager.submit)
+            resolve_deals: ID dealów → ID SPA (domyślnie crm.deal.list)
+            window: Cisza po ostatnim zdarzeniu przed przetwarzaniem (s)
+            max_wait: Maks. opóźnienie od pierwszego zdarzenia serii (s)
+            clock: Zegar - podmieniany w testach
+            recent_writes: Rejestr własnych zapisów (domyślnie globalny)
+        """
+        self.dispatch = dispatch
+        self.resolve_deals = resolve_deals or self._resolve_deals
+        self.window = window
+        self.max_wait = max_wait
+        self.recent_writes = recent_writes or get_recent_writes()
+        self._clock = clock
+        
+        # spa_id / deal_id → (pierwsze zdarzenie, ostatnie zdarzenie)
+        self._spas: Dict[int, Tuple[float, float]] = {}
+        self._deals: Dict[str, Tuple[float, float]] = {}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        # Liczniki
+        self._events = 0
+        self._dispatched = 0
+        self._unresolved = 0
+        self._own_writes = 0
+    
+    def add_spa(self, spa_id: int):
+        """Zdarzenie dotyczące SPA"""
+        with self._cond:
+            self._events += 1
+            self._touch(self._spas, int(spa_id), self._clock())
+            self._cond.notify()
+    
+    def add_deal(self, deal_id: str) -> bool:
+        """
+        Zdarzenie dotyczące deala (SPA ustalane przy opróżnianiu)
+        
+        Returns:
+            bool: False jeśli zdarzenie pominięto (deal zapisał niedawno serwis)
+        """
+        own_write = self.recent_writes.contains(deal_id)
+        
+        with self._cond:
+            self._events += 1
+            if own_write:
+                self._own_writes += 1
+                return False
+            self._touch(self._deals, str(deal_id), self._clock())
+            self._cond.notify()
+        return True
+    
+    def flush(self, force: bool = False) -> List[int]:
+        """
+        Ustala SPA oczekujących dealów i zleca gotowe SPA
+        
+        Args:
+            force: Zleć wszystkie oczekujące SPA (bez czekania na ciszę)
+        
+        Returns:
+            List[int]: ID zleconych SPA
+        """
+        self._resolve_pending(force)
+        
+        now = self._clock()
+        with self._cond:
+            ready = [spa_id for spa_id, times in self._spas.items() if force or self._due(times) <= now]
+            for spa_id in ready:
+                del self._spas[spa_id]
+        
+        for spa_id in ready:
+            try:
+                self.dispatch(spa_id)
+                self._dispatched += 1
+                logger.info(f"📨 Zdarzenia: SPA {spa_id} zlecone do przetworzenia")
+            except Exception as error:
+                # Np. pełna kolejka zadań - spróbuj ponownie po kolejnym oknie
+                logger.error(f"❌ Zdarzenia: nie udało się zlecić SPA {spa_id} - {error}")
+                with self._cond:
+                    self._touch(self._spas, spa_id, self._clock())
+        
+        return ready
+    
+    def start(self):
+        """Uruchamia wątek opróżniający kolejkę (idempotentne)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="spa-events", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Zatrzymuje wątek"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Liczniki kolejki (do diagnostyki)"""
+        with self._cond:
+            return {
+                "window_seconds": self.window,
+                "max_wait_seconds": self.max_wait,
+                "events": self._events,
+                "pending_spas": len(self._spas),
+                "pending_deals": len(self._deals),
+                "dispatched": self._dispatched,
+                "unresolved_deals": self._unresolved,
+                "ignored_own_writes": self._own_writes,
+            }
+    
+    def _resolve_pending(self, force: bool = False):
+        """
+        Hurtowe ustalenie SPA oczekujących dealów (zdarzenia dealów → SPA)
+        
+        Wszystkie oczekujące deale to jedna seria - ustalamy je razem po jej
+        wyciszeniu (jedno zapytanie zamiast jednego na zdarzenie).
+        """
+        with self._cond:
+            due = self._deals_due()
+            if due is None or (not force and due > self._clock()):
+                return
+            deals, self._deals = self._deals, {}
+        
+        try:
+            spa_by_deal = self.resolve_deals(list(deals))
+        except Exception as error:
+            # Spróbuj ponownie po kolejnym oknie (nowa seria - bez pętli ponowień)
+            logger.error(f"❌ Zdarzenia: nie udało się ustalić SPA dla {len(deals)} dealów - {error}")
+            with self._cond:
+                retry_at = self._clock()
+                for deal_id in deals:
+                    self._touch(self._deals, deal_id, retry_at)
+            return
+        
+        with self._cond:
+            for deal_id, (first, last) in deals.items():
+                spa_id = spa_by_deal.get(deal_id)
+                if spa_id is None:
+                    self._unresolved += 1
+                    continue
+                self._touch(self._spas, spa_id, last, first)
+    
+    def _due(self, times: Tuple[float, float]) -> float:
+        first, last = times
+        return min(last + self.window, first + self.max_wait)
+    
+    def _deals_due(self) -> Optional[float]:
+        """Termin ustalenia SPA dla serii zdarzeń dealów (pod blokadą)"""
+        if not self._deals:
+            return None
+        
+        first = min(times[0] for times in self._deals.values())
+        last = max(times[1] for times in self._deals.values())
+        return self._due((first, last))
+    
+    def _next_due(self) -> Optional[float]:
+        """Najbliższy termin SPA lub serii dealów (pod blokadą)"""
+        candidates = [self._due(times) for times in self._spas.values()]
+        if self._deals:
+            candidates.append(self._deals_due())
+        return min(candidates) if candidates else None
+    
+    def _loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                due = self._next_due()
+                timeout = None if due is None else max(0.0, due - self._clock())
+                if timeout is None or timeout > 0:
+                    self._cond.wait(timeout if timeout is not None else 1.0)
+            
+            if not self._stop.is_set():
+                self.flush()
+    
+    @staticmethod
+    def _touch(pending: Dict, key, at: float, first: Optional[float] = None):
+        """Dopisuje zdarzenie do serii (pod blokadą)"""
+        previous = pending.get(key)
+        first = first if first is not None else at
+        if previous is None:
+            pending[key] = (first, at)
+        else:
+            pending[key] = (min(previous[0], first), max(previous[1], at))
+    
+    @staticmethod
+    def _resolve_deals(deal_ids: List[str]) -> Dict[str, int]:
+        """ID dealów → ID SPA (jedno crm.deal.list, keyset)"""
+        deals = asyncio.run(AsyncBitrixService().list_deals({"ID": deal_ids}, ["ID", DEAL_SPA_FIELD]))
+        return {
+            str(deal["ID"]): int(deal[DEAL_SPA_FIELD])
+            for deal in deals
+            if str(deal.get(DEAL_SPA_FIELD) or "").isdigit()
+        }
+
+
+_queue = None
+_lock = threading.Lock()
+
+
+def get_event_queue(dispatch: Optional[Callable[[int], Any]] = None) -> Optional[DebouncedSPAQueue]:
+    """
+    Zwraca globalną kolejkę zdarzeń (EVENT_DEBOUNCE_SECONDS, EVENT_MAX_WAIT_SECONDS)
+    
+    Args:
+        dispatch: Zlecanie przetwarzania SPA - wymagane przy pierwszym wywołaniu
+    
+    Returns:
+        Optional[DebouncedSPAQueue]: Uruchomiona kolejka lub None, jeśli nie została utworzona
+    """
+    global _queue
+    if _queue is None and dispatch is not None:
+        with _lock:
+            if _queue is None:
+                _queue = DebouncedSPAQueue(
+                    dispatch,
+                    window=float(os.getenv("EVENT_DEBOUNCE_SECONDS", "5")),
+                    max_wait=float(os.getenv("EVENT_MAX_WAIT_SECONDS", "30")),
+                )
+                _queue.start()
+    return _queue
@@ -0,0 +1,188 @@
+"""
+Hedged reads - duplikat odczytu, gdy odpowiedź się spóźnia
+
+Pojedynczy request do Bitrix24 potrafi trwać sekundy zamiast ~150 ms.
+Dla odczytów decydujących o czasie przebiegu (SPA + pierwsza strona dealów,
+strony sortowane, sonda zakresu ID) AsyncBitrixService może wysłać duplikat,
+jeśli odpowiedź nie przyszła w czasie percentyla (BITRIX_HEDGE_PERCENTILE)
+ostatnich opóźnień tej metody - wygrywa szybsza odpowiedź.
+
+Limity duplikatów:
+- budżet: najwyżej BITRIX_HEDGE_BUDGET (np. 10%) odczytów
+- rate limiter: duplikat tylko, gdy w buforze są wolne tokeny
+
+Odczyty hedged idą do osobnej puli wątków (get_hedge_executor), nie do
+domyślnej puli pętli - asyncio.run() czeka na zakończenie wątków domyślnej
+puli, więc przegrany request wstrzymywałby odpowiedź webhooka.
+
+Domyślnie wyłączone (BITRIX_HEDGE_READS=1 włącza).
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+from src.config import BitrixConfig, get_bitrix_config
+from .rate_limiter import TokenBucketRateLimiter, get_rate_limiter
+
+
+class LatencyTracker:
+    """Okno ostatnich opóźnień odczytów (per metoda) z percentylami"""
+    
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Args:
+            window: Ile ostatnich pomiarów pamiętać (per metoda)
+            min_samples: Minimalna liczba pomiarów do wyznaczenia percentyla
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, operation: str, seconds: float):
+        """Zapisuje czas udanego odczytu"""
+        with self._lock:
+            self._samples.setdefault(operation, deque(maxlen=self.window)).append(seconds)
+    
+    def percentile(self, operation: str, percent: float) -> Optional[float]:
+        """
+        Percentyl opóźnień metody
+        
+        Returns:
+            Optional[float]: Sekundy lub None, jeśli za mało pomiarów
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(operation, ()))
+        
+        if len(samples) < self.min_samples:
+            return None
+        
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+
+class HedgePolicy:
+    """Decyduje kiedy i czy wysłać duplikat odczytu (bezpieczna wątkowo)"""
+    
+    def __init__(
+        self,
+        limiter: TokenBucketRateLimiter,
+        percentile: float = 95.0,
+        min_delay: float = 0.2,
+        budget: float = 0.1,
+        tracker: Optional[LatencyTracker] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            limiter: Rate limiter (duplikat tylko przy wolnych tokenach)
+            percentile: Percentyl opóźnień, po którym wysyłamy duplikat
+            min_delay: Minimalne opóźnienie duplikatu (s)
+            budget: Ułamek odczytów, które mogą dostać duplikat
+            tracker: Pomiary opóźnień (domyślnie nowy)
+            clock: Zegar - podmieniany w testach
+        """
+        self.limiter = limiter
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget = budget
+        self.tracker = tracker or LatencyTracker()
+        self.clock = clock
+        self._lock = threading.Lock()
+        
+        # Budżet jako token bucket: każdy odczyt dodaje `budget`, duplikat zużywa 1
+        self._budget_tokens = 1.0
+        self._budget_capacity = 10.0
+        
+        # Liczniki
+        self._reads = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._denied = 0
+    
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """
+        Rejestruje odczyt i zwraca po ilu sekundach wysłać duplikat
+        
+        Returns:
+            Optional[float]: Sekundy lub None (brak pomiarów - bez duplikatu)
+        """
+        with self._lock:
+            self._reads += 1
+            self._budget_tokens = min(self._budget_capacity, self._budget_tokens + self.budget)
+        
+        delay = self.tracker.percentile(operation, self.percentile)
+        return max(self.min_delay, delay) if delay is not None else None
+    
+    def try_hedge(self) -> bool:
+        """Czy wysłać duplikat teraz? (budżet + wolne tokeny rate limitera)"""
+        with self._lock:
+            if self._budget_tokens < 1 or self.limiter.available() < 1:
+                self._denied += 1
+                return False
+            
+            self._budget_tokens -= 1
+            self._hedged += 1
+            return True
+    
+    def record_win(self):
+        """Duplikat odpowiedział pierwszy"""
+        with self._lock:
+            self._hedge_wins += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Zwraca liczniki (do endpointu /health/bitrix)"""
+        with self._lock:
+            return {
+                "percentile": self.percentile,
+                "reads": self._reads,
+                "hedged": self._hedged,
+                "hedge_wins": self._hedge_wins,
+                "denied": self._denied,
+            }
+
+
+_policy = None
+_executor = None
+_lock = threading.Lock()
+
+
+def create_hedge_policy(config: BitrixConfig) -> Optional[HedgePolicy]:
+    """Tworzy politykę z konfiguracji (None jeśli BITRIX_HEDGE_READS wyłączone)"""
+    if not config.hedge_reads:
+        return None
+    
+    return HedgePolicy(
+        limiter=get_rate_limiter(),
+        percentile=config.hedge_percentile,
+        min_delay=config.hedge_min_delay,
+        budget=config.hedge_budget,
+    )
+
+
+def get_hedge_policy() -> Optional[HedgePolicy]:
+    """Zwraca globalną politykę hedged reads (None jeśli wyłączone)"""
+    global _policy
+    if _policy is None:
+        with _lock:
+            if _policy is None:
+                _policy = create_hedge_policy(get_bitrix_config()) or False
+    return _policy or None
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """
+    Zwraca pulę wątków odczytów hedged (wspólna dla procesu)
+    
+    Rozmiar: 2 x BITRIX_POOL_SIZE - request pierwotny i duplikat.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=2 * get_bitrix_config().pool_size,
+                    thread_name_prefix="bitrix-hedge",
+                )
+    return _executor
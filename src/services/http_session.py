@@ -0,0 +1,82 @@
+"""
+Wspólna sesja HTTP dla wszystkich wywołań Bitrix24
+
+Jedna sesja `requests.Session` na proces:
+- pula połączeń keep-alive (bez nowego TCP/TLS handshake na każdy request)
+- rozmiar puli i timeouty z BitrixConfig (BITRIX_POOL_SIZE, BITRIX_*_TIMEOUT)
+- wspólny rate limiter i circuit breaker (ResilientAdapter) dla każdego requestu
+- używana przez BitrixService i AsyncBitrixService (odczyty i zapisy)
+- opcjonalnie nagrywanie odpowiedzi lub odtwarzanie nagrań zamiast portalu
+  (BITRIX_RECORD_PATH / BITRIX_REPLAY_PATH - src/services/snapshots.py)
+
+Klient b24pysdk (get_bitrix_client) zostaje przy własnym requesterze -
+ścieżka przetwarzania SPA go nie używa.
+"""
+import threading
+from typing import Optional
+import requests
+from src.config import BitrixConfig, get_bitrix_config
+from .rate_limiter import TokenBucketRateLimiter, get_rate_limiter
+from .resilience import ResilientAdapter, CircuitBreaker, get_circuit_breaker
+from .snapshots import ReplayAdapter, SnapshotRecorder, load_snapshots, replay_latency
+
+
+_session = None
+_lock = threading.Lock()
+
+
+def create_http_session(
+    config: BitrixConfig,
+    limiter: Optional[TokenBucketRateLimiter] = None,
+    breaker: Optional[CircuitBreaker] = None
+) -> requests.Session:
+    """
+    Tworzy sesję HTTP z pulą połączeń, rate limiterem i circuit breakerem
+    
+    Args:
+        config: Konfiguracja Bitrix24 (rozmiar puli, ponowienia, deadline)
+        limiter: Rate limiter (domyślnie globalny)
+        breaker: Circuit breaker (domyślnie globalny)
+    
+    Returns:
+        requests.Session: Sesja z zamontowanym adapterem
+    """
+    session = requests.Session()
+    
+    if config.replay_path:
+        # Odtwarzanie nagrań - bez portalu, limitera i breakera
+        replay = ReplayAdapter(load_snapshots(config.replay_path), latency=replay_latency(config.replay_latency))
+        session.mount("https://", replay)
+        session.mount("http://", replay)
+        return session
+    
+    adapter = ResilientAdapter(
+        limiter=limiter or get_rate_limiter(),
+        breaker=breaker or get_circuit_breaker(),
+        retry_attempts=config.retry_attempts,
+        retry_base_delay=config.retry_base_delay,
+        retry_max_delay=config.retry_max_delay,
+        deadline=config.call_deadline,
+        max_throttle_retries=config.max_throttle_retries,
+        pool_connections=config.pool_size,
+        pool_maxsize=config.pool_size,
+        pool_block=True,  # Nie otwieraj połączeń ponad pulę - czekaj na wolne
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    
+    if config.record_path:
+        SnapshotRecorder(config.record_path).attach(session)
+    
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """Zwraca globalną sesję HTTP (tworzona przy pierwszym użyciu)"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = create_http_session(get_bitrix_config())
+    return _session
+
@@ -0,0 +1,192 @@
+"""
+Zadania w tle - asynchroniczny tryb webhooka
+
+Duże SPA przetwarzają się dłużej niż timeout n8n (30 s). W trybie
+asynchronicznym webhook od razu zwraca 202 z ID zadania, a przetwarzanie
+(DealPromoter + zapis do Bitrix24) wykonuje ograniczona pula wątków.
+Stan, czasy i wynik zadania zwraca GET /jobs/<id>.
+
+- JOB_WORKERS: liczba równoległych przetwarzań (domyślnie 4)
+- JOB_QUEUE_SIZE: maks. liczba zadań oczekujących + w toku (domyślnie 100)
+- JOB_RETENTION: ile zakończonych zadań pamiętać (domyślnie 500)
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, ClassVar, Dict, Hashable, Optional
+from pydantic import BaseModel
+
+
+logger = logging.getLogger("spa_webhook.jobs")
+
+
+class JobQueueFullError(Exception):
+    """Kolejka zadań pełna - zadanie nie zostało przyjęte"""
+
+
+class Job(BaseModel):
+    """Zadanie przetwarzania w tle"""
+    
+    QUEUED: ClassVar[str] = "queued"
+    RUNNING: ClassVar[str] = "running"
+    SUCCEEDED: ClassVar[str] = "succeeded"
+    FAILED: ClassVar[str] = "failed"
+    
+    id: str
+    key: Any = None
+    status: str = "queued"
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    
+    @property
+    def active(self) -> bool:
+        return self.status in (self.QUEUED, self.RUNNING)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Stan zadania dla GET /jobs/<id> (czasy w sekundach)"""
+        def seconds(start, end):
+            return round((end - start).total_seconds(), 3) if start and end else None
+        
+        now = datetime.now()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "timings": {
+                "queued_seconds": seconds(self.created_at, self.started_at or now),
+                "run_seconds": seconds(self.started_at, self.finished_at or now),
+            },
+            "result": self.result,
+            "error": self.error,
+            "error_type": self.error_type,
+        }
+
+
+class JobManager:
+    """Ograniczona pula wątków z rejestrem zadań (bezpieczna wątkowo)"""
+    
+    def __init__(self, workers: int = 4, queue_size: int = 100, retention: int = 500):
+        """
+        Args:
+            workers: Liczba równoległych przetwarzań
+            queue_size: Maks. liczba zadań aktywnych (oczekujące + w toku)
+            retention: Ile zakończonych zadań pamiętać
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="spa-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, key: Hashable, func: Callable[[], Dict[str, Any]]) -> Job:
+        """
+        Zleca przetwarzanie w tle
+        
+        Zadanie z tym samym kluczem, które jeszcze czeka lub trwa, jest
+        zwracane zamiast nowego (ponowienia n8n nie mnożą zadań).
+        
+        Args:
+            key: Klucz zadania (np. (spa_id, dry_run))
+            func: Przetwarzanie zwracające wynik JSON
+        
+        Returns:
+            Job: Nowe lub istniejące aktywne zadanie
+        
+        Raises:
+            JobQueueFullError: Osiągnięto JOB_QUEUE_SIZE aktywnych zadań
+        """
+        with self._lock:
+            existing = self._jobs.get(self._active.get(key, ""))
+            if existing is not None and existing.active:
+                return existing
+            
+            if len(self._active) >= self.queue_size:
+                raise JobQueueFullError(f"Kolejka zadań pełna ({self.queue_size})")
+            
+            job = Job(id=uuid.uuid4().hex, key=key, created_at=datetime.now())
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._evict()
+        
+        self._executor.submit(self._run, job, func)
+        logger.info(f"📥 Zadanie {job.id} ({key}) w kolejce")
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        """Zwraca zadanie po ID (None jeśli nieznane lub usunięte)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Liczniki zadań (do diagnostyki)"""
+        with self._lock:
+            counts = {status: 0 for status in (Job.QUEUED, Job.RUNNING, Job.SUCCEEDED, Job.FAILED)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        
+        return {"workers": self.workers, "queue_size": self.queue_size, **counts}
+    
+    def shutdown(self, wait: bool = True):
+        """Zatrzymuje pulę (czeka na zadania w toku)"""
+        self._executor.shutdown(wait=wait)
+    
+    def _run(self, job: Job, func: Callable[[], Dict[str, Any]]):
+        with self._lock:
+            job.status = Job.RUNNING
+            job.started_at = datetime.now()
+        
+        try:
+            result = func()
+        except Exception as error:
+            logger.error(f"❌ Zadanie {job.id} ({job.key}) nieudane: {error}")
+            self._finish(job, Job.FAILED, error=error)
+        else:
+            self._finish(job, Job.SUCCEEDED, result=result)
+    
+    def _finish(self, job: Job, status: str, result=None, error: Optional[Exception] = None):
+        with self._lock:
+            job.status = status
+            job.finished_at = datetime.now()
+            job.result = result
+            if error is not None:
+                job.error = str(error)
+                job.error_type = type(error).__name__
+            if self._active.get(job.key) == job.id:
+                del self._active[job.key]
+            self._evict()
+    
+    def _evict(self):
+        """Usuwa najstarsze zakończone zadania ponad limit `retention` (pod blokadą)"""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self._jobs[job_id]
+
+
+_manager = None
+_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Zwraca globalny JobManager (JOB_WORKERS, JOB_QUEUE_SIZE, JOB_RETENTION)"""
+    global _manager
+    if _manager is None:
+        with _lock:
+            if _manager is None:
+                _manager = JobManager(
+                    workers=int(os.getenv("JOB_WORKERS", "4")),
+                    queue_size=int(os.getenv("JOB_QUEUE_SIZE", "100")),
+                    retention=int(os.getenv("JOB_RETENTION", "500")),
+                )
+    return _manager
@@ -0,0 +1,276 @@
+"""
+Dziennik awansów (SQLite, WAL, tylko dopisywanie) - wznawianie przerwanych zapisów
+
+Zapis etapów to kilkadziesiąt crm.deal.update w paczkach batch. Jeśli proces
+padnie w trakcie, bez dziennika nie wiadomo, co zostało zapisane. Dziennik:
+1. przed zapisem - plan przebiegu: wiersz "planned" per deal (etap docelowy)
+2. po każdej paczce - wynik per deal: "applied" / "failed"
+3. przy starcie - wznowienie zapisów bez wyniku (resume_pending):
+   - deal już w etapie docelowym → "applied" (zapis doszedł przed awarią)
+   - deal nadal w Sortowaniu / Rezerwie → ponowny zapis
+   - deal przeniesiony w międzyczasie lub plan starszy niż max_age → "skipped"
+
+Wiersze nie są modyfikowane ani usuwane - dziennik jest też historią decyzji
+(GET /journal). Zmiana etapu jest idempotentna, więc ponowienie paczki,
+której wynik nie zdążył trafić do dziennika, jest bezpieczne.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from src.models import DealStage
+from .async_bitrix import AsyncBitrixService
+
+
+logger = logging.getLogger("spa_webhook.journal")
+
+PLANNED = "planned"
+APPLIED = "applied"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Etapy, z których wznowienie może przenieść deal (wejście DealPromoter)
+RESUMABLE_STAGES = (DealStage.SORTING.value, DealStage.RESERVE.value)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    spa_id INTEGER,
+    deal_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    event TEXT NOT NULL,
+    error TEXT,
+    at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_journal_run_deal ON journal (run_id, deal_id);
+CREATE INDEX IF NOT EXISTS idx_journal_spa ON journal (spa_id, seq);
+"""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class PromotionJournal:
+    """Dziennik planów i wyników zapisu etapów (bezpieczny wątkowo)"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Ścieżka pliku bazy (":memory:" w testach)
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+    
+    def plan(self, updates_by_spa: Dict[Optional[int], List[Dict[str, str]]]) -> str:
+        """
+        Zapisuje plan przebiegu (przed pierwszym zapisem w Bitrix24)
+        
+        Args:
+            updates_by_spa: ID SPA → zmiany etapów ({"id", "stage"})
+        
+        Returns:
+            str: ID przebiegu (do record())
+        """
+        run_id = uuid.uuid4().hex
+        self._append([
+            (run_id, spa_id, update["id"], update["stage"], PLANNED, None)
+            for spa_id, updates in updates_by_spa.items()
+            for update in updates
+        ])
+        return run_id
+    
+    def record(
+        self,
+        run_id: str,
+        stage_by_deal: Dict[str, str],
+        outcomes: Dict[str, Dict[str, Any]],
+        event: Optional[str] = None
+    ):
+        """
+        Zapisuje wyniki zapisu (po paczce batch)
+        
+        Args:
+            run_id: ID przebiegu
+            stage_by_deal: deal_id → etap docelowy (z planu)
+            outcomes: deal_id → {"success": bool, "error": Optional[str]}
+            event: Wymuszone zdarzenie (np. SKIPPED) zamiast wyniku z outcomes
+        """
+        rows = []
+        for deal_id, outcome in outcomes.items():
+            success = outcome.get("success")
+            error = None if success else outcome.get("error") or "update zwrócił False"
+            rows.append((
+                run_id,
+                None,
+                deal_id,
+                stage_by_deal.get(deal_id, ""),
+                event or (APPLIED if success else FAILED),
+                error,
+            ))
+        self._append(rows)
+    
+    def pending(self) -> List[Dict[str, Any]]:
+        """
+        Zaplanowane zapisy bez wyniku (przerwane przebiegi)
+        
+        Returns:
+            List[Dict]: {"run_id", "spa_id", "deal_id", "stage", "planned_at"}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT p.run_id, p.spa_id, p.deal_id, p.stage, p.at FROM journal p
+                WHERE p.event = ? AND NOT EXISTS (
+                    SELECT 1 FROM journal o
+                    WHERE o.run_id = p.run_id AND o.deal_id = p.deal_id AND o.event != ?
+                )
+                ORDER BY p.seq
+                """,
+                (PLANNED, PLANNED),
+            ).fetchall()
+        
+        return [
+            {"run_id": run_id, "spa_id": spa_id, "deal_id": deal_id, "stage": stage, "planned_at": at}
+            for run_id, spa_id, deal_id, stage, at in rows
+        ]
+    
+    def history(self, spa_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Ostatnie wpisy dziennika (najnowsze pierwsze)
+        
+        Args:
+            spa_id: Tylko przebiegi tego SPA (wyniki przez run_id planu)
+            limit: Maks. liczba wpisów
+        """
+        query = "SELECT run_id, spa_id, deal_id, stage, event, error, at FROM journal"
+        params: tuple = ()
+        if spa_id is not None:
+            query += " WHERE run_id IN (SELECT run_id FROM journal WHERE spa_id = ? AND event = ?)"
+            params = (spa_id, PLANNED)
+        query += " ORDER BY seq DESC LIMIT ?"
+        
+        with self._lock:
+            rows = self._conn.execute(query, (*params, limit)).fetchall()
+        
+        keys = ("run_id", "spa_id", "deal_id", "stage", "event", "error", "at")
+        return [dict(zip(keys, row)) for row in rows]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Liczba wpisów per zdarzenie i zapisów oczekujących"""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT event, COUNT(*) FROM journal GROUP BY event").fetchall())
+        return {"path": self.path, "events": counts, "pending": len(self.pending())}
+    
+    def _append(self, rows: List[tuple]):
+        """Dopisuje wiersze w jednej transakcji (trwałe przed powrotem)"""
+        if not rows:
+            return
+        
+        at = _utcnow().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO journal (run_id, spa_id, deal_id, stage, event, error, at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*row, at) for row in rows],
+            )
+
+
+async def resume_pending(
+    journal: PromotionJournal,
+    bitrix: Optional[AsyncBitrixService] = None,
+    max_age: float = 3600.0
+) -> Dict[str, int]:
+    """
+    Wznawia zapisy przerwanych przebiegów
+    
+    Koszt: jedno crm.deal.list (obecne etapy) + paczki batch dla pozostałych.
+    
+    Args:
+        journal: Dziennik
+        bitrix: Asynchroniczny klient (domyślnie nowy)
+        max_age: Starsze plany (s) są pomijane - decyzja mogła się zdezaktualizować
+    
+    Returns:
+        Dict[str, int]: Liczba zapisów applied / failed / skipped
+    """
+    pending = journal.pending()
+    counts = {APPLIED: 0, FAILED: 0, SKIPPED: 0}
+    if not pending:
+        return counts
+    
+    bitrix = bitrix or AsyncBitrixService()
+    cutoff = (_utcnow() - timedelta(seconds=max_age)).isoformat()
+    logger.info(f"🔁 Dziennik: {len(pending)} zapisów bez wyniku - wznawianie")
+    
+    current = {
+        str(deal["ID"]): deal.get("STAGE_ID")
+        for deal in await bitrix.list_deals({"ID": sorted({p["deal_id"] for p in pending})}, ["ID", "STAGE_ID"])
+    }
+    
+    for run_id in dict.fromkeys(p["run_id"] for p in pending):
+        entries = [p for p in pending if p["run_id"] == run_id]
+        stage_by_deal = {p["deal_id"]: p["stage"] for p in entries}
+        
+        done, stale, retry = {}, {}, []
+        for entry in entries:
+            stage = current.get(entry["deal_id"])
+            if stage == entry["stage"]:
+                done[entry["deal_id"]] = {"success": True, "error": None}
+            elif entry["planned_at"] < cutoff:
+                stale[entry["deal_id"]] = {"success": False, "error": "plan starszy niż max_age"}
+            elif stage not in RESUMABLE_STAGES:
+                stale[entry["deal_id"]] = {"success": False, "error": f"deal w etapie {stage}"}
+            else:
+                retry.append({"id": entry["deal_id"], "stage": entry["stage"]})
+        
+        journal.record(run_id, stage_by_deal, done, event=APPLIED)
+        journal.record(run_id, stage_by_deal, stale, event=SKIPPED)
+        counts[APPLIED] += len(done)
+        counts[SKIPPED] += len(stale)
+        
+        if retry:
+            outcomes = await bitrix.batch_update_stages(
+                retry,
+                on_chunk=lambda chunk: journal.record(run_id, stage_by_deal, chunk),
+            )
+            succeeded = sum(1 for outcome in outcomes.values() if outcome.get("success"))
+            counts[APPLIED] += succeeded
+            counts[FAILED] += len(outcomes) - succeeded
+    
+    logger.info(
+        f"✅ Dziennik: wznowiono - zapisane {counts[APPLIED]}, "
+        f"błędy {counts[FAILED]}, pominięte {counts[SKIPPED]}"
+    )
+    return counts
+
+
+_journal = None
+_lock = threading.Lock()
+
+
+def get_journal() -> Optional[PromotionJournal]:
+    """
+    Zwraca globalny dziennik awansów (PROMOTION_JOURNAL_PATH, puste = wyłączony)
+    
+    Returns:
+        Optional[PromotionJournal]: Dziennik lub None
+    """
+    global _journal
+    path = os.getenv("PROMOTION_JOURNAL_PATH", "")
+    if not path:
+        return None
+    
+    if _journal is None:
+        with _lock:
+            if _journal is None:
+                _journal = PromotionJournal(path)
+    return _journal
@@ -0,0 +1,451 @@
+"""
+Lokalna kopia SPA i dealów (SQLite, WAL) - odczyty decyzji bez API
+
+Przetwarzanie SPA czyta za każdym razem wszystkie deale z Sortowania
+i Rezerwy. Z lokalną kopią (LOCAL_STORE_PATH) odczyt to zapytanie SQLite
+po indeksie (spa_id, stage_id), a Bitrix24 obsługuje tylko strumień zmian
+i zapisy:
+- pełna synchronizacja: SPA "W trakcie" + deale SORTING/RESERVE wszystkich SPA
+  (przy pustej bazie i co full_interval - usuwa też deale skasowane w CRM);
+  zawsze w tle - do jej końca pusta kopia oznacza odczyt z API
+- przyrostowa: deale z DATE_MODIFY > znacznik i SPA z updatedTime > znacznik
+  (znaczniki to najnowsze daty z portalu; po pełnej synchronizacji najwyżej
+  moment jej startu - zmiany w trakcie pobierania nie giną)
+- przed przebiegiem SPA (zdarzenia, harmonogram, webhook) kopia jest
+  odświeżana przyrostowo, jeśli jest starsza niż max_age albo od ostatniej
+  synchronizacji przyszło zdarzenie Bitrix24 (mark_stale)
+- po zapisie etapów zmienione deale są od razu poprawiane lokalnie
+
+WAL pozwala czytać bazę równolegle z synchronizacją (także z innych procesów).
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from src.models import DealStage, SPAStage
+from .async_bitrix import AsyncBitrixService
+from .projection import DEAL_SPA_FIELD, sweep_deal_select
+
+
+logger = logging.getLogger("spa_webhook.local_store")
+
+# Etapy dealów trzymane w kopii (wejście DealPromoter)
+MIRRORED_STAGES = (DealStage.SORTING.value, DealStage.RESERVE.value)
+
+# Zapas przy zapytaniu o zmiany (zapisy z tą samą sekundą, opóźnienie indeksu)
+SYNC_OVERLAP = timedelta(seconds=60)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spas (
+    id INTEGER PRIMARY KEY,
+    stage_id TEXT,
+    updated_time TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deals (
+    id INTEGER PRIMARY KEY,
+    spa_id INTEGER,
+    stage_id TEXT,
+    date_modify TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deals_spa_stage ON deals (spa_id, stage_id);
+CREATE INDEX IF NOT EXISTS idx_deals_date_modify ON deals (date_modify);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _spa_id_of(deal: Dict[str, Any]) -> Optional[int]:
+    """ID SPA z pola UF_CRM_1740931330 (None, jeśli puste)"""
+    value = str(deal.get(DEAL_SPA_FIELD) or "")
+    return int(value) if value.isdigit() else None
+
+
+def _latest(values: Iterable[Optional[str]]) -> Optional[str]:
+    """Najnowsza data ISO (porównanie po sparsowaniu - różne strefy)"""
+    dates = [datetime.fromisoformat(value) for value in values if value]
+    return max(dates).isoformat() if dates else None
+
+
+def _earliest(values: Iterable[Optional[str]]) -> Optional[str]:
+    """Najwcześniejsza data ISO (porównanie po sparsowaniu - różne strefy)"""
+    dates = [datetime.fromisoformat(value) for value in values if value]
+    return min(dates).isoformat() if dates else None
+
+
+class LocalStore:
+    """Baza SQLite z kopią SPA i dealów (bezpieczna wątkowo)"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Ścieżka pliku bazy (":memory:" w testach)
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+    
+    def get_spa(self, spa_id: int) -> Optional[Dict[str, Any]]:
+        """Surowe dane SPA (jak crm.item.get["item"]) lub None"""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM spas WHERE id = ?", (spa_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def deals_for_spa(self, spa_id: int, stages: Iterable[str] = MIRRORED_STAGES) -> List[Dict[str, Any]]:
+        """
+        Surowe deale SPA z podanych etapów (indeks spa_id, stage_id)
+        
+        Returns:
+            List[Dict]: Deale rosnąco po ID (jak crm.deal.list)
+        """
+        stages = list(stages)
+        placeholders = ", ".join("?" for _ in stages)
+        
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM deals WHERE spa_id = ? AND stage_id IN ({placeholders}) ORDER BY id",
+                (spa_id, *stages),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def replace_all(self, spas: List[Dict[str, Any]], deals: List[Dict[str, Any]]):
+        """Podmienia całą zawartość (pełna synchronizacja) w jednej transakcji"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM spas")
+            self._conn.execute("DELETE FROM deals")
+            self._upsert_spas(spas)
+            self._upsert_deals(deals)
+    
+    def upsert_spas(self, spas: List[Dict[str, Any]]):
+        with self._lock, self._conn:
+            self._upsert_spas(spas)
+    
+    def upsert_deals(self, deals: List[Dict[str, Any]]):
+        with self._lock, self._conn:
+            self._upsert_deals(deals)
+    
+    def delete_spas(self, spa_ids: List[int]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM spas WHERE id = ?", [(int(i),) for i in spa_ids])
+    
+    def delete_deals(self, deal_ids: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM deals WHERE id = ?", [(int(i),) for i in deal_ids])
+    
+    def set_stages(self, stage_by_deal: Dict[str, str]):
+        """Poprawia etapy dealów po własnym zapisie (przed kolejną synchronizacją)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE deals SET stage_id = ?, data = json_set(data, '$.STAGE_ID', ?) WHERE id = ?",
+                [(stage, stage, int(deal_id)) for deal_id, stage in stage_by_deal.items()],
+            )
+    
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set_meta(self, key: str, value: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    
+    def counts(self) -> Dict[str, int]:
+        """Liczba SPA i dealów w kopii"""
+        with self._lock:
+            spas = self._conn.execute("SELECT COUNT(*) FROM spas").fetchone()[0]
+            deals = self._conn.execute("SELECT COUNT(*) FROM deals").fetchone()[0]
+        return {"spas": spas, "deals": deals}
+    
+    def _upsert_spas(self, spas: List[Dict[str, Any]]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO spas (id, stage_id, updated_time, data) VALUES (?, ?, ?, ?)",
+            [
+                (int(spa["id"]), spa.get("stageId"), spa.get("updatedTime"), json.dumps(spa, ensure_ascii=False))
+                for spa in spas
+            ],
+        )
+    
+    def _upsert_deals(self, deals: List[Dict[str, Any]]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO deals (id, spa_id, stage_id, date_modify, data) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    int(deal["ID"]),
+                    _spa_id_of(deal),
+                    deal.get("STAGE_ID"),
+                    deal.get("DATE_MODIFY"),
+                    json.dumps(deal, ensure_ascii=False),
+                )
+                for deal in deals
+            ],
+        )
+
+
+class StoreSync:
+    """Synchronizacja LocalStore z Bitrix24 (pełna w tle, przyrostowa przed przebiegiem)"""
+    
+    def __init__(
+        self,
+        store: LocalStore,
+        bitrix: Optional[AsyncBitrixService] = None,
+        max_age: float = 5.0,
+        full_interval: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+        spawn: Optional[Callable[[Callable[[], None]], Any]] = None,
+    ):
+        """
+        Args:
+            store: Lokalna baza
+            bitrix: Asynchroniczny klient (domyślnie nowy)
+            max_age: Wiek kopii, po którym ensure_fresh() synchronizuje (s)
+            full_interval: Odstęp pełnych synchronizacji (s)
+            clock: Zegar - podmieniany w testach
+            wall_clock: Data bieżąca - znacznik po pełnej synchronizacji
+            spawn: Uruchomienie pełnej synchronizacji w tle
+                (domyślnie wątek daemon; w testach wywołanie od razu)
+        """
+        self.store = store
+        self.bitrix = bitrix or AsyncBitrixService()
+        self.max_age = max_age
+        self.full_interval = full_interval
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._spawn = spawn or self._start_thread
+        self._lock = threading.Lock()
+        self._full_lock = threading.Lock()
+        
+        self._last_sync: Optional[float] = None
+        self._last_full: Optional[float] = None
+        self._full_running = False
+        # Zdarzenie Bitrix24 od ostatniej synchronizacji (kopia nieaktualna)
+        self._stale = False
+        
+        # Liczniki
+        self._syncs = 0
+        self._full_syncs = 0
+        self._full_failures = 0
+        self._changes = 0
+    
+    def ensure_fresh(self) -> bool:
+        """
+        Przygotowuje kopię do odczytu przed przebiegiem SPA
+        
+        Pełna synchronizacja (pusta kopia, upływ full_interval) jest tylko
+        zlecana w tle - request czeka najwyżej na przyrostową (jedna naraz),
+        jeśli kopia jest starsza niż max_age lub oznaczona mark_stale().
+        
+        Returns:
+            bool: False - kopia jeszcze niezbudowana (odczyt z API)
+        """
+        if self._full_due():
+            self.start_full_sync()
+        
+        if self.store.get_meta("deals_watermark") is None:
+            return False
+        
+        with self._lock:
+            fresh = self._last_sync is not None and self._clock() - self._last_sync < self.max_age
+            if not fresh or self._stale:
+                self._incremental_sync()
+        return True
+    
+    def mark_stale(self):
+        """
+        Zdarzenie Bitrix24 (deal / SPA zmieniony w portalu) - następne
+        ensure_fresh() synchronizuje przyrostowo bez względu na max_age
+        
+        Bez blokady - endpoint zdarzeń nie czeka na trwającą synchronizację.
+        """
+        self._stale = True
+    
+    def start_full_sync(self) -> bool:
+        """
+        Zleca pełną synchronizację w tle (najwyżej jedna naraz)
+        
+        Returns:
+            bool: False - pełna synchronizacja już trwa
+        """
+        with self._full_lock:
+            if self._full_running:
+                return False
+            self._full_running = True
+            self._last_full = self._clock()
+        
+        self._spawn(self._background_full_sync)
+        return True
+    
+    def sync(self, full: bool = False) -> Dict[str, int]:
+        """
+        Synchronizuje kopię teraz (w wątku wywołującego)
+        
+        Args:
+            full: Pełna synchronizacja zamiast przyrostowej
+        
+        Returns:
+            Dict[str, int]: Liczba pobranych SPA i dealów
+        """
+        if full or self.store.get_meta("deals_watermark") is None:
+            return self._full_sync()
+        with self._lock:
+            return self._incremental_sync()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Stan kopii (do diagnostyki)"""
+        now = self._clock()
+        return {
+            "path": self.store.path,
+            **self.store.counts(),
+            "syncs": self._syncs,
+            "full_syncs": self._full_syncs,
+            "full_sync_running": self._full_running,
+            "full_sync_failures": self._full_failures,
+            "changes": self._changes,
+            "age_seconds": round(now - self._last_sync, 1) if self._last_sync is not None else None,
+            "deals_watermark": self.store.get_meta("deals_watermark"),
+        }
+    
+    def _full_due(self) -> bool:
+        """Czy zlecić pełną synchronizację (pusta kopia lub upływ full_interval)"""
+        if self.store.get_meta("deals_watermark") is None:
+            return True
+        
+        with self._full_lock:
+            if self._last_full is None:
+                # Kopia z poprzedniego uruchomienia jest punktem wyjścia
+                self._last_full = self._clock()
+            return self._clock() - self._last_full >= self.full_interval
+    
+    @staticmethod
+    def _start_thread(target: Callable[[], None]):
+        threading.Thread(target=target, name="local-store-full-sync", daemon=True).start()
+    
+    def _background_full_sync(self):
+        """Pełna synchronizacja w tle - błąd tylko w logu (kopia zostaje poprzednia)"""
+        try:
+            self._full_sync()
+        except Exception as error:
+            self._full_failures += 1
+            logger.error(f"❌ Kopia lokalna: pełna synchronizacja nieudana - {error}")
+        finally:
+            with self._full_lock:
+                self._full_running = False
+    
+    def _full_sync(self) -> Dict[str, int]:
+        """
+        SPA "W trakcie" + deale SORTING/RESERVE wszystkich SPA (podmiana całej kopii)
+        
+        Pobieranie bez blokady - przyrostowe odświeżenia idą w tym czasie
+        normalnie. Podmiana cofa kopię do stanu z chwili pobrania, więc
+        znacznik dealów wraca najwyżej do startu: następna przyrostowa
+        pobierze ponownie wszystko zmienione w trakcie.
+        """
+        started = self._wall_clock().isoformat()
+        spas = asyncio.run(self.bitrix.list_spas({"stageId": SPAStage.IN_PROGRESS.value}))
+        deals = asyncio.run(self.bitrix.list_deals_parallel(
+            {"STAGE_ID": list(MIRRORED_STAGES)},
+            sweep_deal_select(),
+        ))
+        
+        with self._lock:
+            self.store.replace_all(spas, deals)
+            for key, values in (
+                ("spas_watermark", [spa.get("updatedTime") for spa in spas]),
+                ("deals_watermark", [deal.get("DATE_MODIFY") for deal in deals]),
+            ):
+                latest = _latest(values)
+                self.store.set_meta(key, _earliest([latest, started]) if latest else started)
+            
+            self._last_sync = self._clock()
+            self._syncs += 1
+            self._full_syncs += 1
+        
+        logger.info(f"🗄️  Kopia lokalna: pełna synchronizacja - {len(spas)} SPA, {len(deals)} dealów")
+        return {"spas": len(spas), "deals": len(deals)}
+    
+    def _incremental_sync(self) -> Dict[str, int]:
+        """SPA i deale zmienione od znaczników (bez filtra etapu - wyjścia z etapów też; pod blokadą)"""
+        # Zdarzenia w trakcie synchronizacji oznaczą kopię ponownie
+        self._stale = False
+        spas = self._changed("spas_watermark", lambda since: self.bitrix.list_spas({">updatedTime": since}))
+        deals = self._changed("deals_watermark", lambda since: self.bitrix.list_deals(
+            {">DATE_MODIFY": since},
+            sweep_deal_select(),
+        ))
+        
+        # SPA poza "W trakcie" i deale poza Sortowaniem / Rezerwą wypadają z kopii
+        open_spa = lambda spa: spa.get("stageId") == SPAStage.IN_PROGRESS.value
+        self.store.upsert_spas([spa for spa in spas if open_spa(spa)])
+        self.store.delete_spas([spa["id"] for spa in spas if not open_spa(spa)])
+        
+        mirrored = lambda deal: deal.get("STAGE_ID") in MIRRORED_STAGES
+        self.store.upsert_deals([deal for deal in deals if mirrored(deal)])
+        self.store.delete_deals([deal["ID"] for deal in deals if not mirrored(deal)])
+        
+        self._set_watermarks(spas, deals)
+        self._changes += len(spas) + len(deals)
+        self._last_sync = self._clock()
+        self._syncs += 1
+        if spas or deals:
+            logger.info(f"🗄️  Kopia lokalna: {len(spas)} SPA, {len(deals)} dealów zmienionych")
+        return {"spas": len(spas), "deals": len(deals)}
+    
+    def _changed(self, key: str, fetch) -> List[Dict[str, Any]]:
+        """Rekordy zmienione od znacznika (z zapasem SYNC_OVERLAP); brak znacznika = brak zmian"""
+        watermark = self.store.get_meta(key)
+        if watermark is None:
+            return []
+        since = datetime.fromisoformat(watermark) - SYNC_OVERLAP
+        return asyncio.run(fetch(since.isoformat()))
+    
+    def _set_watermarks(self, spas: List[Dict[str, Any]], deals: List[Dict[str, Any]]):
+        """Przesuwa znaczniki do najnowszych dat z portalu (nigdy wstecz)"""
+        for key, values in (
+            ("spas_watermark", [spa.get("updatedTime") for spa in spas]),
+            ("deals_watermark", [deal.get("DATE_MODIFY") for deal in deals]),
+        ):
+            latest = _latest([*values, self.store.get_meta(key)])
+            if latest is not None:
+                self.store.set_meta(key, latest)
+
+
+_sync = None
+_lock = threading.Lock()
+
+
+def get_store_sync() -> Optional[StoreSync]:
+    """
+    Zwraca globalną synchronizację kopii lokalnej (LOCAL_STORE_PATH)
+    
+    Konfiguracja: LOCAL_STORE_MAX_AGE, LOCAL_STORE_FULL_SYNC_INTERVAL.
+    
+    Returns:
+        Optional[StoreSync]: Synchronizacja lub None, jeśli kopia wyłączona
+    """
+    global _sync
+    path = os.getenv("LOCAL_STORE_PATH", "")
+    if not path:
+        return None
+    
+    if _sync is None:
+        with _lock:
+            if _sync is None:
+                _sync = StoreSync(
+                    LocalStore(path),
+                    max_age=float(os.getenv("LOCAL_STORE_MAX_AGE", "5")),
+                    full_interval=float(os.getenv("LOCAL_STORE_FULL_SYNC_INTERVAL", "3600")),
+                )
+    return _sync
@@ -0,0 +1,75 @@
+"""
+Projekcje pól (select) dla odczytów z Bitrix24
+
+Listy `select` są budowane z aliasów modelu Deal (nie wpisywane ręcznie),
+więc nie rozjeżdżają się z modelem. Pobieramy tylko pola, które czytają
+aktywne reguły:
+- DealPrioritizer: priorytet, data EXECUTING
+- QualificationValidator: data przyjazdu, wiek
+- check_gender_slots / SlotAllocator: płeć, mieszkanie (tylko SPA płciowe)
+
+Mniej pól = mniejszy JSON i szybsze parsowanie największych list dealów.
+"""
+from typing import List, Optional, Type
+from pydantic import BaseModel
+from src.models import Deal
+
+
+# Pola zawsze potrzebne (wymagane przez model + odpowiedź webhooka,
+# DATE_MODIFY - odcisk danych wejściowych w run_cache.py)
+DEAL_BASE_FIELDS = ("id", "title", "stage_id", "date_modify")
+
+# Pola czytane przez reguły wspólne dla wszystkich SPA
+DEAL_RULE_FIELDS = (
+    "priority",         # DealPrioritizer
+    "executing_date",   # DealPrioritizer
+    "arrival_date",     # QualificationValidator.check_arrival_date
+    "age",              # QualificationValidator.check_age
+)
+
+# Pola czytane tylko dla SPA płciowych (kategorie miejsc)
+DEAL_GENDER_FIELDS = ("gender", "housing")
+
+# Pole deala wskazujące SPA (UF_CRM_1740931330) - klucz grupowania
+DEAL_SPA_FIELD = Deal.model_fields["spa_id_alt"].alias
+
+
+def field_aliases(model: Type[BaseModel], fields: tuple) -> List[str]:
+    """
+    Zamienia nazwy pól modelu na nazwy pól API (aliasy)
+    
+    Args:
+        model: Model pydantic (Deal, SPA)
+        fields: Nazwy pól modelu
+    
+    Returns:
+        List[str]: Nazwy pól Bitrix24 (do `select`)
+    
+    Raises:
+        KeyError: Jeśli model nie ma takiego pola
+    """
+    return [model.model_fields[name].alias or name for name in fields]
+
+
+def deal_select(genderless: Optional[bool] = None) -> List[str]:
+    """
+    Minimalny `select` dla dealów przetwarzanych przez DealPromoter
+    
+    Args:
+        genderless: True = SPA bezpłciowe (bez płci i mieszkania),
+            False = płciowe, None = typ nieznany (pełna projekcja)
+    
+    Returns:
+        List[str]: Lista pól do `select`
+    """
+    fields = DEAL_BASE_FIELDS + DEAL_RULE_FIELDS
+    
+    if not genderless:
+        fields += DEAL_GENDER_FIELDS
+    
+    return field_aliases(Deal, fields)
+
+
+def sweep_deal_select() -> List[str]:
+    """Pełna projekcja dealów + pole SPA (przegląd portfela, kopia lokalna - typ SPA nieznany)"""
+    return deal_select() + [DEAL_SPA_FIELD]
@@ -0,0 +1,384 @@
+"""
+Rate limiter dla wszystkich wywołań Bitrix24
+
+Bitrix24 limituje requesty algorytmem "leaky bucket": standardowo
+2 requesty/s z buforem 50 (Enterprise: 5/s, 250). Po przekroczeniu
+zwraca HTTP 503 z błędem QUERY_LIMIT_EXCEEDED.
+
+TokenBucketRateLimiter:
+- token bucket o rozmiarze i tempie limitu portalu (BITRIX_RATE_LIMIT, BITRIX_RATE_BURST)
+- adaptacyjny backoff: przy QUERY_LIMIT_EXCEEDED/503 pauza rośnie wykładniczo,
+  a tempo spada o połowę; kolejne sukcesy przywracają tempo stopniowo
+- liczniki: ile razy i jak długo wywołujący czekali
+
+RateLimitedAdapter podpina limiter pod wspólną sesję HTTP - dotyczy więc
+każdego wywołania BitrixService (także przez AsyncBitrixService).
+
+count_requests() liczy requesty jednego przebiegu (np. harmonogramu) -
+liczniki limitera obejmują cały proces, łącznie z ruchem webhooków.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Callable, Iterator
+import requests
+from requests.adapters import HTTPAdapter
+from src.config import BitrixConfig, get_bitrix_config
+
+
+class RateLimitTimeout(requests.Timeout):
+    """Token nie będzie dostępny przed deadline wywołania - request nie został wysłany"""
+
+
+class TokenBucketRateLimiter:
+    """Token bucket z adaptacyjnym backoffem (bezpieczny wątkowo)"""
+    
+    def __init__(
+        self,
+        rate: float,
+        capacity: int,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        min_rate_factor: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            rate: Tokeny na sekundę (limit portalu)
+            capacity: Rozmiar bufora (burst)
+            base_backoff: Pierwsza pauza po QUERY_LIMIT_EXCEEDED (s)
+            max_backoff: Maksymalna pauza (s)
+            min_rate_factor: Najniższe tempo jako ułamek `rate`
+            clock: Zegar (monotoniczny) - podmieniany w testach
+            sleep: Funkcja czekania - podmieniana w testach
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.min_rate = rate * min_rate_factor
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        
+        self._tokens = float(capacity)
+        self._current_rate = float(rate)
+        self._last_refill = clock()
+        self._blocked_until = 0.0
+        self._consecutive_throttles = 0
+        
+        # Liczniki
+        self._acquired = 0
+        self._waited = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._throttled = 0
+    
+    def _refill(self, now: float):
+        """Dolewa tokeny proporcjonalnie do czasu od ostatniego dolania"""
+        elapsed = max(0.0, now - self._last_refill)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self._current_rate)
+        self._last_refill = now
+    
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Pobiera token - blokuje do czasu aż będzie dostępny
+        
+        Args:
+            timeout: Maks. czas czekania (s), None = bez limitu
+        
+        Returns:
+            float: Czas czekania w sekundach
+        
+        Raises:
+            RateLimitTimeout: Token nie zwolni się w `timeout` (bez czekania na próżno)
+        """
+        waited = 0.0
+        
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                
+                delay = max(0.0, self._blocked_until - now)
+                
+                if delay == 0.0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._record_acquire(waited)
+                    return waited
+                
+                if delay == 0.0:
+                    delay = (1 - self._tokens) / self._current_rate
+            
+            if timeout is not None and waited + delay > timeout:
+                raise RateLimitTimeout(
+                    f"Limit zapytań Bitrix24: token za {delay:.2f} s, do deadline {max(0.0, timeout - waited):.2f} s"
+                )
+            
+            self._sleep(delay)
+            waited += delay
+    
+    def try_acquire(self) -> bool:
+        """
+        Pobiera token bez czekania
+        
+        Returns:
+            bool: True jeśli token był dostępny od ręki
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            
+            if now < self._blocked_until or self._tokens < 1:
+                return False
+            
+            self._tokens -= 1
+            self._record_acquire(0.0)
+            return True
+    
+    def available(self) -> float:
+        """Tokeny dostępne od ręki, bez pobierania (0 podczas backoffu)"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            
+            if now < self._blocked_until:
+                return 0.0
+            
+            return self._tokens
+    
+    def penalize(self, retry_after: Optional[float] = None) -> float:
+        """
+        Reaguje na QUERY_LIMIT_EXCEEDED / 503
+        
+        - opróżnia bufor
+        - wstrzymuje wszystkich wywołujących na czas backoffu
+          (wykładniczo rosnący, lub Retry-After jeśli podany)
+        - obniża tempo o połowę (nie poniżej min_rate)
+        
+        Returns:
+            float: Długość pauzy w sekundach
+        """
+        with self._lock:
+            now = self._clock()
+            self._throttled += 1
+            self._consecutive_throttles += 1
+            
+            backoff = min(
+                self.max_backoff,
+                self.base_backoff * 2 ** (self._consecutive_throttles - 1),
+            )
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+            
+            self._tokens = 0.0
+            self._last_refill = now
+            self._blocked_until = max(self._blocked_until, now + backoff)
+            self._current_rate = max(self.min_rate, self._current_rate / 2)
+            
+            return backoff
+    
+    def record_success(self):
+        """Udane wywołanie - stopniowo przywraca tempo (addytywnie)"""
+        with self._lock:
+            self._consecutive_throttles = 0
+            
+            if self._current_rate < self.rate:
+                self._current_rate = min(self.rate, self._current_rate + self.rate * 0.1)
+    
+    def _record_acquire(self, waited: float):
+        """Aktualizuje liczniki (wywoływane pod lockiem)"""
+        self._acquired += 1
+        
+        if waited > 0:
+            self._waited += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Zwraca liczniki limitera (do endpointu /health/bitrix)"""
+        with self._lock:
+            now = self._clock()
+            return {
+                "rate": self.rate,
+                "current_rate": round(self._current_rate, 3),
+                "capacity": self.capacity,
+                "tokens": round(min(self.capacity, self._tokens + max(0.0, now - self._last_refill) * self._current_rate), 3),
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "total_wait_seconds": round(self._total_wait, 3),
+                "max_wait_seconds": round(self._max_wait, 3),
+                "avg_wait_seconds": round(self._total_wait / self._waited, 3) if self._waited else 0.0,
+                "throttled": self._throttled,
+                "backoff_remaining_seconds": round(max(0.0, self._blocked_until - now), 3),
+            }
+
+
+def is_throttled(response: requests.Response) -> bool:
+    """Czy Bitrix odrzucił request z powodu limitu (503 / QUERY_LIMIT_EXCEEDED)?"""
+    if response.status_code == 503:
+        return True
+    
+    if response.status_code >= 400:
+        try:
+            return response.json().get("error") == "QUERY_LIMIT_EXCEEDED"
+        except ValueError:
+            return False
+    
+    return False
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Parsuje nagłówek Retry-After (sekundy)"""
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RequestCounter:
+    """Liczba requestów wysłanych w jednym kontekście (bezpieczny wątkowo)"""
+    
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def add(self):
+        with self._lock:
+            self.count += 1
+
+
+_request_counter: ContextVar[Optional[RequestCounter]] = ContextVar("bitrix_request_counter", default=None)
+
+
+@contextmanager
+def count_requests() -> Iterator[RequestCounter]:
+    """
+    Liczy requesty wysłane w bieżącym kontekście
+    
+    Kontekst przechodzi do zadań asyncio i wątków asyncio.to_thread
+    (AsyncBitrixService), więc liczą się wszystkie requesty przebiegu -
+    i tylko one, bez równoległego ruchu innych wątków.
+    
+    Returns:
+        RequestCounter: Licznik (count po wyjściu z bloku)
+    """
+    counter = RequestCounter()
+    token = _request_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_counter.reset(token)
+
+
+def record_request():
+    """Dolicza request do licznika bieżącego kontekstu (jeśli jest)"""
+    counter = _request_counter.get()
+    if counter is not None:
+        counter.add()
+
+
+def clip_timeout(timeout, remaining: float):
+    """Timeout requests (liczba lub (connect, read)) przycięty do czasu pozostałego do deadline"""
+    remaining = max(0.001, remaining)
+    
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(min(part, remaining) if part is not None else remaining for part in timeout)
+    return min(timeout, remaining)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter, który przepuszcza każdy request przez rate limiter
+    
+    Przy QUERY_LIMIT_EXCEEDED/503 zgłasza backoff i ponawia request
+    (Bitrix go nie wykonał, więc ponowienie jest bezpieczne także dla zapisów).
+    """
+    
+    def __init__(
+        self,
+        limiter: TokenBucketRateLimiter,
+        max_throttle_retries: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+        **kwargs
+    ):
+        """
+        Args:
+            limiter: Rate limiter
+            max_throttle_retries: Maks. liczba ponowień po QUERY_LIMIT_EXCEEDED
+            clock: Zegar deadline (send_within) - podmieniany w testach
+        """
+        self.limiter = limiter
+        self.max_throttle_retries = max_throttle_retries
+        self._clock = clock
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        return self.send_within(request, None, **kwargs)
+    
+    def send_within(self, request, deadline: Optional[float], **kwargs):
+        """
+        send() z deadlinem: czekanie na token, pauzy po limicie i timeout
+        każdej próby mieszczą się w czasie do `deadline` (wg `clock`)
+        
+        Returns:
+            requests.Response: Odpowiedź (503 z limitem, jeśli kolejna próba
+                nie zmieściłaby się przed deadline)
+        
+        Raises:
+            RateLimitTimeout: Token nie zwolni się przed deadline
+        """
+        timeout = kwargs.get("timeout")
+        attempts = 0
+        
+        while True:
+            if deadline is None:
+                self.limiter.acquire()
+            else:
+                self.limiter.acquire(timeout=deadline - self._clock())
+                kwargs["timeout"] = clip_timeout(timeout, deadline - self._clock())
+            
+            record_request()
+            response = super().send(request, **kwargs)
+            
+            if not is_throttled(response):
+                self.limiter.record_success()
+                return response
+            
+            backoff = self.limiter.penalize(_retry_after(response))
+            attempts += 1
+            
+            if attempts > self.max_throttle_retries:
+                return response
+            if deadline is not None and self._clock() + backoff >= deadline:
+                return response
+            
+            response.close()
+
+
+_limiter = None
+_lock = threading.Lock()
+
+
+def create_rate_limiter(config: BitrixConfig) -> TokenBucketRateLimiter:
+    """Tworzy limiter z konfiguracji (BITRIX_RATE_LIMIT, BITRIX_RATE_BURST)"""
+    return TokenBucketRateLimiter(
+        rate=config.rate_limit,
+        capacity=config.rate_burst,
+        max_backoff=config.max_backoff,
+    )
+
+
+def get_rate_limiter() -> TokenBucketRateLimiter:
+    """Zwraca globalny limiter (wspólny dla całego procesu)"""
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = create_rate_limiter(get_bitrix_config())
+    return _limiter
@@ -0,0 +1,82 @@
+"""
+Rejestr ostatnich zapisów serwisu (deale przeniesione przez nas)
+
+Każdy nasz crm.deal.update wywołuje w Bitrix24 zdarzenie ONCRMDEALUPDATE
+i odświeża DATE_MODIFY deala. Bez rozróżnienia:
+- zdarzenie wraca do kolejki (src/services/event_queue.py) i po `window`
+  sekundach uruchamia kolejne przetwarzanie tego samego SPA - pętla, a jeśli
+  portal nie przeliczył jeszcze free_all, drugi przebieg awansuje ponownie
+- harmonogram (src/services/scheduler.py) widzi zmianę i nie zwalnia odpytywania
+
+Rejestr trzyma ID dealów zapisanych w ciągu ostatnich `ttl` sekund
+(RECENT_WRITES_TTL, domyślnie 120). Wpis powstaje PRZED wysłaniem zapisu -
+zdarzenie może dotrzeć, zanim batch zwróci odpowiedź.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable
+
+
+class RecentWrites:
+    """ID dealów zapisanych niedawno przez serwis (bezpieczny wątkowo)"""
+    
+    def __init__(
+        self,
+        ttl: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            ttl: Jak długo zapis uznajemy za "własny" (s)
+            clock: Zegar monotoniczny - podmieniany w testach
+        """
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        
+        # deal_id → moment zapisu
+        self._writes: Dict[str, float] = {}
+    
+    def record(self, deal_ids: Iterable[Any]):
+        """Zapamiętuje deale, które serwis właśnie zapisuje"""
+        now = self._clock()
+        with self._lock:
+            self._prune(now)
+            for deal_id in deal_ids:
+                self._writes[str(deal_id)] = now
+    
+    def contains(self, deal_id: Any) -> bool:
+        """Czy deal zapisał serwis w ciągu ostatnich `ttl` sekund"""
+        with self._lock:
+            written = self._writes.get(str(deal_id))
+            return written is not None and self._clock() - written < self.ttl
+    
+    def stats(self) -> Dict[str, Any]:
+        """Liczniki rejestru (do diagnostyki)"""
+        with self._lock:
+            self._prune(self._clock())
+            return {
+                "ttl_seconds": self.ttl,
+                "recent_writes": len(self._writes),
+            }
+    
+    def _prune(self, now: float):
+        """Usuwa wygasłe wpisy (pod blokadą)"""
+        expired = [deal_id for deal_id, at in self._writes.items() if now - at >= self.ttl]
+        for deal_id in expired:
+            del self._writes[deal_id]
+
+
+_recent_writes = None
+_lock = threading.Lock()
+
+
+def get_recent_writes() -> RecentWrites:
+    """Zwraca globalny rejestr zapisów (RECENT_WRITES_TTL)"""
+    global _recent_writes
+    if _recent_writes is None:
+        with _lock:
+            if _recent_writes is None:
+                _recent_writes = RecentWrites(ttl=float(os.getenv("RECENT_WRITES_TTL", "120")))
+    return _recent_writes
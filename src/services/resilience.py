@@ -0,0 +1,292 @@
+"""
+Odporność wywołań Bitrix24: deadline, ponowienia z jitterem, circuit breaker
+
+ResilientAdapter rozszerza RateLimitedAdapter, więc dotyczy każdego
+requestu wspólnej sesji HTTP (BitrixService i AsyncBitrixService):
+- deadline na całe wywołanie (BITRIX_CALL_DEADLINE) - łącznie z ponowieniami;
+  timeout pojedynczej próby nie przekracza pozostałego czasu
+- ponowienia z wykładniczym backoffem i pełnym jitterem - tylko dla metod
+  idempotentnych (odczyty); ConnectTimeout ponawiamy zawsze, bo request
+  nie został wysłany. Zapisów (*.update) nie ponawiamy - pierwszy mógł
+  dotrzeć do portalu i uruchomić procesy biznesowe Bitrix24
+- deadline obejmuje też czekanie na token i pauzy po QUERY_LIMIT_EXCEEDED
+  (RateLimitedAdapter.send_within)
+- circuit breaker: po serii błędów odrzuca requesty od razu (CircuitOpenError),
+  po czasie przepuszcza jedną próbę (half-open)
+
+Dzięki temu wolny portal nie blokuje wątków na długie timeouty
+i nie rośnie kolejka za jednym SPA.
+"""
+import json
+import random
+import threading
+import time
+from typing import Optional, Dict, Any, Callable
+from urllib.parse import urlparse
+import requests
+from src.config import BitrixConfig, get_bitrix_config
+from .rate_limiter import RateLimitedAdapter, RateLimitTimeout, TokenBucketRateLimiter, is_throttled
+
+
+# Metody bezpieczne do ponowienia (odczyt)
+IDEMPOTENT_SUFFIXES = (".get", ".list", ".fields")
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Circuit breaker otwarty - request odrzucony bez wysyłania do Bitrix24"""
+
+
+class CircuitBreaker:
+    """Circuit breaker (closed → open → half-open), bezpieczny wątkowo"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            failure_threshold: Liczba kolejnych błędów otwierająca breaker
+            reset_timeout: Po ilu sekundach przepuścić próbę (half-open)
+            clock: Zegar (monotoniczny) - podmieniany w testach
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        
+        # Liczniki
+        self._opened = 0
+        self._rejected = 0
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+    
+    def allow(self) -> bool:
+        """
+        Czy request może zostać wysłany?
+        
+        Returns:
+            bool: False = breaker otwarty (fail fast)
+        """
+        with self._lock:
+            if self._state == self.OPEN and self._clock() >= self._opened_at + self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            
+            if self._state == self.CLOSED:
+                return True
+            
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            
+            self._rejected += 1
+            return False
+    
+    def record_success(self):
+        """Udane wywołanie - zamyka breaker"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+    
+    def record_failure(self):
+        """Błąd transportu lub 5xx - po `failure_threshold` z rzędu otwiera breaker"""
+        with self._lock:
+            self._consecutive_failures += 1
+            
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+    
+    def release_probe(self):
+        """
+        Próba half-open nie została wysłana (np. RateLimitTimeout) - bez
+        wyniku dla breakera; kolejne wywołanie może spróbować ponownie
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+    
+    def stats(self) -> Dict[str, Any]:
+        """Zwraca stan breakera (do endpointu /health/bitrix)"""
+        with self._lock:
+            retry_in = 0.0
+            if self._state == self.OPEN:
+                retry_in = max(0.0, self._opened_at + self.reset_timeout - self._clock())
+            
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "opened": self._opened,
+                "rejected": self._rejected,
+                "retry_in_seconds": round(retry_in, 3),
+            }
+
+
+def rest_method(request: requests.PreparedRequest) -> str:
+    """Nazwa metody REST z URL (np. 'crm.deal.list')"""
+    method = urlparse(request.url).path.rstrip("/").rsplit("/", 1)[-1]
+    return method[:-len(".json")] if method.endswith(".json") else method
+
+
+def is_idempotent(request: requests.PreparedRequest) -> bool:
+    """
+    Czy request można bezpiecznie ponowić?
+    
+    - metody *.get / *.list / *.fields (zapisy *.update - nie)
+    - batch - jeśli wszystkie komendy są idempotentne
+    """
+    method = rest_method(request)
+    
+    if method != "batch":
+        return method.endswith(IDEMPOTENT_SUFFIXES)
+    
+    try:
+        commands = json.loads(request.body or b"{}").get("cmd", {})
+    except (ValueError, TypeError, AttributeError):
+        return False
+    
+    return bool(commands) and all(
+        command.split("?", 1)[0].endswith(IDEMPOTENT_SUFFIXES)
+        for command in commands.values()
+    )
+
+
+class ResilientAdapter(RateLimitedAdapter):
+    """
+    RateLimitedAdapter z deadlinem, ponowieniami i circuit breakerem
+    
+    Odpowiedzi z limitem (503 / QUERY_LIMIT_EXCEEDED) obsługuje nadal
+    RateLimitedAdapter - nie liczą się jako awaria portalu.
+    """
+    
+    def __init__(
+        self,
+        limiter: TokenBucketRateLimiter,
+        breaker: CircuitBreaker,
+        retry_attempts: int = 3,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 8.0,
+        deadline: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        jitter: Callable[[float, float], float] = random.uniform,
+        **kwargs
+    ):
+        """
+        Args:
+            limiter: Rate limiter
+            breaker: Circuit breaker
+            retry_attempts: Maks. liczba ponowień (po pierwszej próbie)
+            retry_base_delay: Pierwsza pauza przed ponowieniem (s)
+            retry_max_delay: Maksymalna pauza (s)
+            deadline: Łączny czas na wywołanie z ponowieniami (s)
+            clock, sleep, jitter: Podmieniane w testach
+        """
+        self.breaker = breaker
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.deadline = deadline
+        self._sleep = sleep
+        self._jitter = jitter
+        super().__init__(limiter, clock=clock, **kwargs)
+    
+    def send(self, request, **kwargs):
+        deadline = self._clock() + self.deadline
+        idempotent = is_idempotent(request)
+        attempt = 0
+        
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"Circuit breaker otwarty - {rest_method(request)} odrzucone",
+                    request=request,
+                )
+            
+            try:
+                response = self.send_within(request, deadline, **kwargs)
+            
+            except RateLimitTimeout:
+                # Limit zapytań, nie awaria portalu - bez błędu, ale próba
+                # half-open musi zostać zwolniona (inaczej breaker utknie)
+                self.breaker.release_probe()
+                raise
+            
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self.breaker.record_failure()
+                retryable = idempotent or isinstance(error, requests.ConnectTimeout)
+                delay = self._retry_delay(retryable, attempt, deadline)
+                if delay is None:
+                    raise
+            
+            else:
+                if response.status_code < 500 or is_throttled(response):
+                    self.breaker.record_success()
+                    return response
+                
+                self.breaker.record_failure()
+                delay = self._retry_delay(idempotent, attempt, deadline)
+                if delay is None:
+                    return response
+                response.close()
+            
+            self._sleep(delay)
+            attempt += 1
+    
+    def _retry_delay(self, retryable: bool, attempt: int, deadline: float) -> Optional[float]:
+        """
+        Pauza przed kolejną próbą (pełny jitter) lub None jeśli nie ponawiamy
+        
+        Nie ponawiamy: operacja nieidempotentna, wyczerpane próby,
+        albo pauza nie zmieści się w deadline.
+        """
+        if not retryable or attempt >= self.retry_attempts:
+            return None
+        
+        delay = self._jitter(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        
+        if self._clock() + delay >= deadline:
+            return None
+        
+        return delay
+
+
+_breaker = None
+_lock = threading.Lock()
+
+
+def create_circuit_breaker(config: BitrixConfig) -> CircuitBreaker:
+    """Tworzy breaker z konfiguracji (BITRIX_BREAKER_THRESHOLD, BITRIX_BREAKER_RESET)"""
+    return CircuitBreaker(
+        failure_threshold=config.breaker_threshold,
+        reset_timeout=config.breaker_reset,
+    )
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Zwraca globalny circuit breaker (wspólny dla całego procesu)"""
+    global _breaker
+    if _breaker is None:
+        with _lock:
+            if _breaker is None:
+                _breaker = create_circuit_breaker(get_bitrix_config())
+    return _breaker
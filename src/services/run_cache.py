@@ -0,0 +1,140 @@
+"""
+Cache wyników przetwarzania SPA według odcisku danych wejściowych
+
+Decyzje DealPromoter zależą wyłącznie od:
+- pól SPA czytanych przez reguły (limity miejsc, warunki, typ SPA)
+- dealów z Sortowania i Rezerwy - ich ID, etapów i treści
+
+Treść deala reprezentuje DATE_MODIFY (każda zmiana pola go podbija), więc
+odcisk = hash(pola SPA + [(ID, STAGE_ID, DATE_MODIFY), ...]). Jeśli odcisk
+jest taki sam jak w ostatnim zakończonym przebiegu, decyzje i zapis są
+pomijane - zwracamy poprzedni wynik (cached=True, z zerowym licznikiem
+zapisów - nic nie zostało wysłane). Odcisk jest też ETagiem odpowiedzi
+webhooka (If-None-Match → 304).
+
+Zapamiętywane są tylko przebiegi zakończone w całości (dry-run lub zapis
+bez błędów) - nieudany zapis jest ponawiany przy kolejnym wywołaniu.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from src.models import SPA, Deal
+
+
+# Pola SPA czytane przez reguły (walidacja, przydział, typ SPA)
+SPA_INPUT_FIELDS = (
+    "stage_id",
+    "free_all",
+    "free_m_ours", "free_k_ours", "free_couple_ours",
+    "free_m_own", "free_k_own", "free_couple_own",
+    "age_limit",
+    "training_date",
+    "arrival_from",
+    "arrival_to",
+    "priority_1", "priority_2", "priority_3",
+    "is_genderless",
+)
+
+
+def input_fingerprint(spa: SPA, deals: List[Deal]) -> str:
+    """
+    Odcisk danych wejściowych przetwarzania SPA
+    
+    Args:
+        spa: Projekt SPA
+        deals: Deale z Sortowania i Rezerwy (kolejność bez znaczenia)
+    
+    Returns:
+        str: Hash SHA-256 (hex, 32 znaki)
+    """
+    payload = {
+        "spa": [spa.id, spa.model_dump(include=set(SPA_INPUT_FIELDS), mode="json")],
+        "deals": sorted(
+            (deal.id, deal.stage_id, deal.date_modify.isoformat() if deal.date_modify else None)
+            for deal in deals
+        ),
+    }
+    data = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+class RunCache:
+    """Ostatni zakończony wynik per klucz (np. (spa_id, dry_run)) - LRU, bezpieczny wątkowo"""
+    
+    def __init__(self, max_entries: int = 1000):
+        """
+        Args:
+            max_entries: Maks. liczba zapamiętanych kluczy (najstarsze usuwane)
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Liczniki
+        self._hits = 0
+        self._misses = 0
+    
+    def get(self, key: Hashable, fingerprint: str) -> Optional[Any]:
+        """
+        Wynik ostatniego przebiegu, jeśli miał ten sam odcisk
+        
+        Args:
+            key: Klucz przebiegu
+            fingerprint: Odcisk bieżących danych wejściowych
+        
+        Returns:
+            Optional[Any]: Zapamiętany wynik lub None (brak / inny odcisk)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != fingerprint:
+                self._misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+    
+    def put(self, key: Hashable, fingerprint: str, result: Any):
+        """Zapamiętuje wynik zakończonego przebiegu"""
+        with self._lock:
+            self._entries[key] = (fingerprint, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Liczniki cache (do diagnostyki)"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_run_cache() -> Optional[RunCache]:
+    """
+    Zwraca globalny cache przebiegów (RUN_CACHE_SIZE, 0 = wyłączony)
+    
+    Returns:
+        Optional[RunCache]: Cache lub None, jeśli wyłączony
+    """
+    global _cache
+    max_entries = int(os.getenv("RUN_CACHE_SIZE", "1000"))
+    if max_entries <= 0:
+        return None
+    
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = RunCache(max_entries)
+    return _cache
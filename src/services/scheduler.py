@@ -0,0 +1,371 @@
+"""
+Harmonogram przetwarzania SPA w procesie (zamiast pętli n8n)
+
+Zamiast wywoływać webhook dla każdego SPA co 5 minut, harmonogram sam
+odpytuje SPA w adaptacyjnych odstępach:
+- zmiana (updatedTime SPA lub DATE_MODIFY dealów tego SPA) → przetwarzanie
+  przy najbliższym takcie, odstęp wraca do bazowego; zapisy samego serwisu
+  (src/services/recent_writes.py) i zmiany widziane w poprzednim odświeżeniu
+  nie są zmianą
+- brak zmian → odstęp rośnie 2x (do SCHEDULER_MAX_INTERVAL)
+- zbliżające się szkolenie (training_date w ciągu SCHEDULER_URGENT_DAYS)
+  → krótsze odstępy (min. przy zmianie, najwyżej bazowy bez zmian);
+  szkolenie, które już się odbyło, nie jest pilne
+- budżet requestów (SCHEDULER_BUDGET na minutę) - przetwarzanie SPA
+  czeka na kolejny takt, jeśli budżet jest wyczerpany; koszt to requesty
+  wysłane przez sam harmonogram (count_requests), nie ruch całego procesu
+
+Wykrywanie zmian kosztuje dwa zapytania na odświeżenie, niezależnie od
+liczby SPA: jedno crm.item.list (updatedTime) i jedno crm.deal.list
+(DATE_MODIFY > ostatnie odświeżenie, pola ID, SPA i DATE_MODIFY).
+
+Włączany przez SCHEDULER_ENABLED=1, stan: GET /scheduler/status.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from src.models import SPA
+from .async_bitrix import AsyncBitrixService
+from .projection import field_aliases
+from .rate_limiter import count_requests
+from .recent_writes import RecentWrites, get_recent_writes
+from .spa_batch import open_spa_filter
+from .sweep import DEAL_SPA_FIELD
+
+
+logger = logging.getLogger("spa_webhook.scheduler")
+
+# Pola SPA potrzebne do planowania (model SPA wymaga id, title, stageId, free_all)
+SPA_SCHEDULE_SELECT = ["id", "title", "stageId", "updatedTime"] + field_aliases(SPA, ("free_all", "training_date"))
+
+# Zapas przy zapytaniu o zmienione deale (różnice zegarów, opóźnienie zapisu)
+CHANGE_OVERLAP = timedelta(seconds=60)
+
+
+class SPAPollState:
+    """Stan odpytywania jednego SPA"""
+    
+    def __init__(self, spa_id: int, interval: float, next_run: float):
+        self.spa_id = spa_id
+        self.interval = interval
+        self.next_run = next_run
+        self.updated_time: Optional[datetime] = None
+        self.training_date: Optional[datetime] = None
+        self.changed = True
+        self.runs = 0
+        self.last_run: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+    
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "spa_id": self.spa_id,
+            "interval_seconds": round(self.interval, 1),
+            "next_run_in_seconds": round(max(0.0, self.next_run - now), 1),
+            "changed": self.changed,
+            "training_date": self.training_date.isoformat() if self.training_date else None,
+            "runs": self.runs,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_error": self.last_error,
+        }
+
+
+class AdaptiveScheduler:
+    """Adaptacyjny harmonogram przetwarzania SPA (wątek w tle)"""
+    
+    def __init__(
+        self,
+        run: Callable[[int], Any],
+        bitrix: Optional[AsyncBitrixService] = None,
+        recent_writes: Optional[RecentWrites] = None,
+        tick: float = 15.0,
+        refresh_interval: float = 60.0,
+        base_interval: float = 300.0,
+        min_interval: float = 60.0,
+        max_interval: float = 3600.0,
+        urgent_days: float = 7.0,
+        budget: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        now: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ):
+        """
+        Args:
+            run: Przetwarzanie jednego SPA (np. webhook.run_spa)
+            bitrix: Asynchroniczny klient (domyślnie nowy)
+            recent_writes: Rejestr własnych zapisów (domyślnie globalny)
+            tick: Co ile sekund sprawdzać, które SPA są do przetworzenia
+            refresh_interval: Co ile sekund wykrywać zmiany (2 zapytania)
+            base_interval: Odstęp po zmianie (s)
+            min_interval: Odstęp po zmianie dla SPA z bliskim szkoleniem (s)
+            max_interval: Maksymalny odstęp bez zmian (s)
+            urgent_days: Szkolenie w ciągu tylu dni = SPA pilne
+            budget: Maks. requestów do Bitrix24 na minutę zużywanych przez harmonogram
+            clock, now: Zegary - podmieniane w testach
+        """
+        self.run = run
+        self.bitrix = bitrix or AsyncBitrixService()
+        self.recent_writes = recent_writes or get_recent_writes()
+        self.tick = tick
+        self.refresh_interval = refresh_interval
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.urgent_days = urgent_days
+        self.budget = budget
+        self._clock = clock
+        self._now = now
+        
+        self._states: Dict[int, SPAPollState] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        self._last_refresh: Optional[float] = None
+        self._changes_since: Optional[datetime] = None
+        # (ID, DATE_MODIFY) zmian z poprzedniego odświeżenia - zakładka CHANGE_OVERLAP
+        self._seen_changes: Set[Tuple[str, str]] = set()
+        
+        # Budżet requestów jako token bucket (pojemność = minuta)
+        self._budget_tokens = budget
+        self._budget_refill = clock()
+        self._run_cost = 3.0
+        
+        # Liczniki
+        self._ticks = 0
+        self._runs = 0
+        self._deferred = 0
+        self._errors = 0
+    
+    def start(self):
+        """Uruchamia pętlę w wątku daemon (idempotentne)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="spa-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"⏰ Harmonogram uruchomiony (takt {self.tick}s, budżet {self.budget}/min)")
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Zatrzymuje pętlę (czeka na bieżący takt)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def run_once(self) -> List[int]:
+        """
+        Jeden takt: wykrycie zmian (co refresh_interval) i przetworzenie należnych SPA
+        
+        Returns:
+            List[int]: ID przetworzonych SPA
+        """
+        self._ticks += 1
+        now = self._clock()
+        
+        if self._last_refresh is None or now - self._last_refresh >= self.refresh_interval:
+            self._spend(self._measure(self.refresh))
+        
+        processed = []
+        for state in self.due():
+            if not self._has_budget(self._run_cost):
+                self._deferred += 1
+                logger.info(f"⏳ Budżet requestów wyczerpany - SPA {state.spa_id} w kolejnym takcie")
+                break
+            
+            cost = self._measure(lambda: self._process(state))
+            self._spend(cost)
+            self._run_cost = 0.7 * self._run_cost + 0.3 * cost
+            processed.append(state.spa_id)
+        
+        return processed
+    
+    def refresh(self):
+        """Aktualizuje listę SPA i wykrywa zmiany (crm.item.list + crm.deal.list)"""
+        started = self._now()
+        items = asyncio.run(self.bitrix.list_spas(open_spa_filter(), select=SPA_SCHEDULE_SELECT))
+        spas = [SPA.from_api({"item": item}) for item in items]
+        spas = [spa for spa in spas if spa.has_free_slots()]
+        
+        changed_ids = set()
+        seen_changes = set()
+        if self._changes_since is not None and spas:
+            deals = asyncio.run(self.bitrix.list_deals(
+                {
+                    ">DATE_MODIFY": (self._changes_since - CHANGE_OVERLAP).isoformat(),
+                    DEAL_SPA_FIELD: [str(spa.id) for spa in spas],
+                },
+                ["ID", DEAL_SPA_FIELD, "DATE_MODIFY"],
+            ))
+            seen_changes = {(str(deal.get("ID")), str(deal.get("DATE_MODIFY"))) for deal in deals}
+            changed_ids = {
+                str(deal.get(DEAL_SPA_FIELD))
+                for deal in deals
+                if not self.recent_writes.contains(deal.get("ID"))
+                and (str(deal.get("ID")), str(deal.get("DATE_MODIFY"))) not in self._seen_changes
+            }
+        
+        now = self._clock()
+        with self._lock:
+            active = {spa.id for spa in spas}
+            for spa_id in list(self._states):
+                if spa_id not in active:
+                    del self._states[spa_id]
+            
+            for spa in spas:
+                state = self._states.get(spa.id)
+                if state is None:
+                    state = self._states[spa.id] = SPAPollState(spa.id, self.base_interval, now)
+                elif spa.updated_time != state.updated_time or str(spa.id) in changed_ids:
+                    state.changed = True
+                
+                state.updated_time = spa.updated_time
+                state.training_date = spa.training_date
+                
+                if state.changed:
+                    state.next_run = min(state.next_run, now)
+        
+        self._last_refresh = now
+        self._changes_since = started
+        self._seen_changes = seen_changes
+        logger.info(f"🔄 Harmonogram: {len(spas)} SPA aktywnych, zmiany w {len(changed_ids)}")
+    
+    def due(self) -> List[SPAPollState]:
+        """SPA do przetworzenia teraz - zmienione i pilne najpierw"""
+        now = self._clock()
+        with self._lock:
+            states = [state for state in self._states.values() if state.next_run <= now]
+        
+        return sorted(states, key=lambda s: (not s.changed, not self.is_urgent(s), s.next_run))
+    
+    def is_urgent(self, state: SPAPollState) -> bool:
+        """Czy szkolenie SPA zaczyna się w ciągu `urgent_days` dni (i jeszcze się nie zaczęło)?"""
+        if state.training_date is None:
+            return False
+        
+        training = state.training_date
+        now = self._now()
+        if training.tzinfo is None:
+            now = now.replace(tzinfo=None)
+        elif now.tzinfo is None:
+            now = now.replace(tzinfo=timezone.utc)
+        
+        return now <= training <= now + timedelta(days=self.urgent_days)
+    
+    def next_interval(self, state: SPAPollState, changed: bool) -> float:
+        """Odstęp do kolejnego przetworzenia SPA"""
+        urgent = self.is_urgent(state)
+        
+        if changed:
+            return self.min_interval if urgent else self.base_interval
+        
+        return min(state.interval * 2, self.base_interval if urgent else self.max_interval)
+    
+    def status(self) -> Dict[str, Any]:
+        """Stan harmonogramu (do endpointu /scheduler/status)"""
+        now = self._clock()
+        with self._lock:
+            states = sorted(self._states.values(), key=lambda s: s.next_run)
+            spas = [state.to_dict(now) for state in states]
+        
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "tick_seconds": self.tick,
+            "budget_per_minute": self.budget,
+            "budget_available": round(self._available_budget(), 1),
+            "estimated_run_cost": round(self._run_cost, 1),
+            "ticks": self._ticks,
+            "runs": self._runs,
+            "deferred": self._deferred,
+            "errors": self._errors,
+            "spas": spas,
+        }
+    
+    def _process(self, state: SPAPollState):
+        changed = state.changed
+        state.changed = False
+        
+        try:
+            self.run(state.spa_id)
+            state.last_error = None
+        except Exception as error:
+            # Błąd - spróbuj ponownie po bazowym odstępie
+            self._errors += 1
+            state.last_error = str(error)
+            state.changed = True
+            logger.error(f"❌ Harmonogram: SPA {state.spa_id} - {error}")
+        
+        with self._lock:
+            self._runs += 1
+            state.runs += 1
+            state.last_run = self._now()
+            state.interval = self.next_interval(state, changed)
+            state.next_run = self._clock() + state.interval
+    
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as error:
+                self._errors += 1
+                logger.error(f"❌ Harmonogram: takt nieudany - {error}")
+            self._stop.wait(self.tick)
+    
+    def _measure(self, func: Callable[[], Any]) -> float:
+        """Liczba requestów wysłanych przez func (bez równoległego ruchu procesu)"""
+        with count_requests() as counter:
+            func()
+        return float(counter.count)
+    
+    def _available_budget(self) -> float:
+        now = self._clock()
+        self._budget_tokens = min(
+            self.budget,
+            self._budget_tokens + (now - self._budget_refill) * self.budget / 60.0,
+        )
+        self._budget_refill = now
+        return self._budget_tokens
+    
+    def _has_budget(self, cost: float) -> bool:
+        return self._available_budget() >= min(cost, self.budget)
+    
+    def _spend(self, cost: float):
+        self._available_budget()
+        self._budget_tokens -= cost
+
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def create_scheduler(run: Callable[[int], Any]) -> AdaptiveScheduler:
+    """Tworzy harmonogram z konfiguracji (zmienne SCHEDULER_*)"""
+    return AdaptiveScheduler(
+        run,
+        tick=float(os.getenv("SCHEDULER_TICK", "15")),
+        refresh_interval=float(os.getenv("SCHEDULER_REFRESH_INTERVAL", "60")),
+        base_interval=float(os.getenv("SCHEDULER_BASE_INTERVAL", "300")),
+        min_interval=float(os.getenv("SCHEDULER_MIN_INTERVAL", "60")),
+        max_interval=float(os.getenv("SCHEDULER_MAX_INTERVAL", "3600")),
+        urgent_days=float(os.getenv("SCHEDULER_URGENT_DAYS", "7")),
+        budget=float(os.getenv("SCHEDULER_BUDGET", "60")),
+    )
+
+
+def get_scheduler(run: Optional[Callable[[int], Any]] = None) -> Optional[AdaptiveScheduler]:
+    """
+    Zwraca globalny harmonogram
+    
+    Args:
+        run: Przetwarzanie SPA - wymagane przy pierwszym wywołaniu
+    
+    Returns:
+        Optional[AdaptiveScheduler]: Harmonogram lub None, jeśli nie został utworzony
+    """
+    global _scheduler
+    if _scheduler is None and run is not None:
+        with _lock:
+            if _scheduler is None:
+                _scheduler = create_scheduler(run)
+    return _scheduler
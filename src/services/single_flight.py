@@ -0,0 +1,178 @@
+"""
+Single-flight - jedno przetwarzanie danego SPA naraz
+
+n8n ponawia webhook (3 próby, timeout 30 s) - ponowienie może przyjść,
+gdy poprzednie przetwarzanie tego samego SPA jeszcze trwa. Bez koordynacji
+oba przebiegi pobierają te same dane i awansują te same deale.
+
+SingleFlight.do(key, func):
+- brak przebiegu dla klucza → wywołujący wykonuje func (lider)
+- przebieg trwa → wywołujący czeka i dostaje ten sam wynik (bez ruchu do Bitrix24)
+- wywołania w trakcie przebiegu zlecają najwyżej JEDEN przebieg uzupełniający
+  (follow-up) po jego zakończeniu - dane mogły się zmienić w międzyczasie
+
+Przebieg zbiorczy (przegląd portfela) zajmuje klucze wielu SPA naraz:
+claim() pomija SPA z przebiegiem w toku, a do() zajętych SPA czeka
+na release() i dostaje wynik przeglądu dla swojego SPA.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger("spa_webhook.single_flight")
+
+
+class _Call:
+    """Przebieg w toku - wynik współdzielony przez wszystkich czekających"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.follow_up = False
+        self.shared = 0
+        # func przebiegu uzupełniającego klucza zajętego przez claim()
+        self.follow_up_func: Optional[Callable[[], Any]] = None
+
+
+class SingleFlight:
+    """Koalescencja wywołań per klucz (bezpieczna wątkowo)"""
+    
+    def __init__(self, spawn: Optional[Callable[[Callable[[], None]], None]] = None):
+        """
+        Args:
+            spawn: Uruchamia przebieg uzupełniający w tle
+                (domyślnie nowy wątek daemon) - podmieniany w testach
+        """
+        self._spawn = spawn or self._spawn_thread
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+    
+    def do(
+        self,
+        key: Hashable,
+        func: Callable[[], Any],
+        follow_up: bool = True
+    ) -> Tuple[Any, bool]:
+        """
+        Wykonuje func raz dla wszystkich równoczesnych wywołań z tym samym kluczem
+        
+        Args:
+            key: Klucz koalescencji (np. (spa_id, dry_run))
+            func: Przetwarzanie (wywoływane bez argumentów)
+            follow_up: Czy wywołanie w trakcie przebiegu zleca przebieg uzupełniający
+        
+        Returns:
+            Tuple[Any, bool]: (wynik, czy współdzielony z innym wywołaniem)
+        
+        Raises:
+            Exception: Błąd func - także dla czekających
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            
+            if call is not None:
+                call.shared += 1
+                call.follow_up = call.follow_up or follow_up
+                if follow_up and call.follow_up_func is None:
+                    call.follow_up_func = func
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = func()
+        except BaseException as error:
+            call.error = error
+        finally:
+            with self._lock:
+                del self._calls[key]
+                run_follow_up = call.follow_up
+            call.done.set()
+        
+        if run_follow_up:
+            logger.info(f"🔁 {key}: wywołania w trakcie przebiegu - przebieg uzupełniający")
+            self._spawn(lambda: self._run_follow_up(key, func))
+        
+        if call.error is not None:
+            raise call.error
+        return call.result, call.shared > 0
+    
+    def claim(self, keys: Iterable[Hashable]) -> List[Hashable]:
+        """
+        Zajmuje klucze bez wykonywania func (przebieg zbiorczy)
+        
+        Args:
+            keys: Klucze do zajęcia (np. (spa_id, False) wszystkich SPA przeglądu)
+        
+        Returns:
+            List[Hashable]: Zajęte klucze - pozostałe mają przebieg w toku
+        """
+        claimed = []
+        with self._lock:
+            for key in keys:
+                if key not in self._calls:
+                    self._calls[key] = _Call()
+                    claimed.append(key)
+        return claimed
+    
+    def release(self, key: Hashable, result: Any = None, error: Optional[BaseException] = None):
+        """
+        Zwalnia klucz zajęty przez claim()
+        
+        Czekający dostają `result` (lub `error`). Jeśli wywołania w trakcie
+        zleciły przebieg uzupełniający - uruchamia go z func pierwszego z nich.
+        
+        Args:
+            key: Klucz z claim()
+            result: Wynik dla czekających (np. wynik przeglądu dla SPA)
+            error: Błąd dla czekających
+        """
+        with self._lock:
+            call = self._calls.pop(key)
+            follow_up_func = call.follow_up_func if call.follow_up else None
+        
+        call.result, call.error = result, error
+        call.done.set()
+        
+        if follow_up_func is not None:
+            logger.info(f"🔁 {key}: wywołania w trakcie przebiegu zbiorczego - przebieg uzupełniający")
+            self._spawn(lambda: self._run_follow_up(key, follow_up_func))
+    
+    def in_flight(self) -> Dict[Hashable, int]:
+        """Klucze w toku i liczba czekających (do diagnostyki)"""
+        with self._lock:
+            return {key: call.shared for key, call in self._calls.items()}
+    
+    def _run_follow_up(self, key: Hashable, func: Callable[[], Any]):
+        """Przebieg uzupełniający - błąd tylko logowany (nikt na niego nie czeka)"""
+        try:
+            self.do(key, func)
+        except Exception as error:
+            logger.error(f"❌ {key}: przebieg uzupełniający nieudany - {error}")
+    
+    @staticmethod
+    def _spawn_thread(target: Callable[[], None]):
+        threading.Thread(target=target, daemon=True).start()
+
+
+_flight = None
+_flight_lock = threading.Lock()
+
+
+def get_spa_flight() -> SingleFlight:
+    """Zwraca globalny SingleFlight dla przetwarzania SPA"""
+    global _flight
+    if _flight is None:
+        with _flight_lock:
+            if _flight is None:
+                _flight = SingleFlight()
+    return _flight
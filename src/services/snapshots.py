@@ -0,0 +1,261 @@
+"""
+Nagrywanie i odtwarzanie odpowiedzi Bitrix24 (snapshoty do testów offline)
+
+Nagrywanie (BITRIX_RECORD_PATH): każda odpowiedź wspólnej sesji HTTP trafia
+do pliku JSON Lines skompresowanego gzip - metoda REST, parametry, status,
+treść i czas odpowiedzi. URL (z tokenem webhooka) nie jest zapisywany.
+Każdy wpis to osobny, kompletny człon gzip - przerwanie procesu (SIGTERM,
+docker stop) nie psuje wcześniejszych wpisów, a obcięty ostatni człon
+load_snapshots() pomija.
+
+Odtwarzanie (BITRIX_REPLAY_PATH - plik lub katalog *.jsonl.gz): sesja dostaje
+ReplayAdapter zamiast połączenia z portalem:
+- odpowiedź wybierana po metodzie i parametrach (kanoniczny JSON)
+- powtórzenia tego samego zapytania - odpowiedzi w kolejności nagrania
+  (po wyczerpaniu ostatnia), więc przebieg jest deterministyczny
+- opóźnienie (BITRIX_REPLAY_LATENCY): brak, "recorded" (jak w nagraniu)
+  lub stała liczba sekund
+- zapisy (crm.deal.update, batch z samymi update) spoza nagrania dostają
+  syntetyczny sukces - inne decyzje niż w nagraniu nie przerywają przebiegu
+- brak nagrania dla odczytu → błąd Bitrix "SNAPSHOT_MISS" (BitrixAPIError)
+
+Nic nie jest wysyłane do portalu - bez zużycia limitu i bez ryzyka zapisu.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Union
+import requests
+from requests.adapters import BaseAdapter
+from .resilience import rest_method
+
+
+logger = logging.getLogger("spa_webhook.snapshots")
+
+# Metody zapisu, dla których odtwarzanie może zwrócić syntetyczny sukces
+WRITE_METHODS = ("crm.deal.update",)
+
+
+def request_params(request: requests.PreparedRequest) -> Any:
+    """Parametry requestu (JSON z body; inne body jako tekst)"""
+    body = request.body or b""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        return body
+
+
+def request_key(method: str, params: Any) -> str:
+    """Klucz nagrania: metoda + hash kanonicznego JSON parametrów"""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{method}:{hashlib.sha1(canonical.encode('utf-8')).hexdigest()}"
+
+
+class SnapshotRecorder:
+    """Zapisuje odpowiedzi sesji HTTP do pliku .jsonl.gz (hook "response")"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Plik snapshotu (dopisywany - każdy wpis to kolejny człon gzip)
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.recorded = 0
+    
+    def attach(self, session: requests.Session):
+        """Podpina nagrywanie pod wszystkie odpowiedzi sesji"""
+        session.hooks["response"].append(self.hook)
+    
+    def hook(self, response: requests.Response, *args, **kwargs) -> requests.Response:
+        """Hook requests - zapisuje odpowiedź i zwraca ją bez zmian"""
+        method = rest_method(response.request)
+        params = request_params(response.request)
+        entry = {
+            "method": method,
+            "key": request_key(method, params),
+            "params": params,
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", "application/json"),
+            "body": response.text,
+            "elapsed": response.elapsed.total_seconds(),
+        }
+        
+        member = gzip.compress((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        
+        # Plik otwierany per wpis - nic nie zostaje w buforze do zamknięcia
+        with self._lock, open(self.path, "ab") as snapshot:
+            snapshot.write(member)
+            self.recorded += 1
+        return response
+    
+    def close(self):
+        """Nic do zamknięcia - każdy wpis jest zapisany w całości"""
+
+
+def load_snapshots(path: str) -> List[Dict[str, Any]]:
+    """
+    Wczytuje nagrania z pliku lub katalogu (*.jsonl.gz, alfabetycznie)
+    
+    Plik obcięty w trakcie zapisu (proces zabity, strumień gzip bez
+    zamknięcia) → wpisy sprzed uszkodzenia, niepełna ostatnia linia pominięta.
+    
+    Returns:
+        List[Dict]: Wpisy w kolejności nagrania
+    """
+    paths = sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))) if os.path.isdir(path) else [path]
+    entries = []
+    
+    for snapshot_path in paths:
+        with gzip.open(snapshot_path, "rt", encoding="utf-8") as snapshot:
+            try:
+                for line in snapshot:
+                    if line.endswith("\n") and line.strip():
+                        entries.append(json.loads(line))
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                logger.warning(f"⚠️  Snapshot {snapshot_path} obcięty - wczytano wpisy sprzed uszkodzenia")
+    
+    return entries
+
+
+class ReplayAdapter(BaseAdapter):
+    """Adapter requests odtwarzający nagrane odpowiedzi (bez sieci)"""
+    
+    def __init__(
+        self,
+        entries: Iterable[Dict[str, Any]],
+        latency: Union[None, str, float] = None,
+        synthesize_writes: bool = True,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            entries: Wpisy nagrania (load_snapshots)
+            latency: None = bez opóźnienia, "recorded" = jak w nagraniu,
+                liczba = stałe opóźnienie (s)
+            synthesize_writes: Sukces dla zapisów spoza nagrania
+            sleep: Podmieniane w testach
+        """
+        super().__init__()
+        self.latency = latency
+        self.synthesize_writes = synthesize_writes
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for entry in entries:
+            self._entries[entry["key"]].append(entry)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        
+        # Liczniki
+        self.served = 0
+        self.synthesized = 0
+        self.misses = 0
+    
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        method = rest_method(request)
+        params = request_params(request)
+        key = request_key(method, params)
+        
+        with self._lock:
+            recorded = self._entries.get(key)
+            if recorded:
+                entry = recorded[min(self._cursors[key], len(recorded) - 1)]
+                self._cursors[key] += 1
+                self.served += 1
+            elif self.synthesize_writes and self._is_write(method, params):
+                entry = self._synthetic_write(method, params)
+                self.synthesized += 1
+            else:
+                self.misses += 1
+                entry = {
+                    "status": 404,
+                    "body": json.dumps({"error": "SNAPSHOT_MISS", "error_description": f"Brak nagrania dla {method}"}),
+                    "elapsed": 0.0,
+                }
+                logger.warning(f"⚠️  Odtwarzanie: brak nagrania dla {method}")
+        
+        delay = self._delay(entry)
+        if delay > 0:
+            self._sleep(delay)
+        
+        return self._build_response(request, entry, delay)
+    
+    def close(self):
+        pass
+    
+    def stats(self) -> Dict[str, Any]:
+        """Liczniki odtwarzania (do diagnostyki)"""
+        with self._lock:
+            return {
+                "recorded_keys": len(self._entries),
+                "served": self.served,
+                "synthesized": self.synthesized,
+                "misses": self.misses,
+            }
+    
+    def _delay(self, entry: Dict[str, Any]) -> float:
+        if self.latency == "recorded":
+            return float(entry.get("elapsed") or 0.0)
+        if self.latency:
+            return float(self.latency)
+        return 0.0
+    
+    @staticmethod
+    def _is_write(method: str, params: Any) -> bool:
+        """crm.deal.update lub batch złożony wyłącznie z zapisów"""
+        if method in WRITE_METHODS:
+            return True
+        if method != "batch" or not isinstance(params, dict):
+            return False
+        
+        commands = params.get("cmd") or {}
+        return bool(commands) and all(
+            str(command).split("?", 1)[0] in WRITE_METHODS for command in commands.values()
+        )
+    
+    @staticmethod
+    def _synthetic_write(method: str, params: Any) -> Dict[str, Any]:
+        """Odpowiedź jak z portalu: result = true (per komenda dla batch)"""
+        if method == "batch":
+            commands = params.get("cmd") or {}
+            result = {
+                "result": {key: True for key in commands},
+                "result_error": [],
+                "result_total": [],
+                "result_next": [],
+                "result_time": {},
+            }
+            return {"status": 200, "body": json.dumps({"result": result}), "elapsed": 0.0}
+        
+        return {"status": 200, "body": json.dumps({"result": True}), "elapsed": 0.0}
+    
+    @staticmethod
+    def _build_response(request: requests.PreparedRequest, entry: Dict[str, Any], delay: float) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response._content = entry["body"].encode("utf-8")
+        response.headers["Content-Type"] = entry.get("content_type", "application/json")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=delay)
+        return response
+
+
+def replay_latency(value: str) -> Union[None, str, float]:
+    """BITRIX_REPLAY_LATENCY: "" → brak, "recorded" → z nagrania, liczba → sekundy"""
+    if not value:
+        return None
+    return value if value == "recorded" else float(value)
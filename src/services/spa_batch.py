@@ -0,0 +1,115 @@
+"""
+Przetwarzanie wielu SPA naraz (POST /webhook/spa/batch)
+
+Zamiast wywołań webhooka SPA po SPA (z pauzami w n8n) przetwarzamy listę SPA
+w ograniczonej puli wątków. Wszystkie przebiegi idą przez wspólną sesję HTTP,
+więc dzielą jeden rate limiter i circuit breaker - równoległość nie przekracza
+limitu portalu, tylko wypełnia go zamiast czekać.
+
+Wyniki są zwracane w kolejności zakończenia (do strumienia NDJSON).
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from src.models import SPA, SPAStage
+from .async_bitrix import AsyncBitrixService
+from .projection import field_aliases
+
+
+logger = logging.getLogger("spa_webhook.spa_batch")
+
+# Pole "Wolne wszystkie" SPA (główny limit miejsc)
+FREE_ALL_FIELD = field_aliases(SPA, ("free_all",))[0]
+
+
+def open_spa_filter(with_free_slots: bool = True) -> Dict[str, Any]:
+    """
+    Filtr crm.item.list dla SPA "W trakcie" (opcjonalnie z wolnymi miejscami)
+    
+    Args:
+        with_free_slots: Tylko SPA z free_all > 0
+    
+    Returns:
+        Dict: Filtr Bitrix24
+    """
+    filter = {"stageId": SPAStage.IN_PROGRESS.value}
+    
+    if with_free_slots:
+        filter[f">{FREE_ALL_FIELD}"] = 0
+    
+    return filter
+
+
+async def open_spa_ids(
+    bitrix: Optional[AsyncBitrixService] = None,
+    with_free_slots: bool = True
+) -> List[int]:
+    """
+    ID wszystkich SPA "W trakcie" (z wolnymi miejscami) - jedno crm.item.list
+    
+    Args:
+        bitrix: Asynchroniczny serwis Bitrix24 (domyślnie nowy)
+        with_free_slots: Tylko SPA z free_all > 0
+    
+    Returns:
+        List[int]: ID projektów SPA (rosnąco)
+    """
+    bitrix = bitrix or AsyncBitrixService()
+    items = await bitrix.list_spas(open_spa_filter(with_free_slots), select=["id", FREE_ALL_FIELD])
+    
+    # Filtr free_all sprawdzamy też lokalnie (portal może zignorować warunek)
+    return [
+        int(item["id"])
+        for item in items
+        if not with_free_slots or (item.get(FREE_ALL_FIELD) or 0) > 0
+    ]
+
+
+def run_batch(
+    spa_ids: Iterable[int],
+    run: Callable[[int], Dict[str, Any]],
+    concurrency: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Przetwarza SPA w ograniczonej puli i zwraca wyniki w kolejności zakończenia
+    
+    Błąd jednego SPA nie przerywa pozostałych - trafia do wyników
+    jako {"status": "error", ...}.
+    
+    Args:
+        spa_ids: ID projektów SPA (duplikaty pomijane)
+        run: Przetwarzanie jednego SPA (np. webhook.run_spa)
+        concurrency: Maks. liczba równoległych SPA (domyślnie i najwyżej
+            BATCH_CONCURRENCY=4 - wartość z requestu nie tworzy setek wątków)
+    
+    Yields:
+        Dict: Wynik przetworzenia jednego SPA
+    """
+    spa_ids = list(dict.fromkeys(spa_ids))
+    if not spa_ids:
+        return
+    
+    limit = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    workers = min(concurrency or limit, limit, len(spa_ids))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="spa-batch")
+    logger.info(f"📦 Batch: {len(spa_ids)} SPA, równolegle {workers}")
+    
+    try:
+        futures = {pool.submit(run, spa_id): spa_id for spa_id in spa_ids}
+        
+        for future in as_completed(futures):
+            spa_id = futures[future]
+            try:
+                yield future.result()
+            except Exception as error:
+                logger.error(f"❌ Batch: SPA {spa_id} - {error}")
+                yield {
+                    "status": "error",
+                    "spa_id": spa_id,
+                    "error": str(error),
+                    "error_type": type(error).__name__,
+                }
+    finally:
+        # Klient rozłączony → nie zaczynaj kolejnych SPA (rozpoczęte kończą się)
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,311 @@
+"""
+Przetwarzanie pojedynczego SPA (asynchronicznie)
+
+process_spa() to wspólny punkt wejścia dla webhooka i dry-run:
+1. Pobierz SPA i deale (SORTING + RESERVE) - jednym wywołaniem batch
+2. Przetwórz (DealPromoter: walidacja, sortowanie, przydział)
+3. Zapisz zmiany etapów (batch, paczki równolegle) - pomijane w dry-run
+
+Z cache przebiegów (run_cache.py) kroki 2-3 są pomijane, jeśli odcisk
+danych wejściowych jest taki sam jak w ostatnim zakończonym przebiegu.
+Z kopią lokalną (local_store.py) krok 1 to odczyt z SQLite zamiast API.
+
+Dla SPA z mniej niż 50 dealami cały odczyt to jeden round trip HTTP.
+Duże SPA bezpłciowe są czytane strumieniowo - tylko tyle, ile potrzeba.
+"""
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel
+from src.models import SPA, Deal, DealStage
+from src.business_logic import DealPromoter, QualificationValidator
+from .async_bitrix import AsyncBitrixService
+from .projection import deal_select
+from .deal_filters import qualification_filters
+from .deal_stream import stream_genderless_deals
+from .run_cache import RunCache, input_fingerprint
+from .local_store import LocalStore
+from .journal import PromotionJournal
+
+
+logger = logging.getLogger("spa_webhook.processor")
+
+
+def continuation_query(
+    base_filter: Dict[str, Any],
+    spa: SPA
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Zapytania dla kolejnych stron dealów, gdy SPA jest już znane
+    
+    - filtr kwalifikacji (data przyjazdu) po stronie Bitrix24
+    - projekcja zależna od typu SPA (bezpłciowe - bez płci i mieszkania)
+    
+    Returns:
+        Tuple[List[Dict], List[str]]: (filtry, select)
+    """
+    filters = [{**base_filter, **clauses} for clauses in qualification_filters(spa)]
+    return filters, deal_select(genderless=spa.is_genderless_order())
+
+
+class SPAProcessingResult(BaseModel):
+    """Wynik przetworzenia SPA (dane wejściowe, decyzje i wynik zapisu)"""
+    
+    spa: SPA
+    promoted: List[Deal]
+    reserve: List[Deal]
+    stats: Dict[str, Any]
+    dry_run: bool = False
+    updates_count: int = 0
+    update_results: Dict[str, Dict[str, Any]] = {}
+    fingerprint: Optional[str] = None
+    cached: bool = False
+    # Deale czytane strumieniowo (duże SPA bezpłciowe) - statystyki wejścia
+    # (total_input, qualified, rejected) dotyczą tylko pobranej części
+    streamed: bool = False
+
+
+def build_stage_updates(promoted: List[Deal], reserve: List[Deal]) -> List[Dict[str, str]]:
+    """
+    Zwraca listę zmian etapów do wysłania w batch
+    
+    - promoted → Lista Główna
+    - reserve → Rezerwa (tylko jeśli deal nie jest już w rezerwie)
+    """
+    updates = [
+        {"id": deal.id, "stage": DealStage.MAIN_LIST.value}
+        for deal in promoted
+    ]
+    
+    updates += [
+        {"id": deal.id, "stage": DealStage.RESERVE.value}
+        for deal in reserve
+        if deal.stage_id != DealStage.RESERVE.value
+    ]
+    
+    return updates
+
+
+async def fetch_spa_and_deals(
+    spa_id: int,
+    bitrix: AsyncBitrixService,
+    validator: Optional[QualificationValidator] = None
+) -> tuple:
+    """
+    Pobiera SPA oraz deale z Sortowania i Rezerwy
+    
+    SPA i pierwsza strona dealów (STAGE_ID IN [...]) idą w jednym `batch`.
+    Jeśli pierwsza strona była pełna, dalszy odczyt zależy od SPA:
+    - bezpłciowe: strumień w kolejności sortowania, do 3 * free_all
+      kwalifikujących się (deal_stream.stream_genderless_deals)
+    - płciowe: reszta z filtrami kwalifikacji i minimalną projekcją
+      (continuation_query), zakresy ID pobierane równolegle
+    
+    Args:
+        spa_id: ID projektu SPA
+        bitrix: Asynchroniczny klient
+        validator: Walidator kwalifikacji (do wczesnego zakończenia strumienia)
+    
+    Returns:
+        Tuple[SPA, List[Deal], bool]: SPA, deale i czy odczyt był strumieniowy
+            (tylko początek posortowanej listy)
+    """
+    validator = validator or QualificationValidator()
+    stages = [DealStage.SORTING, DealStage.RESERVE]
+    
+    base_filter = {
+        "STAGE_ID": [stage.value for stage in stages],
+        "UF_CRM_1740931330": str(spa_id),
+    }
+    
+    spa_data, first_page = await bitrix.get_spa_with_first_page(spa_id, base_filter, deal_select())
+    spa = SPA.from_api(spa_data)
+    streamed = False
+    
+    if len(first_page) < bitrix.service.PAGE_SIZE:
+        deals = [Deal.from_api(deal_data) for deal_data in first_page]
+    
+    elif spa.is_genderless_order():
+        # Wynik zależy tylko od początku posortowanej listy (promoted + 2x rezerwa)
+        target = 3 * max(0, spa.free_all)
+        logger.info(f"   Tryb strumieniowy: do {target} kwalifikujących się dealów")
+        deals = await stream_genderless_deals(
+            bitrix,
+            base_filter,
+            deal_select(genderless=True),
+            qualifies=lambda deal: validator.validate_all(deal, spa),
+            target=target,
+            first_page=first_page,
+        )
+        streamed = True
+    
+    else:
+        filters, select = continuation_query(base_filter, spa)
+        rest = await bitrix.list_deals_union(filters, select, after_id=int(first_page[-1]["ID"]))
+        deals = [Deal.from_api(deal_data) for deal_data in first_page + rest]
+    
+    for stage in stages:
+        stage_count = sum(1 for deal in deals if deal.stage_id == stage.value)
+        logger.info(f"   {stage.name}: {stage_count} dealów")
+    
+    return spa, deals, streamed
+
+
+def load_from_store(spa_id: int, store: LocalStore) -> Optional[Tuple[SPA, List[Deal]]]:
+    """
+    Odczyt SPA i dealów (SORTING + RESERVE) z kopii lokalnej
+    
+    Returns:
+        Optional[Tuple[SPA, List[Deal]]]: Dane lub None, jeśli SPA nie ma w kopii
+            (np. nie jest "W trakcie") - wtedy odczyt z API
+    """
+    spa_data = store.get_spa(spa_id)
+    if spa_data is None:
+        return None
+    
+    spa = SPA.from_api({"item": spa_data})
+    deals = [Deal.from_api(deal_data) for deal_data in store.deals_for_spa(spa_id)]
+    return spa, deals
+
+
+async def process_spa(
+    spa_id: int,
+    dry_run: bool = False,
+    bitrix: Optional[AsyncBitrixService] = None,
+    promoter: Optional[DealPromoter] = None,
+    cache: Optional[RunCache] = None,
+    store: Optional[LocalStore] = None,
+    journal: Optional[PromotionJournal] = None
+) -> SPAProcessingResult:
+    """
+    Przetwarza SPA: odczyt → decyzje (DealPromoter) → zapis etapów
+    
+    Args:
+        spa_id: ID projektu SPA
+        dry_run: True = bez zapisu w Bitrix24
+        bitrix: Asynchroniczny klient (domyślnie nowy)
+        promoter: DealPromoter (domyślnie nowy)
+        cache: Cache przebiegów (None = zawsze pełne przetwarzanie)
+        store: Kopia lokalna (None = odczyt z API); musi być odświeżona wcześniej
+        journal: Dziennik awansów (plan przed zapisem, wynik po każdej paczce)
+    
+    Returns:
+        SPAProcessingResult: Wynik przetwarzania
+    """
+    bitrix = bitrix or AsyncBitrixService()
+    promoter = promoter or DealPromoter()
+    
+    # KROK 1-2: Pobierz SPA i deale (kopia lokalna lub jeden batch)
+    loaded = load_from_store(spa_id, store) if store is not None else None
+    streamed = False
+    if loaded is not None:
+        logger.info(f"🗄️  SPA i deale z kopii lokalnej")
+        spa, deals = loaded
+    else:
+        logger.info(f"📦 Pobieranie SPA i dealów...")
+        spa, deals, streamed = await fetch_spa_and_deals(spa_id, bitrix, promoter.validator)
+    
+    logger.info(f"✅ SPA: {spa.title[:50]}")
+    logger.info(f"   Wolne wszystkie: {spa.free_all}")
+    logger.info(f"   Typ: {'Bezpłciowe' if spa.is_genderless_order() else 'Płciowe'}")
+    logger.info(f"✅ Łącznie: {len(deals)} dealów")
+    
+    # Dane bez zmian od ostatniego zakończonego przebiegu → poprzedni wynik
+    fingerprint = input_fingerprint(spa, deals)
+    if cache is not None:
+        previous = cache.get((spa_id, dry_run), fingerprint)
+        if previous is not None:
+            logger.info(f"♻️  Bez zmian od ostatniego przebiegu ({fingerprint[:8]}) - decyzje i zapis pominięte")
+            # Decyzje z poprzedniego przebiegu, ale bez jego zapisów - teraz nic nie wysłano
+            return previous.model_copy(update={"cached": True, "updates_count": 0, "update_results": {}})
+    
+    # KROK 3: Przetwórz
+    logger.info(f"⚙️  Przetwarzanie (walidacja, sortowanie, przydział)...")
+    promoted, reserve, stats = promoter.process(spa, deals)
+    
+    logger.info(f"✅ Wyniki:")
+    logger.info(f"   Kwalifikujące się: {stats['qualified']}")
+    logger.info(f"   Awansowane: {stats['promoted']}")
+    logger.info(f"   Do rezerwy: {stats['reserve']}")
+    logger.info(f"   Odrzucone: {stats['rejected']}")
+    
+    result = SPAProcessingResult(
+        spa=spa,
+        promoted=promoted,
+        reserve=reserve,
+        stats=stats,
+        dry_run=dry_run,
+        fingerprint=fingerprint,
+        streamed=streamed,
+    )
+    
+    if not dry_run:
+        # KROK 4: Aktualizuj etapy w Bitrix24 (batch, paczki równolegle)
+        await apply_stage_updates(bitrix, [result], journal)
+        logger.info(f"✅ ZAKOŃCZONO: {result.updates_count} zmian w Bitrix24")
+        
+        if store is not None:
+            # Kopia od razu z nowymi etapami (DATE_MODIFY przyjdzie z synchronizacją)
+            store.set_stages({
+                update["id"]: update["stage"]
+                for update in build_stage_updates(result.promoted, result.reserve)
+                if result.update_results.get(update["id"], {}).get("success")
+            })
+    
+    # Zapamiętaj tylko przebieg zakończony w całości (nieudany zapis → ponowienie)
+    if cache is not None and result.updates_count == len(result.update_results):
+        cache.put((spa_id, dry_run), fingerprint, result)
+    
+    return result
+
+
+async def apply_stage_updates(
+    bitrix: AsyncBitrixService,
+    results: List[SPAProcessingResult],
+    journal: Optional[PromotionJournal] = None
+) -> None:
+    """
+    Zapisuje zmiany etapów dla jednego lub wielu SPA (wspólne paczki batch)
+    
+    Zmiany wszystkich SPA idą razem w paczkach po 50 komend, a wyniki
+    są przypisywane z powrotem do SPA (update_results, updates_count).
+    
+    Z dziennikiem: plan wszystkich zmian trafia do niego przed pierwszym
+    zapisem, a wyniki - po każdej paczce (wznowienie po awarii: journal.py).
+    
+    Args:
+        bitrix: Asynchroniczny klient
+        results: Wyniki przetwarzania (bez dry-run)
+        journal: Dziennik awansów (None = bez dziennika)
+    """
+    updates_by_result = [
+        (result, build_stage_updates(result.promoted, result.reserve))
+        for result in results
+    ]
+    stage_updates = [update for _, updates in updates_by_result for update in updates]
+    
+    if not stage_updates:
+        return
+    
+    logger.info(f"💾 Aktualizacja {len(stage_updates)} etapów w Bitrix24...")
+    on_chunk = None
+    if journal is not None:
+        run_id = journal.plan({result.spa.id: updates for result, updates in updates_by_result if updates})
+        stage_by_deal = {update["id"]: update["stage"] for update in stage_updates}
+        on_chunk = lambda chunk: journal.record(run_id, stage_by_deal, chunk)
+    
+    outcomes = await bitrix.batch_update_stages(stage_updates, on_chunk=on_chunk)
+    
+    for result, updates in updates_by_result:
+        result.update_results = {update["id"]: outcomes.get(update["id"], {}) for update in updates}
+        
+        for update in updates:
+            outcome = result.update_results[update["id"]]
+            label = "Lista Główna" if update["stage"] == DealStage.MAIN_LIST.value else "Rezerwa"
+            
+            if outcome.get("success"):
+                result.updates_count += 1
+                logger.info(f"      ✅ Deal {update['id']} → {label}")
+            elif outcome.get("error"):
+                logger.error(f"      ❌ Deal {update['id']} - błąd: {outcome['error']}")
+            else:
+                logger.warning(f"      ⚠️  Deal {update['id']} - update zwrócił False")
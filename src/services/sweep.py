@@ -0,0 +1,157 @@
+"""
+Przegląd portfela - wszystkie aktywne SPA w kilku zapytaniach
+
+Przetwarzanie SPA po SPA kosztuje co najmniej jeden odczyt na SPA.
+Przegląd pobiera dane hurtowo:
+1. Wszystkie SPA "W trakcie" - jedno crm.item.list (keyset)
+2. Wszystkie deale SORTING + RESERVE tych SPA - jedno zapytanie crm.deal.list
+   z filtrem UF_CRM_1740931330 IN [...] (zakresy ID pobierane równolegle)
+3. Grupowanie dealów w pamięci i DealPromoter.process() dla każdego SPA
+4. Zapis zmian etapów wszystkich SPA we wspólnych paczkach batch
+
+Liczba wywołań API zależy od łącznej liczby dealów, nie od liczby SPA.
+
+Przegląd z zapisem zajmuje single-flight każdego SPA (klucz (spa_id, False),
+jak run_spa) od odczytu dealów do końca zapisu:
+- SPA z przebiegiem w toku (webhook, zadanie, zdarzenie, harmonogram) są pomijane
+- przebiegi tych SPA zlecone w trakcie przeglądu czekają i dostają jego wynik
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+from src.models import SPA, Deal, DealStage
+from src.business_logic import DealPromoter
+from .async_bitrix import AsyncBitrixService
+from .projection import DEAL_SPA_FIELD, sweep_deal_select
+from .spa_batch import open_spa_filter
+from .spa_processor import SPAProcessingResult, apply_stage_updates
+from .journal import PromotionJournal
+from .single_flight import SingleFlight
+
+
+logger = logging.getLogger("spa_webhook.sweep")
+
+
+def group_deals(deals: List[Deal], spa_ids: List[int]) -> Dict[int, List[Deal]]:
+    """
+    Grupuje deale według SPA (pole UF_CRM_1740931330)
+    
+    Args:
+        deals: Deale wszystkich SPA
+        spa_ids: ID SPA w przeglądzie (każde dostaje listę, także pustą)
+    
+    Returns:
+        Dict[int, List[Deal]]: Deale per SPA (kolejność wejściowa)
+    """
+    groups: Dict[int, List[Deal]] = defaultdict(list)
+    wanted = set(spa_ids)
+    
+    for deal in deals:
+        try:
+            spa_id = int(deal.spa_id_alt)
+        except (TypeError, ValueError):
+            continue
+        if spa_id in wanted:
+            groups[spa_id].append(deal)
+    
+    return {spa_id: groups.get(spa_id, []) for spa_id in spa_ids}
+
+
+async def sweep_open_spas(
+    dry_run: bool = False,
+    bitrix: Optional[AsyncBitrixService] = None,
+    promoter: Optional[DealPromoter] = None,
+    journal: Optional[PromotionJournal] = None,
+    flight: Optional[SingleFlight] = None
+) -> List[SPAProcessingResult]:
+    """
+    Przetwarza wszystkie SPA "W trakcie" z wolnymi miejscami
+    
+    Args:
+        dry_run: True = bez zapisu w Bitrix24
+        bitrix: Asynchroniczny klient (domyślnie nowy)
+        promoter: DealPromoter (domyślnie nowy)
+        journal: Dziennik awansów (None = bez dziennika)
+        flight: Single-flight przetwarzania SPA (None = bez koordynacji;
+            dry-run nie zajmuje SPA)
+    
+    Returns:
+        List[SPAProcessingResult]: Wyniki per SPA (rosnąco po ID SPA,
+            bez SPA pominiętych z powodu przebiegu w toku)
+    """
+    bitrix = bitrix or AsyncBitrixService()
+    promoter = promoter or DealPromoter()
+    
+    # KROK 1: Wszystkie aktywne SPA (pełne dane - limity, daty, typ)
+    spas = [SPA.from_api({"item": item}) for item in await bitrix.list_spas(open_spa_filter())]
+    spas = [spa for spa in spas if spa.free_all > 0]
+    logger.info(f"📋 Przegląd: {len(spas)} SPA 'W trakcie' z wolnymi miejscami")
+    
+    if flight is None or dry_run:
+        return await _sweep(spas, dry_run, bitrix, promoter, journal)
+    
+    # KROK 1b: Zajęcie SPA - pomijamy te, które właśnie przetwarza inny przebieg
+    keys = flight.claim([(spa.id, False) for spa in spas])
+    claimed = {spa_id for spa_id, _ in keys}
+    busy = [spa.id for spa in spas if spa.id not in claimed]
+    if busy:
+        logger.info(f"⏭️  Przegląd: pominięte SPA z przebiegiem w toku: {busy}")
+    
+    spas = [spa for spa in spas if spa.id in claimed]
+    try:
+        results = await _sweep(spas, dry_run, bitrix, promoter, journal)
+    except BaseException as error:
+        for key in keys:
+            flight.release(key, error=error)
+        raise
+    
+    # Przebiegi zlecone w trakcie przeglądu dostają jego wynik dla swojego SPA
+    by_spa = {result.spa.id: result for result in results}
+    for key in keys:
+        flight.release(key, by_spa[key[0]])
+    
+    return results
+
+
+async def _sweep(
+    spas: List[SPA],
+    dry_run: bool,
+    bitrix: AsyncBitrixService,
+    promoter: DealPromoter,
+    journal: Optional[PromotionJournal]
+) -> List[SPAProcessingResult]:
+    """Kroki 2-4 przeglądu dla wybranych SPA"""
+    if not spas:
+        return []
+    
+    # KROK 2: Deale wszystkich SPA jednym zapytaniem
+    deal_filter = {
+        "STAGE_ID": [DealStage.SORTING.value, DealStage.RESERVE.value],
+        DEAL_SPA_FIELD: [str(spa.id) for spa in spas],
+    }
+    deals = [Deal.from_api(data) for data in await bitrix.list_deals_parallel(deal_filter, sweep_deal_select())]
+    groups = group_deals(deals, [spa.id for spa in spas])
+    logger.info(f"✅ Przegląd: {len(deals)} dealów")
+    
+    # KROK 3: Decyzje per SPA (w pamięci)
+    results = []
+    for spa in spas:
+        promoted, reserve, stats = promoter.process(spa, groups[spa.id])
+        logger.info(
+            f"   SPA {spa.id}: wejście {stats['total_input']}, "
+            f"awans {stats['promoted']}, rezerwa {stats['reserve']}"
+        )
+        results.append(SPAProcessingResult(
+            spa=spa,
+            promoted=promoted,
+            reserve=reserve,
+            stats=stats,
+            dry_run=dry_run,
+        ))
+    
+    # KROK 4: Zapis - zmiany wszystkich SPA we wspólnych paczkach
+    if not dry_run:
+        await apply_stage_updates(bitrix, results, journal)
+        logger.info(f"✅ Przegląd: {sum(r.updates_count for r in results)} zmian w Bitrix24")
+    
+    return results
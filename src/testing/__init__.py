@@ -0,0 +1,6 @@
+"""
+Narzędzia testów obciążeniowych (lokalny zamiennik Bitrix24, dane syntetyczne)
+
+Moduły importowane bezpośrednio (bez re-eksportu) - `python -m` uruchamia
+je jako skrypty, a generator nie powinien ciągnąć za sobą Flaska.
+"""
@@ -0,0 +1,565 @@
+"""
+Lokalny zamiennik REST Bitrix24 do testów obciążeniowych
+
+Serwer Flask z metodami, których używa projekt:
+- crm.item.get, crm.item.list - SPA (entityTypeId=1032)
+- crm.deal.list - strony po 50, filtry (>, >=, <, <=, =, !, %, listy wartości),
+  sortowanie, start/next/total oraz start=-1 (bez COUNT, paginacja keyset)
+- crm.deal.update - zmiana pól (DATE_MODIFY ustawiane jak w portalu)
+- batch - do 50 komend "metoda?parametry" (halt), wyniki per komenda
+
+Stan portalu (PortalState) trzymany w pamięci - z pliku JSON lub wygenerowany
+(seed_portal → src/testing/generator.py). Zachowanie portalu produkcyjnego:
+- latency / jitter: opóźnienie każdej odpowiedzi (s)
+- error_rate: odsetek odpowiedzi HTTP 500 INTERNAL_SERVER_ERROR
+- rate_limit / rate_burst: leaky bucket jak w Bitrix24 - po przepełnieniu
+  HTTP 503 QUERY_LIMIT_EXCEEDED (batch liczy się jako jeden request)
+
+Użycie (webhook, sweep i zapisy przeciw zamiennikowi zamiast portalu):
+    python -m src.testing.bitrix_standin --port 8024 --spas 200 --deals-per-spa 500
+    BITRIX_SCHEME=http BITRIX_DOMAIN=localhost:8024 python -m src.webhook
+"""
+import argparse
+import fnmatch
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+from flask import Flask, jsonify, request
+from src.services.bitrix_service import SPA_ENTITY_TYPE_ID
+from src.services.projection import DEAL_SPA_FIELD
+from .generator import generate_portfolio
+
+
+PAGE_SIZE = 50
+MAX_BATCH_SIZE = 50
+
+# Operatory filtra Bitrix24 (dłuższe przed krótszymi - ">=" przed ">")
+FILTER_OPERATORS = ("!=", ">=", "<=", "=", ">", "<", "!", "%", "@")
+
+
+class StandinError(Exception):
+    """Błąd metody REST - odpowiedź {"error", "error_description"} z kodem HTTP"""
+    
+    def __init__(self, code: str, description: str = "", status: int = 400):
+        super().__init__(f"{code}: {description}")
+        self.code = code
+        self.description = description
+        self.status = status
+    
+    def payload(self) -> Dict[str, str]:
+        return {"error": self.code, "error_description": self.description}
+
+
+def _now() -> str:
+    """Czas w formacie portalu (ISO ze strefą, bez mikrosekund)"""
+    return datetime.now().astimezone().isoformat(timespec="seconds")
+
+
+# ============================================================================
+# Filtry, sortowanie, projekcja
+# ============================================================================
+
+def split_filter_key(key: str) -> Tuple[str, str]:
+    """Klucz filtra → (operator, pole), np. ">=UF_CRM_1" → (">=", "UF_CRM_1")"""
+    for operator in FILTER_OPERATORS:
+        if key.startswith(operator):
+            return operator, key[len(operator):]
+    return "", key
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def _comparable(value: Any) -> Tuple[int, Any]:
+    """
+    Wartość do porównań: (rodzaj, wartość) - liczba, data lub tekst
+    
+    Bitrix zwraca wszystko jako tekst ("123", "2026-03-01T10:00:00+01:00"),
+    a filtry porównują liczbowo i po dacie. Daty porównywane bez strefy
+    (czas lokalny zapisu), jak daty bez godziny w filtrach portalu.
+    """
+    if isinstance(value, (int, float)):
+        return 0, float(value)
+    
+    text = str(value)
+    try:
+        return 0, float(text)
+    except ValueError:
+        pass
+    try:
+        return 1, datetime.fromisoformat(text).replace(tzinfo=None)
+    except ValueError:
+        return 2, text
+
+
+def _equals(value: Any, expected: Any) -> bool:
+    if _is_empty(value) or _is_empty(expected):
+        return _is_empty(value) and _is_empty(expected)
+    return _comparable(value) == _comparable(expected)
+
+
+def matches_clause(operator: str, value: Any, expected: Any) -> bool:
+    """Czy wartość pola spełnia pojedynczą klauzulę filtra"""
+    if operator in ("", "=", "@"):
+        if isinstance(expected, list):
+            return any(_equals(value, item) for item in expected)
+        return _equals(value, expected)
+    
+    if operator in ("!", "!="):
+        return not matches_clause("", value, expected)
+    
+    if operator == "%":
+        return not _is_empty(value) and str(expected).lower() in str(value).lower()
+    
+    # Porównania: puste pole nigdy nie spełnia (jak NULL w SQL)
+    if _is_empty(value) or _is_empty(expected):
+        return False
+    left, right = _comparable(value), _comparable(expected)
+    if left[0] != right[0]:
+        return False
+    
+    return {
+        ">": left > right,
+        ">=": left >= right,
+        "<": left < right,
+        "<=": left <= right,
+    }[operator]
+
+
+def matches(record: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Czy rekord spełnia wszystkie klauzule filtra (AND)"""
+    for key, expected in filter.items():
+        operator, field = split_filter_key(key)
+        if not matches_clause(operator, record.get(field), expected):
+            return False
+    return True
+
+
+def _sort_key(value: Any) -> tuple:
+    """Puste wartości pierwsze przy ASC (jak NULL w MySQL)"""
+    return (0,) if _is_empty(value) else (1, *_comparable(value))
+
+
+def sort_records(records: Iterable[Dict[str, Any]], order: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Sortowanie wielokluczowe (stabilne - od ostatniego klucza)"""
+    rows = list(records)
+    for field, direction in reversed(list(order.items())):
+        rows.sort(key=lambda row: _sort_key(row.get(field)), reverse=str(direction).upper() == "DESC")
+    return rows
+
+
+def project(record: Dict[str, Any], select: Optional[List[str]], id_field: str) -> Dict[str, Any]:
+    """
+    Pola z `select` (ID zawsze, wzorce "*", "UF_*", "ufCrm*")
+    
+    Wybrane pola bez wartości wracają jako None - jak w portalu.
+    """
+    if not select or "*" in select:
+        return dict(record)
+    
+    projected = {id_field: record.get(id_field)}
+    for field in select:
+        if "*" in field:
+            projected.update({key: value for key, value in record.items() if fnmatch.fnmatchcase(key, field)})
+        else:
+            projected[field] = record.get(field)
+    return projected
+
+
+def paginate(rows: List[Dict[str, Any]], start: Any) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Strona po 50 rekordów
+    
+    Returns:
+        Tuple[List, Dict]: (strona, {"total", "next"}) - start=-1 bez total/next
+    """
+    start = int(start) if start not in (None, "") else 0
+    if start < 0:
+        return rows[:PAGE_SIZE], {}
+    
+    extra = {"total": len(rows)}
+    if start + PAGE_SIZE < len(rows):
+        extra["next"] = start + PAGE_SIZE
+    return rows[start:start + PAGE_SIZE], extra
+
+
+def parse_query(query: str) -> Dict[str, Any]:
+    """
+    Parametry komendy batch ("filter[STAGE_ID][0]=...&start=-1") → słownik
+    
+    Odwrotność kodowania PHP (b24pysdk encode_params): zagnieżdżone klucze
+    w nawiasach, słowniki o kluczach 0..n-1 zamieniane na listy.
+    """
+    params: Dict[str, Any] = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        head, _, rest = key.partition("[")
+        path = [head] + (rest[:-1].split("][") if rest else [])
+        
+        node = params
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        node[path[-1] or str(len(node))] = value
+    
+    return _as_lists(params)
+
+
+def _as_lists(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    
+    converted = {key: _as_lists(item) for key, item in value.items()}
+    if converted and list(converted) == [str(index) for index in range(len(converted))]:
+        return list(converted.values())
+    return converted
+
+
+# ============================================================================
+# Stan portalu
+# ============================================================================
+
+class PortalState:
+    """SPA i deale portalu w pamięci (bezpieczne wątkowo)"""
+    
+    def __init__(self, spas: Iterable[Dict[str, Any]] = (), deals: Iterable[Dict[str, Any]] = ()):
+        """
+        Args:
+            spas: Surowe SPA (jak crm.item.get "item")
+            deals: Surowe deale (jak crm.deal.list)
+        """
+        self._lock = threading.RLock()
+        self.spas: Dict[int, Dict[str, Any]] = {int(spa["id"]): dict(spa) for spa in spas}
+        self.deals: Dict[int, Dict[str, Any]] = {}
+        # Indeks SPA → ID dealów (zapytania webhooka filtrują po polu SPA)
+        self._deals_by_spa: Dict[str, set] = defaultdict(set)
+        
+        for deal in deals:
+            deal = dict(deal)
+            self.deals[int(deal["ID"])] = deal
+            self._deals_by_spa[str(deal.get(DEAL_SPA_FIELD))].add(int(deal["ID"]))
+    
+    @classmethod
+    def load(cls, path: str) -> "PortalState":
+        """Stan z pliku JSON ({"spas": [...], "deals": [...]})"""
+        with open(path, encoding="utf-8") as state_file:
+            data = json.load(state_file)
+        return cls(data.get("spas", []), data.get("deals", []))
+    
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as state_file:
+            json.dump(self.to_dict(), state_file, ensure_ascii=False)
+    
+    def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            return {"spas": list(self.spas.values()), "deals": list(self.deals.values())}
+    
+    def get_spa(self, spa_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            spa = self.spas.get(spa_id)
+            return dict(spa) if spa else None
+    
+    def list_spas(self, filter: Dict[str, Any], order: Dict[str, str]) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sort_records([spa for spa in self.spas.values() if matches(spa, filter)], order)
+    
+    def list_deals(self, filter: Dict[str, Any], order: Dict[str, str]) -> List[Dict[str, Any]]:
+        with self._lock:
+            spa_id = filter.get(DEAL_SPA_FIELD)
+            if isinstance(spa_id, (str, int)) and spa_id != "":
+                candidates = (self.deals[deal_id] for deal_id in self._deals_by_spa.get(str(spa_id), ()))
+            else:
+                candidates = self.deals.values()
+            return sort_records([deal for deal in candidates if matches(deal, filter)], order)
+    
+    def update_deal(self, deal_id: int, fields: Dict[str, Any]) -> bool:
+        """
+        Zmienia pola deala (DATE_MODIFY = teraz)
+        
+        Returns:
+            bool: False jeśli deal nie istnieje
+        """
+        with self._lock:
+            deal = self.deals.get(deal_id)
+            if deal is None:
+                return False
+            
+            self._deals_by_spa[str(deal.get(DEAL_SPA_FIELD))].discard(deal_id)
+            deal.update(fields)
+            deal["DATE_MODIFY"] = _now()
+            self._deals_by_spa[str(deal.get(DEAL_SPA_FIELD))].add(deal_id)
+            return True
+
+
+def seed_portal(spa_count: int = 20, deals_per_spa: int = 100, seed: int = 0, closed_share: float = 0.2) -> PortalState:
+    """
+    Syntetyczny portal z generatora (rozkłady zbliżone do produkcji)
+    
+    Args:
+        spa_count: Liczba SPA "W trakcie"
+        deals_per_spa: Średnio dealów na SPA (rozkład nierówny)
+        seed: Ziarno losowania (ten sam seed = ten sam portal)
+        closed_share: Udział dealów poza Sortowaniem / Rezerwą
+    
+    Returns:
+        PortalState: Stan do BitrixStandin
+    """
+    return generate_portfolio(spa_count, spa_count * deals_per_spa, seed, closed_share=closed_share).portal_state()
+
+
+# ============================================================================
+# Metody REST
+# ============================================================================
+
+def _check_entity(params: Dict[str, Any]):
+    if str(params.get("entityTypeId")) != str(SPA_ENTITY_TYPE_ID):
+        raise StandinError("NOT_FOUND", f"Smart process {params.get('entityTypeId')} not found")
+
+
+def crm_item_get(state: PortalState, params: Dict[str, Any]) -> Tuple[Any, Dict[str, int]]:
+    _check_entity(params)
+    spa = state.get_spa(int(params.get("id") or 0))
+    if spa is None:
+        raise StandinError("NOT_FOUND", "Element not found")
+    return {"item": spa}, {}
+
+
+def crm_item_list(state: PortalState, params: Dict[str, Any]) -> Tuple[Any, Dict[str, int]]:
+    _check_entity(params)
+    items = state.list_spas(params.get("filter") or {}, params.get("order") or {"id": "ASC"})
+    page, extra = paginate(items, params.get("start"))
+    return {"items": [project(item, params.get("select"), "id") for item in page]}, extra
+
+
+def crm_deal_list(state: PortalState, params: Dict[str, Any]) -> Tuple[Any, Dict[str, int]]:
+    deals = state.list_deals(params.get("filter") or {}, params.get("order") or {"ID": "ASC"})
+    page, extra = paginate(deals, params.get("start"))
+    return [project(deal, params.get("select"), "ID") for deal in page], extra
+
+
+def crm_deal_update(state: PortalState, params: Dict[str, Any]) -> Tuple[Any, Dict[str, int]]:
+    if not state.update_deal(int(params.get("id") or 0), params.get("fields") or {}):
+        raise StandinError("NOT_FOUND", "Deal not found")
+    return True, {}
+
+
+METHODS: Dict[str, Callable[[PortalState, Dict[str, Any]], Tuple[Any, Dict[str, int]]]] = {
+    "crm.item.get": crm_item_get,
+    "crm.item.list": crm_item_list,
+    "crm.deal.list": crm_deal_list,
+    "crm.deal.update": crm_deal_update,
+}
+
+
+def run_batch(state: PortalState, params: Dict[str, Any]) -> Tuple[Any, Dict[str, int]]:
+    """
+    batch - komendy wykonywane po kolei, błąd komendy nie przerywa reszty (chyba że halt)
+    
+    Puste sekcje wyniku jako [] - tak odpowiada portal.
+    """
+    commands = params.get("cmd") or {}
+    if len(commands) > MAX_BATCH_SIZE:
+        raise StandinError("ERROR_BATCH_LENGTH_EXCEEDED", f"Max batch length exceeded ({MAX_BATCH_SIZE})")
+    halt = str(params.get("halt", 0)).lower() not in ("0", "", "false")
+    
+    result, errors, totals, nexts = {}, {}, {}, {}
+    for key, command in commands.items():
+        method, _, query = str(command).partition("?")
+        try:
+            handler = METHODS.get(method)
+            if handler is None:
+                raise StandinError("ERROR_METHOD_NOT_FOUND", "Method not found!")
+            result[key], extra = handler(state, parse_query(query))
+        except StandinError as error:
+            errors[key] = error.payload()
+            if halt:
+                break
+            continue
+        
+        if "total" in extra:
+            totals[key] = extra["total"]
+        if "next" in extra:
+            nexts[key] = extra["next"]
+    
+    return {
+        "result": result or [],
+        "result_error": errors or [],
+        "result_total": totals or [],
+        "result_next": nexts or [],
+        "result_time": [],
+    }, {}
+
+
+# ============================================================================
+# Serwer
+# ============================================================================
+
+class BitrixStandin:
+    """Zamiennik portalu: stan, opóźnienia, błędy, limit zapytań, liczniki"""
+    
+    def __init__(
+        self,
+        state: PortalState,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: Optional[float] = None,
+        rate_burst: int = 50,
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            state: Stan portalu
+            latency: Stałe opóźnienie odpowiedzi (s)
+            jitter: Dodatkowe losowe opóźnienie 0..jitter (s)
+            error_rate: Odsetek odpowiedzi 500 (0..1)
+            rate_limit: Tempo wycieku leaky bucket (req/s), None = bez limitu
+            rate_burst: Pojemność kubełka (Bitrix24: 50)
+            seed: Ziarno losowania opóźnień i błędów
+            clock, sleep: Podmieniane w testach
+        """
+        self.state = state
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self._random = random.Random(seed)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        
+        # Leaky bucket
+        self._level = 0.0
+        self._drained_at = clock()
+        
+        # Liczniki
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.throttled = 0
+        self.injected_errors = 0
+    
+    def handle(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """
+        Obsługa jednego requestu REST
+        
+        Returns:
+            Tuple[int, Dict]: (status HTTP, odpowiedź JSON)
+        """
+        started = time.time()
+        with self._lock:
+            self.requests[method] += 1
+            throttled = not self._admit()
+            failed = not throttled and self._random.random() < self.error_rate
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            self.throttled += throttled
+            self.injected_errors += failed
+        
+        if delay > 0:
+            self._sleep(delay)
+        
+        if throttled:
+            return 503, StandinError("QUERY_LIMIT_EXCEEDED", "Too many requests").payload()
+        if failed:
+            return 500, StandinError("INTERNAL_SERVER_ERROR", "Injected error").payload()
+        
+        handler = run_batch if method == "batch" else METHODS.get(method)
+        if handler is None:
+            return 404, StandinError("ERROR_METHOD_NOT_FOUND", "Method not found!").payload()
+        
+        try:
+            result, extra = handler(self.state, params)
+        except StandinError as error:
+            return error.status, error.payload()
+        
+        finished = time.time()
+        return 200, {
+            "result": result,
+            **extra,
+            "time": {"start": started, "finish": finished, "duration": finished - started},
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "throttled": self.throttled,
+                "injected_errors": self.injected_errors,
+                "spas": len(self.state.spas),
+                "deals": len(self.state.deals),
+            }
+    
+    def create_app(self) -> Flask:
+        """Aplikacja Flask: /rest/<user>/<klucz>/<metoda>[.json] i /stats"""
+        app = Flask("bitrix_standin")
+        
+        @app.route("/rest/<user_id>/<key>/<method>", methods=["GET", "POST"])
+        def rest(user_id, key, method):
+            params = request.get_json(silent=True)
+            if not isinstance(params, dict):
+                params = parse_query(request.query_string.decode())
+                params.update(parse_query(request.get_data(as_text=True)))
+            
+            status, payload = self.handle(method.removesuffix(".json"), params)
+            return jsonify(payload), status
+        
+        @app.route("/stats", methods=["GET"])
+        def stats():
+            return jsonify(self.stats())
+        
+        return app
+    
+    def _admit(self) -> bool:
+        """Leaky bucket: czy request mieści się w limicie (wywoływane pod blokadą)"""
+        if self.rate_limit is None:
+            return True
+        
+        now = self._clock()
+        self._level = max(0.0, self._level - (now - self._drained_at) * self.rate_limit)
+        self._drained_at = now
+        
+        if self._level + 1 > self.rate_burst:
+            return False
+        self._level += 1
+        return True
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Lokalny zamiennik REST Bitrix24 (testy obciążeniowe)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8024)
+    parser.add_argument("--state", help="Plik JSON stanu portalu (domyślnie: wygenerowany)")
+    parser.add_argument("--spas", type=int, default=20, help="Liczba SPA (generator)")
+    parser.add_argument("--deals-per-spa", type=int, default=100, help="Średnio dealów na SPA (generator)")
+    parser.add_argument("--closed-share", type=float, default=0.2, help="Udział dealów poza Sortowaniem / Rezerwą")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Opóźnienie odpowiedzi (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Losowe dodatkowe opóźnienie (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Odsetek odpowiedzi 500 (0..1)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Limit req/s (0 = bez limitu)")
+    parser.add_argument("--rate-burst", type=int, default=50)
+    args = parser.parse_args(argv)
+    
+    state = PortalState.load(args.state) if args.state else seed_portal(args.spas, args.deals_per_spa, args.seed, args.closed_share)
+    standin = BitrixStandin(
+        state,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit or None,
+        rate_burst=args.rate_burst,
+        seed=args.seed,
+    )
+    
+    print(f"🧪 Zamiennik Bitrix24: http://{args.host}:{args.port} ({len(state.spas)} SPA, {len(state.deals)} dealów)")
+    print(f"   BITRIX_SCHEME=http BITRIX_DOMAIN={args.host}:{args.port}")
+    standin.create_app().run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
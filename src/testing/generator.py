@@ -0,0 +1,243 @@
+"""
+Generator syntetycznych portfeli SPA i dealów (testy skali i benchmarki)
+
+Ręcznie pisane fikstury (tests/conftest.py) to kilka idealnych rekordów.
+Produkcja wygląda inaczej - generator odtwarza jej kształt:
+- mix SPA: ~40% bezpłciowych, reszta z limitami per kategoria (płeć x mieszkanie)
+- liczniki wolnych miejsc często zerowe lub UJEMNE (nadkomplet)
+- płeć: M ~60%, K ~30%, PARY ~10%; mieszkanie: nasze ~65%, własne ~35%
+  (po kilka % dealów bez płci / mieszkania)
+- priorytet przesunięty w stronę niższych (P1 rzadko, P4 najczęściej)
+- brak wieku (~25%), daty przyjazdu (~30%) i daty EXECUTING (~20%)
+- daty przyjazdu skupione wokół 1-3 terminów per SPA (turnusy przed szkoleniem)
+- nierówny rozkład dealów na SPA (kilka dużych projektów, długi ogon)
+
+Ten sam seed = identyczne dane. Wynik w trzech postaciach:
+- surowe słowniki jak z API (crm.item.get "item", crm.deal.list)
+- modele (SPA.from_api / Deal.from_api)
+- stan lokalnego zamiennika Bitrix24 (Portfolio.portal_state())
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from src.models import SPA, Deal, DealStage, SPAStage, DealPriority, Gender, Housing, GenderlessOrder, SPAPriorityType
+from src.services.projection import DEAL_SPA_FIELD, field_aliases
+
+
+# Udziały wartości (przybliżone proporcje z portalu produkcyjnego)
+GENDER_WEIGHTS = {Gender.MALE: 60, Gender.FEMALE: 30, Gender.COUPLE: 10}
+HOUSING_WEIGHTS = {Housing.OURS: 65, Housing.OWN: 35}
+PRIORITY_WEIGHTS = {DealPriority.P1: 10, DealPriority.P2: 20, DealPriority.P3: 30, DealPriority.P4: 35, None: 5}
+OPEN_STAGE_WEIGHTS = {DealStage.SORTING: 75, DealStage.RESERVE: 25}
+CLOSED_STAGES = (DealStage.MAIN_LIST, DealStage.IN_PROGRESS, DealStage.NOT_ARRIVED, DealStage.NOT_HIRING)
+
+GENDERLESS_SHARE = 0.4
+MISSING_GENDER_SHARE = 0.05
+MISSING_HOUSING_SHARE = 0.05
+MISSING_AGE_SHARE = 0.25
+MISSING_ARRIVAL_SHARE = 0.3
+MISSING_EXECUTING_SHARE = 0.2
+
+# Strefa portalu w datach z API ("2026-03-01T10:00:00+03:00")
+PORTAL_TZ = "+03:00"
+
+FREE_ALL, GENDERLESS, AGE_LIMIT, TRAINING_DATE, ARRIVAL_FROM, ARRIVAL_TO = field_aliases(SPA, (
+    "free_all", "is_genderless", "age_limit", "training_date", "arrival_from", "arrival_to",
+))
+FREE_CATEGORY_FIELDS = field_aliases(SPA, (
+    "free_m_ours", "free_k_ours", "free_couple_ours", "free_m_own", "free_k_own", "free_couple_own",
+))
+PRIORITY_FIELDS = field_aliases(SPA, ("priority_1", "priority_2", "priority_3"))
+(
+    DEAL_PRIORITY, DEAL_GENDER, DEAL_HOUSING, DEAL_AGE, DEAL_ARRIVAL, DEAL_EXECUTING,
+) = field_aliases(Deal, ("priority", "gender", "housing", "age", "arrival_date", "executing_date"))
+
+
+def portal_date(value: datetime) -> str:
+    """Data w formacie API Bitrix24 (strefa portalu, bez mikrosekund)"""
+    return value.replace(microsecond=0).isoformat() + PORTAL_TZ
+
+
+class Portfolio:
+    """Wygenerowane SPA i deale (surowe dane API)"""
+    
+    def __init__(self, spas: List[Dict[str, Any]], deals: List[Dict[str, Any]]):
+        self.spas = spas
+        self.deals = deals
+    
+    def spa_models(self) -> List[SPA]:
+        return [SPA.from_api({"item": spa}) for spa in self.spas]
+    
+    def deal_models(self) -> List[Deal]:
+        return [Deal.from_api(deal) for deal in self.deals]
+    
+    def deals_for(self, spa_id: int) -> List[Dict[str, Any]]:
+        """Surowe deale przypisane do SPA"""
+        return [deal for deal in self.deals if deal.get(DEAL_SPA_FIELD) == str(spa_id)]
+    
+    def portal_state(self):
+        """
+        Stan lokalnego zamiennika Bitrix24
+        
+        Import w metodzie - zamiennik wymaga Flaska, generator nie.
+        """
+        from .bitrix_standin import PortalState
+        return PortalState(self.spas, self.deals)
+
+
+class PortfolioGenerator:
+    """Generator SPA i dealów o rozkładach zbliżonych do produkcji"""
+    
+    def __init__(self, seed: int = 0, now: Optional[datetime] = None):
+        """
+        Args:
+            seed: Ziarno losowania (ten sam seed = te same dane)
+            now: Punkt odniesienia dat (domyślnie teraz - daty przyjazdu w przyszłości)
+        """
+        self.rng = random.Random(seed)
+        self.now = (now or datetime.now()).replace(microsecond=0)
+        # Terminy przyjazdów per SPA (klastry dat)
+        self._arrival_clusters: Dict[int, List[datetime]] = {}
+    
+    def spa(self, spa_id: int, genderless: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Surowe SPA "W trakcie" (jak crm.item.get "item")
+        
+        Args:
+            spa_id: ID SPA
+            genderless: Wymuszony typ zamówienia (None = losowany)
+        """
+        rng = self.rng
+        if genderless is None:
+            genderless = rng.random() < GENDERLESS_SHARE
+        
+        spa = {
+            "id": spa_id,
+            "title": f"SPA {spa_id}",
+            "stageId": SPAStage.IN_PROGRESS.value,
+            FREE_ALL: self._free_counter(25),
+            GENDERLESS: int((GenderlessOrder.YES if genderless else GenderlessOrder.NO).value),
+            AGE_LIMIT: rng.choice((None, None, 35, 40, 45, 50, 55)),
+            "updatedTime": portal_date(self.now - timedelta(minutes=rng.randint(0, 600))),
+        }
+        
+        # Limity kategorii tylko w SPA płciowych (w bezpłciowych zwykle zera)
+        for field in FREE_CATEGORY_FIELDS:
+            spa[field] = 0 if genderless else self._free_counter(8)
+        
+        # Szkolenie i okno przyjazdów
+        training = None
+        if rng.random() < 0.7:
+            training = self.now + timedelta(days=rng.randint(7, 45))
+            spa[TRAINING_DATE] = portal_date(training)
+            if rng.random() < 0.5:
+                spa[ARRIVAL_FROM] = portal_date(training - timedelta(days=21))
+            if rng.random() < 0.4:
+                spa[ARRIVAL_TO] = portal_date(training - timedelta(days=1))
+        
+        # Priorytety dynamiczne (Priority 1/2/3) - ustawiane w części projektów
+        for level, field in enumerate(PRIORITY_FIELDS, start=1):
+            if rng.random() < 0.5:
+                candidates = [p for p in SPAPriorityType if p.name.endswith(f"_P{level}")]
+                spa[field] = rng.choice(candidates).value
+        
+        anchor = training or self.now + timedelta(days=rng.randint(10, 40))
+        self._arrival_clusters[spa_id] = [
+            anchor - timedelta(days=rng.randint(2, 20))
+            for _ in range(rng.randint(1, 3))
+        ]
+        return spa
+    
+    def deal(self, deal_id: int, spa_id: int, stage: Optional[DealStage] = None) -> Dict[str, Any]:
+        """
+        Surowy deal (jak crm.deal.list) przypisany do SPA
+        
+        Args:
+            deal_id: ID deala
+            spa_id: ID SPA (pole UF_CRM_1740931330)
+            stage: Wymuszony etap (None = Sortowanie / Rezerwa wg udziałów)
+        """
+        rng = self.rng
+        stage = stage or self._weighted(OPEN_STAGE_WEIGHTS)
+        priority = self._weighted(PRIORITY_WEIGHTS)
+        created = self.now - timedelta(days=rng.expovariate(1 / 20), minutes=rng.randint(0, 1440))
+        
+        deal = {
+            "ID": str(deal_id),
+            "TITLE": f"Kandydat {deal_id}",
+            "STAGE_ID": stage.value,
+            DEAL_SPA_FIELD: str(spa_id),
+            DEAL_PRIORITY: priority.value if priority else None,
+            DEAL_GENDER: None if rng.random() < MISSING_GENDER_SHARE else self._weighted(GENDER_WEIGHTS).value,
+            DEAL_HOUSING: None if rng.random() < MISSING_HOUSING_SHARE else self._weighted(HOUSING_WEIGHTS).value,
+            DEAL_AGE: None if rng.random() < MISSING_AGE_SHARE else str(int(rng.triangular(18, 62, 29))),
+            DEAL_ARRIVAL: None,
+            DEAL_EXECUTING: None,
+            "DATE_CREATE": portal_date(created),
+            "DATE_MODIFY": portal_date(min(self.now, created + timedelta(days=rng.expovariate(1 / 3)))),
+        }
+        
+        clusters = self._arrival_clusters.get(spa_id)
+        if clusters and rng.random() >= MISSING_ARRIVAL_SHARE:
+            arrival = rng.choice(clusters) + timedelta(days=round(rng.gauss(0, 2)))
+            deal[DEAL_ARRIVAL] = portal_date(arrival.replace(hour=0, minute=0, second=0))
+        if rng.random() >= MISSING_EXECUTING_SHARE:
+            deal[DEAL_EXECUTING] = portal_date(created + timedelta(hours=rng.randint(1, 72)))
+        
+        return deal
+    
+    def deals(self, spa: Dict[str, Any], count: int, first_id: int = 1) -> List[Dict[str, Any]]:
+        """`count` surowych dealów jednego SPA (Sortowanie / Rezerwa), ID od first_id"""
+        return [self.deal(deal_id, spa["id"]) for deal_id in range(first_id, first_id + count)]
+    
+    def portfolio(
+        self,
+        spa_count: int,
+        deal_count: int,
+        closed_share: float = 0.0,
+        genderless: Optional[bool] = None
+    ) -> Portfolio:
+        """
+        Portfel N SPA i M dealów
+        
+        Deale rozkładane nierówno (wagi 1/ranga^0.8 - kilka dużych projektów,
+        długi ogon małych).
+        
+        Args:
+            spa_count: Liczba SPA
+            deal_count: Łączna liczba dealów
+            closed_share: Udział dealów w etapach poza Sortowaniem / Rezerwą
+                (realistyczny portal dla zamiennika - filtry mają co odrzucać)
+            genderless: Wymuszony typ wszystkich SPA (None = mix)
+        
+        Returns:
+            Portfolio: Surowe SPA i deale
+        """
+        spas = [self.spa(spa_id, genderless) for spa_id in range(1, spa_count + 1)]
+        spa_ids = [spa["id"] for spa in spas]
+        weights = [1 / rank ** 0.8 for rank in range(1, spa_count + 1)]
+        self.rng.shuffle(weights)
+        
+        deals = []
+        for deal_id, spa_id in enumerate(self.rng.choices(spa_ids, weights, k=deal_count), start=1):
+            stage = self.rng.choice(CLOSED_STAGES) if self.rng.random() < closed_share else None
+            deals.append(self.deal(deal_id, spa_id, stage))
+        
+        return Portfolio(spas, deals)
+    
+    def _free_counter(self, high: int) -> int:
+        """Licznik wolnych miejsc: ~15% ujemnych (nadkomplet), ~20% zer, reszta 1..high"""
+        roll = self.rng.random()
+        if roll < 0.15:
+            return -self.rng.randint(1, 5)
+        if roll < 0.35:
+            return 0
+        return self.rng.randint(1, high)
+    
+    def _weighted(self, weights: Dict[Any, int]) -> Any:
+        return self.rng.choices(list(weights), list(weights.values()))[0]
+
+
+def generate_portfolio(spa_count: int, deal_count: int, seed: int = 0, **kwargs) -> Portfolio:
+    """Skrót: PortfolioGenerator(seed).portfolio(spa_count, deal_count, ...)"""
+    return PortfolioGenerator(seed).portfolio(spa_count, deal_count, **kwargs)
@@ -8,13 +8,26 @@ GET /webhook/spa/<spa_id>
 Zwraca JSON z wynikami przetwarzania.
 """
 import os
+import json
+import asyncio
 import logging
-from flask import Flask, request, jsonify
+import threading
+from flask import Flask, Response, request, jsonify
 from datetime import datetime
-from src.config import get_bitrix_client
-from src.models import SPA, Deal, DealStage
 from src.business_logic import DealPromoter
-from src.services import BitrixService
+from src.services import SPAProcessingResult, process_spa
+from src.services.rate_limiter import get_rate_limiter
+from src.services.resilience import CircuitBreaker, get_circuit_breaker
+from src.services.hedging import get_hedge_policy
+from src.services.single_flight import get_spa_flight
+from src.services.run_cache import get_run_cache
+from src.services.local_store import get_store_sync
+from src.services.journal import get_journal, resume_pending
+from src.services.jobs import JobQueueFullError, get_job_manager
+from src.services.spa_batch import open_spa_ids, run_batch
+from src.services.sweep import sweep_open_spas
+from src.services.scheduler import get_scheduler
+from src.webhooks import register_bitrix_events
 from src.utils.logger import setup_logger
 
 app = Flask(__name__)
@@ -34,6 +47,162 @@ def health_check():
     })
 
 
+@app.route('/health/bitrix', methods=['GET'])
+def bitrix_health_check():
+    """Stan połączenia z Bitrix24 (rate limiter, circuit breaker)"""
+    breaker = get_circuit_breaker().stats()
+    hedging = get_hedge_policy()
+    run_cache = get_run_cache()
+    store_sync = get_store_sync()
+    
+    return jsonify({
+        "status": "healthy" if breaker["state"] == CircuitBreaker.CLOSED else "degraded",
+        "rate_limiter": get_rate_limiter().stats(),
+        "circuit_breaker": breaker,
+        "hedging": hedging.stats() if hedging else None,
+        "run_cache": run_cache.stats() if run_cache else None,
+        "local_store": store_sync.stats() if store_sync else None,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def success_payload(result: SPAProcessingResult, shared: bool = False) -> dict:
+    """Wynik JSON przetworzenia SPA z zapisem (webhook, zadania, batch)"""
+    spa, promoted, stats = result.spa, result.promoted, result.stats
+    
+    return {
+        "status": "success",
+        "spa_id": spa.id,
+        "spa_title": spa.title,
+        "spa_type": "genderless" if spa.is_genderless_order() else "gendered",
+        "free_all": spa.free_all,
+        "stats": {
+            "total_input": stats["total_input"],
+            "qualified": stats["qualified"],
+            "promoted": stats["promoted"],
+            "reserve": stats["reserve"],
+            "rejected": stats["rejected"],
+            "updates_executed": result.updates_count,
+        },
+        "category_allocation": stats.get("category_stats", {}),
+        "promoted_deals": [
+            {
+                "id": d.id,
+                "title": d.title,
+                "priority": d.priority,
+                "category": stats["assignments"].get(d.id) if "assignments" in stats else None
+            }
+            for d in promoted
+        ],
+        "summary": DealPromoter().get_promotion_summary(stats),
+        "shared": shared,
+        "cached": result.cached,
+        "streamed": result.streamed,
+        "fingerprint": result.fingerprint,
+    }
+
+
+def dry_run_payload(result: SPAProcessingResult) -> dict:
+    """Wynik JSON dry-run (decyzje bez zapisu)"""
+    spa, stats = result.spa, result.stats
+    
+    return {
+        "status": "dry-run",
+        "spa_id": spa.id,
+        "spa_title": spa.title,
+        "spa_type": "genderless" if spa.is_genderless_order() else "gendered",
+        "stats": stats,
+        "would_promote": [d.id for d in result.promoted],
+        "would_reserve": [d.id for d in result.reserve],
+        "summary": DealPromoter().get_promotion_summary(stats),
+        "note": "Dry-run: Żadne dane nie zostały zmienione w Bitrix24",
+        "cached": result.cached,
+        "streamed": result.streamed,
+        "fingerprint": result.fingerprint,
+    }
+
+
+def conditional_json(payload: dict) -> Response:
+    """
+    Odpowiedź JSON z ETag = odcisk danych wejściowych
+    
+    GET z If-None-Match równym odciskowi → 304 bez treści (dane bez zmian) -
+    tylko dla wyniku z cache i dry-run. Przebieg z zapisem zawsze zwraca 200
+    z liczbą zapisów (klient musi wiedzieć, że etapy dealów się zmieniły).
+    """
+    response = jsonify(payload)
+    if payload.get("fingerprint"):
+        response.set_etag(payload["fingerprint"])
+    if payload.get("cached") or payload.get("status") == "dry-run":
+        return response.make_conditional(request)
+    return response
+
+
+def fresh_local_store():
+    """
+    Kopia lokalna odświeżona przyrostowo przed przebiegiem (LOCAL_STORE_PATH)
+    
+    Returns:
+        Optional[LocalStore]: Kopia lub None - odczyt z API (kopia wyłączona
+            albo pierwsza pełna synchronizacja jeszcze trwa)
+    """
+    store_sync = get_store_sync()
+    if store_sync is None or not store_sync.ensure_fresh():
+        return None
+    return store_sync.store
+
+
+def run_spa(spa_id: int) -> dict:
+    """
+    Przetwarza SPA (pobranie, decyzje, zapis) i buduje wynik JSON
+    
+    Jeden przebieg per SPA naraz - wywołania w trakcie (ponowienia n8n,
+    zadania w tle) dostają wynik przebiegu w toku.
+    
+    Args:
+        spa_id: ID projektu SPA
+    
+    Returns:
+        dict: Wynik przetwarzania (status, stats, promoted_deals, summary)
+    """
+    logger.info(f"=" * 80)
+    logger.info(f"🚀 START przetwarzania SPA ID: {spa_id}")
+    logger.info(f"=" * 80)
+    
+    # KROK 1-4: Pobierz (równolegle), przetwórz i zapisz (batch)
+    result, shared = get_spa_flight().do(
+        (spa_id, False),
+        lambda: asyncio.run(process_spa(
+            spa_id,
+            promoter=DealPromoter(),
+            cache=get_run_cache(),
+            store=fresh_local_store(),
+            journal=get_journal(),
+        ))
+    )
+    if shared:
+        logger.info(f"🔗 SPA {spa_id}: wynik współdzielony z przebiegiem w toku")
+    if result.cached:
+        logger.info(f"♻️  SPA {spa_id}: bez zmian - wynik z cache")
+    stats = result.stats
+    
+    if stats.get('category_stats'):
+        logger.info(f"   Kategorie:")
+        for cat, count in stats['category_stats'].items():
+            if count > 0:
+                logger.info(f"      {cat}: {count}")
+    
+    logger.info(f"=" * 80)
+    
+    # KROK 5: Zwróć wyniki
+    return success_payload(result, shared)
+
+
+def submit_spa_job(spa_id: int):
+    """Zleca przetwarzanie SPA w tle (kolejka zdarzeń, pula zadań)"""
+    return get_job_manager().submit((spa_id, False), lambda: run_spa(spa_id))
+
+
 @app.route('/webhook/spa/<int:spa_id>', methods=['GET', 'POST'])
 def process_spa_webhook(spa_id: int):
     """
@@ -41,157 +210,30 @@ def process_spa_webhook(spa_id: int):
     
     Parametry:
         spa_id: ID projektu SPA do przetworzenia
-        
+        async=1: Tryb asynchroniczny - 202 z ID zadania, wynik pod /jobs/<id>
+    
     Zwraca:
-        JSON z wynikami przetwarzania
+        JSON z wynikami przetwarzania (ETag = odcisk danych wejściowych,
+        GET z If-None-Match → 304, jeśli wynik pochodzi z cache)
     """
-    logger.info(f"=" * 80)
-    logger.info(f"🚀 START przetwarzania SPA ID: {spa_id}")
-    logger.info(f"=" * 80)
-    
-    try:
-        # Inicjalizacja
-        client = get_bitrix_client()
-        bitrix_service = BitrixService()
-        promoter = DealPromoter()
-        
-        # KROK 1: Pobierz dane SPA
-        logger.info(f"📦 Krok 1: Pobieranie danych SPA...")
-        spa_result = client.crm.item.get(
-            bitrix_id=spa_id,
-            entity_type_id=1032
-        )
-        spa = SPA.from_api(spa_result.result)
-        
-        logger.info(f"✅ SPA: {spa.title[:50]}")
-        logger.info(f"   Wolne wszystkie: {spa.free_all}")
-        logger.info(f"   Typ: {'Bezpłciowe' if spa.is_genderless_order() else 'Płciowe'}")
-        
-        # KROK 2: Pobierz deale z Sortowania i Rezerwy
-        logger.info(f"📦 Krok 2: Pobieranie dealów...")
-        deals = []
+    if request.args.get("async") == "1":
+        try:
+            job = submit_spa_job(spa_id)
+        except JobQueueFullError as e:
+            return jsonify({"status": "error", "spa_id": spa_id, "error": str(e)}), 503
         
-        for stage in [DealStage.SORTING, DealStage.RESERVE]:
-            deals_result = client.crm.deal.list(
-                filter={
-                    "STAGE_ID": stage.value,
-                    "UF_CRM_1740931330": str(spa_id),
-                },
-                select=[
-                    "ID", "TITLE", "STAGE_ID", "PARENT_ID_1032",
-                    "UF_CRM_1743329864",    # Priorytet
-                    "UF_CRM_1740931330",    # SPA ID
-                    "UF_CRM_1740931105",    # Płeć
-                    "UF_CRM_1740931164",    # Mieszkanie
-                    "UF_CRM_1669643033481", # Wiek
-                    "UF_CRM_1740931256",    # Data przyjazdu
-                    "UF_CRM_1741856527",    # Data EXECUTING
-                ]
-            )
-            
-            # Użyj as_list_fast() dla efektywności
-            stage_count = 0
-            for deal_data in deals_result.as_list_fast().result:
-                deals.append(Deal.from_api(deal_data))
-                stage_count += 1
-            
-            logger.info(f"   {stage.name}: {stage_count} dealów")
-        
-        logger.info(f"✅ Łącznie: {len(deals)} dealów")
-        
-        # KROK 3: Przetwórz
-        logger.info(f"⚙️  Krok 3: Przetwarzanie (walidacja, sortowanie, przydział)...")
-        promoted, reserve, stats = promoter.process(spa, deals)
-        
-        logger.info(f"✅ Wyniki:")
-        logger.info(f"   Kwalifikujące się: {stats['qualified']}")
-        logger.info(f"   Awansowane: {stats['promoted']}")
-        logger.info(f"   Do rezerwy: {stats['reserve']}")
-        logger.info(f"   Odrzucone: {stats['rejected']}")
-        
-        if stats.get('category_stats'):
-            logger.info(f"   Kategorie:")
-            for cat, count in stats['category_stats'].items():
-                if count > 0:
-                    logger.info(f"      {cat}: {count}")
-        
-        # KROK 4: Aktualizuj etapy w Bitrix24 (batch)
-        logger.info(f"💾 Krok 4: Aktualizacja etapów w Bitrix24...")
-        updates_count = 0
-        
-        if promoted:
-            logger.info(f"   Awansowanie {len(promoted)} dealów do Lista Główna...")
-            
-            # Użyj BitrixService (bezpośrednie REST API calls)
-            for deal in promoted:
-                try:
-                    success = bitrix_service.update_deal_stage(
-                        deal_id=deal.id,
-                        new_stage=DealStage.MAIN_LIST.value
-                    )
-                    
-                    if success:
-                        updates_count += 1
-                        logger.info(f"      ✅ Deal {deal.id} → Lista Główna")
-                    else:
-                        logger.warning(f"      ⚠️  Deal {deal.id} - update zwrócił False")
-                        
-                except Exception as e:
-                    logger.error(f"      ❌ Deal {deal.id} - błąd: {e}")
-        
-        if reserve:
-            logger.info(f"   Aktualizacja {len(reserve)} dealów w Rezerwie...")
-            
-            # Użyj BitrixService
-            for deal in reserve:
-                # Przenieś do rezerwy tylko jeśli nie jest już w rezerwie
-                if deal.stage_id != DealStage.RESERVE.value:
-                    try:
-                        success = bitrix_service.update_deal_stage(
-                            deal_id=deal.id,
-                            new_stage=DealStage.RESERVE.value
-                        )
-                        
-                        if success:
-                            updates_count += 1
-                            logger.info(f"      ✅ Deal {deal.id} → Rezerwa")
-                        else:
-                            logger.warning(f"      ⚠️  Deal {deal.id} - update zwrócił False")
-                            
-                    except Exception as e:
-                        logger.error(f"      ❌ Deal {deal.id} - błąd: {e}")
-        
-        logger.info(f"✅ ZAKOŃCZONO: {updates_count} zmian w Bitrix24")
-        logger.info(f"=" * 80)
-        
-        # KROK 5: Zwróć wyniki
-        return jsonify({
-            "status": "success",
+        response = jsonify({
+            "status": "accepted",
             "spa_id": spa_id,
-            "spa_title": spa.title,
-            "spa_type": "genderless" if spa.is_genderless_order() else "gendered",
-            "free_all": spa.free_all,
-            "stats": {
-                "total_input": stats["total_input"],
-                "qualified": stats["qualified"],
-                "promoted": stats["promoted"],
-                "reserve": stats["reserve"],
-                "rejected": stats["rejected"],
-                "updates_executed": updates_count,
-            },
-            "category_allocation": stats.get("category_stats", {}),
-            "promoted_deals": [
-                {
-                    "id": d.id,
-                    "title": d.title,
-                    "priority": d.priority,
-                    "category": stats["assignments"].get(d.id) if "assignments" in stats else None
-                }
-                for d in promoted
-            ],
-            "summary": promoter.get_promotion_summary(stats),
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
         })
-        
+        response.headers["Location"] = f"/jobs/{job.id}"
+        return response, 202
+    
+    try:
+        return conditional_json(run_spa(spa_id))
+    
     except Exception as e:
         # Obsługa błędów
         import traceback
@@ -211,52 +253,54 @@ def process_spa_webhook(spa_id: int):
         }), 500
 
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    """Stan zadania w tle (status, czasy, wynik lub błąd)"""
+    job = get_job_manager().get(job_id)
+    
+    if job is None:
+        return jsonify({"status": "error", "error": f"Nieznane zadanie: {job_id}"}), 404
+    
+    return jsonify(job.to_dict())
+
+
+def dry_run_spa(spa_id: int) -> dict:
+    """
+    Przetwarza SPA bez zapisu do Bitrix24 i buduje wynik JSON
+    
+    Args:
+        spa_id: ID projektu SPA
+    
+    Returns:
+        dict: Decyzje (would_promote, would_reserve) i statystyki
+    """
+    # Dry-run niczego nie zmienia - współdzielimy wynik bez przebiegu uzupełniającego
+    result, _ = get_spa_flight().do(
+        (spa_id, True),
+        lambda: asyncio.run(process_spa(
+            spa_id,
+            dry_run=True,
+            promoter=DealPromoter(),
+            cache=get_run_cache(),
+            store=fresh_local_store(),
+        )),
+        follow_up=False
+    )
+    return dry_run_payload(result)
+
+
 @app.route('/webhook/spa/<int:spa_id>/dry-run', methods=['GET'])
 def dry_run_webhook(spa_id: int):
     """
     Dry-run (bez aktualizacji w Bitrix24)
     
-    Przydatne do testowania logiki bez modyfikacji danych
+    Przydatne do testowania logiki bez modyfikacji danych.
+    ETag i 304 jak w głównym webhooku.
     """
     try:
-        client = get_bitrix_client()
-        promoter = DealPromoter()
-        
-        # Pobierz SPA
-        spa_result = client.crm.item.get(bitrix_id=spa_id, entity_type_id=1032)
-        spa = SPA.from_api(spa_result.result)
-        
-        # Pobierz deale
-        deals = []
-        for stage in [DealStage.SORTING, DealStage.RESERVE]:
-            deals_result = client.crm.deal.list(
-                filter={
-                    "STAGE_ID": stage.value,
-                    "UF_CRM_1740931330": str(spa_id),
-                },
-                select=["ID", "TITLE", "STAGE_ID", "UF_CRM_1743329864", 
-                        "UF_CRM_1740931330", "UF_CRM_1740931105", "UF_CRM_1740931164",
-                        "UF_CRM_1669643033481", "UF_CRM_1740931256", "UF_CRM_1741856527"]
-            )
-            
-            for deal_data in deals_result.as_list_fast().result:
-                deals.append(Deal.from_api(deal_data))
-        
-        # Przetwórz (BEZ update!)
-        promoted, reserve, stats = promoter.process(spa, deals)
-        
-        return jsonify({
-            "status": "dry-run",
-            "spa_id": spa_id,
-            "spa_title": spa.title,
-            "spa_type": "genderless" if spa.is_genderless_order() else "gendered",
-            "stats": stats,
-            "would_promote": [d.id for d in promoted],
-            "would_reserve": [d.id for d in reserve],
-            "summary": promoter.get_promotion_summary(stats),
-            "note": "Dry-run: Żadne dane nie zostały zmienione w Bitrix24"
-        })
-        
+        # Pobierz i przetwórz (BEZ update!)
+        return conditional_json(dry_run_spa(spa_id))
+    
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -264,6 +308,139 @@ def dry_run_webhook(spa_id: int):
         }), 500
 
 
+@app.route('/webhook/spa/batch', methods=['POST'])
+def batch_webhook():
+    """
+    Przetwarzanie wielu SPA naraz (ograniczona równoległość, wspólny rate limiter)
+    
+    Body (JSON, opcjonalne):
+        spa_ids: Lista ID SPA (brak = wszystkie SPA "W trakcie" z wolnymi miejscami)
+        dry_run: true = bez zapisu do Bitrix24
+        concurrency: Maks. liczba równoległych SPA (domyślnie i najwyżej BATCH_CONCURRENCY)
+        mode: "sweep" = przegląd portfela - wszystkie aktywne SPA i ich deale
+            pobrane hurtowo (src/services/sweep.py), bez spa_ids
+    
+    Zwraca:
+        NDJSON - jedna linia z wynikiem na SPA, w kolejności zakończenia
+    """
+    body = request.get_json(silent=True) or {}
+    spa_ids = body.get("spa_ids")
+    concurrency = body.get("concurrency")
+    
+    if spa_ids is not None and (
+        not isinstance(spa_ids, list) or not all(isinstance(i, int) for i in spa_ids)
+    ):
+        return jsonify({"status": "error", "error": "spa_ids musi być listą liczb"}), 400
+    
+    if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+        return jsonify({"status": "error", "error": "concurrency musi być liczbą >= 1"}), 400
+    
+    if body.get("mode") == "sweep":
+        if spa_ids is not None:
+            return jsonify({"status": "error", "error": "mode=sweep obejmuje wszystkie aktywne SPA - bez spa_ids"}), 400
+        return sweep_response(bool(body.get("dry_run")))
+    
+    try:
+        if spa_ids is None:
+            spa_ids = asyncio.run(open_spa_ids())
+            logger.info(f"📋 Batch: {len(spa_ids)} SPA 'W trakcie' z wolnymi miejscami")
+    except Exception as e:
+        logger.error(f"❌ Batch: nie udało się pobrać listy SPA - {e}")
+        return jsonify({"status": "error", "error": str(e), "error_type": type(e).__name__}), 500
+    
+    run = dry_run_spa if body.get("dry_run") else run_spa
+    results = run_batch(spa_ids, run, concurrency=concurrency)
+    
+    return Response(
+        (json.dumps(result, ensure_ascii=False, default=str) + "\n" for result in results),
+        mimetype="application/x-ndjson",
+    )
+
+
+def sweep_response(dry_run: bool) -> Response:
+    """
+    Przegląd portfela jako NDJSON (jeden przegląd naraz, jak pojedyncze SPA)
+    
+    Przegląd z zapisem zajmuje single-flight każdego SPA - nie awansuje
+    równolegle z webhookiem, zadaniem, zdarzeniem ani harmonogramem.
+    """
+    try:
+        results, _ = get_spa_flight().do(
+            ("sweep", dry_run),
+            lambda: asyncio.run(sweep_open_spas(dry_run=dry_run, journal=get_journal(), flight=get_spa_flight())),
+            follow_up=not dry_run
+        )
+    except Exception as e:
+        logger.error(f"❌ Przegląd portfela nieudany - {e}")
+        return jsonify({"status": "error", "error": str(e), "error_type": type(e).__name__}), 500
+    
+    payload = dry_run_payload if dry_run else success_payload
+    return Response(
+        (json.dumps(payload(result), ensure_ascii=False, default=str) + "\n" for result in results),
+        mimetype="application/x-ndjson",
+    )
+
+
+@app.route('/scheduler/status', methods=['GET'])
+def scheduler_status():
+    """Stan harmonogramu (SCHEDULER_ENABLED=1): odstępy per SPA, budżet requestów"""
+    scheduler = get_scheduler()
+    
+    if scheduler is None:
+        return jsonify({"enabled": False})
+    
+    return jsonify({"enabled": True, **scheduler.status()})
+
+
+@app.route('/journal', methods=['GET'])
+def journal_history():
+    """
+    Historia zapisów etapów z dziennika awansów (PROMOTION_JOURNAL_PATH)
+    
+    Parametry:
+        spa_id: Tylko przebiegi tego SPA
+        limit: Maks. liczba wpisów (domyślnie 100)
+    """
+    journal = get_journal()
+    
+    if journal is None:
+        return jsonify({"enabled": False})
+    
+    spa_id = request.args.get("spa_id", type=int)
+    limit = request.args.get("limit", default=100, type=int)
+    
+    return jsonify({
+        "enabled": True,
+        **journal.stats(),
+        "entries": journal.history(spa_id=spa_id, limit=limit),
+    })
+
+
+def resume_journal():
+    """Wznawia zapisy przerwane awarią poprzedniego procesu (w tle przy starcie)"""
+    try:
+        asyncio.run(resume_pending(
+            get_journal(),
+            max_age=float(os.getenv("PROMOTION_JOURNAL_RESUME_MAX_AGE", "3600")),
+        ))
+    except Exception as e:
+        logger.error(f"❌ Dziennik: wznowienie zapisów nieudane - {e}")
+
+
+# Zdarzenia Bitrix24 (POST /events/bitrix) - serie zdarzeń SPA → jedno zadanie
+register_bitrix_events(app, submit_spa_job)
+
+
+# Dziennik awansów - dokończ zapisy przerwanego przebiegu
+if get_journal() is not None:
+    threading.Thread(target=resume_journal, name="journal-resume", daemon=True).start()
+
+
+# Harmonogram w procesie (zastępuje pętlę n8n) - tylko gdy włączony
+if os.getenv("SCHEDULER_ENABLED", "0") == "1":
+    get_scheduler(run_spa).start()
+
+
 if __name__ == '__main__':
     port = int(os.getenv('FLASK_PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', '0') == '1'
@@ -275,8 +452,15 @@ if __name__ == '__main__':
     print(f"Debug: {debug}")
     print(f"\nEndpoints:")
     print(f"  GET  /health")
+    print(f"  GET  /health/bitrix")
     print(f"  GET  /webhook/spa/<spa_id>")
+    print(f"  POST /webhook/spa/<spa_id>?async=1")
+    print(f"  GET  /jobs/<job_id>")
     print(f"  GET  /webhook/spa/<spa_id>/dry-run")
+    print(f"  POST /webhook/spa/batch")
+    print(f"  GET  /scheduler/status")
+    print(f"  GET  /journal")
+    print(f"  POST /events/bitrix")
     print("=" * 80)
     
     app.run(host='0.0.0.0', port=port, debug=debug)
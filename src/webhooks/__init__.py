@@ -0,0 +1,9 @@
+"""
+Endpointy zdarzeń przychodzących (Bitrix24 outbound webhooks)
+"""
+from .bitrix_events import bitrix_events, register_bitrix_events
+
+__all__ = [
+    "bitrix_events",
+    "register_bitrix_events",
+]
@@ -0,0 +1,112 @@
+"""
+Endpoint zdarzeń wychodzących Bitrix24 (outbound webhook)
+
+POST /events/bitrix - Bitrix24 wysyła zdarzenia jako formularz:
+    event=ONCRMDEALUPDATE
+    data[FIELDS][ID]=123
+    auth[application_token]=...
+
+Obsługiwane zdarzenia:
+- ONCRMDEALADD, ONCRMDEALUPDATE → deal (SPA ustalane hurtowo w kolejce)
+- ONCRMDYNAMICITEMUPDATE z ENTITY_TYPE_ID=1032 → bezpośrednio SPA
+
+Zdarzenie trafia do kolejki z debounce (src/services/event_queue.py) -
+seria zdarzeń jednego SPA daje jedno przetwarzanie. Odpowiedź jest
+natychmiastowa, przetwarzanie idzie w tle. Zdarzenia wywołane przez
+własne zapisy serwisu są pomijane ("ignored"). Pozostałe oznaczają kopię
+lokalną (LOCAL_STORE_PATH) jako nieaktualną - przebieg zleconego SPA
+odświeży ją przyrostowo przed odczytem.
+
+Jeśli ustawiono BITRIX_EVENT_TOKEN, zdarzenia z innym application_token
+są odrzucane (403).
+"""
+import os
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+from flask import Blueprint, Flask, current_app, jsonify, request
+from src.services.bitrix_service import SPA_ENTITY_TYPE_ID
+from src.services.event_queue import get_event_queue
+from src.services.local_store import get_store_sync
+
+
+DEAL_EVENTS = ("ONCRMDEALADD", "ONCRMDEALUPDATE")
+SPA_EVENTS = ("ONCRMDYNAMICITEMUPDATE",)
+
+bitrix_events = Blueprint("bitrix_events", __name__)
+
+
+def parse_event(payload: Mapping[str, Any]) -> Tuple[str, Dict[str, Any], Optional[str]]:
+    """
+    Wyciąga nazwę zdarzenia, pola i token z formularza lub JSON
+    
+    Args:
+        payload: request.form (klucze "data[FIELDS][ID]") lub JSON (zagnieżdżony)
+    
+    Returns:
+        Tuple[str, Dict, Optional[str]]: (zdarzenie, FIELDS, application_token)
+    """
+    event = str(payload.get("event") or "").upper()
+    
+    if isinstance(payload.get("data"), dict):
+        fields = payload["data"].get("FIELDS") or {}
+        token = (payload.get("auth") or {}).get("application_token")
+        return event, fields, token
+    
+    prefix = "data[FIELDS]["
+    fields = {
+        key[len(prefix):-1]: value
+        for key, value in payload.items()
+        if key.startswith(prefix) and key.endswith("]")
+    }
+    return event, fields, payload.get("auth[application_token]")
+
+
+def register_bitrix_events(app: Flask, dispatch: Callable[[int], Any]):
+    """
+    Rejestruje endpoint zdarzeń
+    
+    Args:
+        app: Aplikacja Flask
+        dispatch: Zlecanie przetwarzania SPA (wywoływane po wyciszeniu serii)
+    """
+    app.extensions["spa_event_dispatch"] = dispatch
+    app.register_blueprint(bitrix_events)
+
+
+@bitrix_events.route('/events/bitrix', methods=['POST'])
+def bitrix_event():
+    """Przyjmuje zdarzenie Bitrix24 i kolejkuje SPA"""
+    payload = request.get_json(silent=True) if request.is_json else request.form
+    event, fields, token = parse_event(payload or {})
+    
+    expected = os.getenv("BITRIX_EVENT_TOKEN")
+    if expected and token != expected:
+        return jsonify({"status": "error", "error": "Nieprawidłowy application_token"}), 403
+    
+    item_id = str(fields.get("ID") or "")
+    if not item_id.isdigit():
+        return jsonify({"status": "ignored", "event": event, "reason": "brak ID"})
+    
+    queue = get_event_queue(current_app.extensions["spa_event_dispatch"])
+    store_sync = get_store_sync()
+    
+    if event in DEAL_EVENTS:
+        if not queue.add_deal(item_id):
+            return jsonify({"status": "ignored", "event": event, "deal_id": item_id, "reason": "własny zapis"})
+        if store_sync:
+            store_sync.mark_stale()
+        return jsonify({"status": "queued", "event": event, "deal_id": item_id})
+    
+    if event in SPA_EVENTS and str(fields.get("ENTITY_TYPE_ID")) == str(SPA_ENTITY_TYPE_ID):
+        queue.add_spa(int(item_id))
+        if store_sync:
+            store_sync.mark_stale()
+        return jsonify({"status": "queued", "event": event, "spa_id": int(item_id)})
+    
+    return jsonify({"status": "ignored", "event": event})
+
+
+@bitrix_events.route('/events/bitrix/status', methods=['GET'])
+def bitrix_events_status():
+    """Stan kolejki zdarzeń (oczekujące SPA i deale, liczniki)"""
+    queue = get_event_queue()
+    return jsonify(queue.stats() if queue else {"events": 0})
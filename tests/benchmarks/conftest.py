@@ -0,0 +1,64 @@
+"""
+Dane i bramka benchmarków (pytest-benchmark)
+
+Benchmarki są pomijane, dopóki RUN_BENCHMARKS != 1 (make bench / make bench-compare).
+Rozmiary: BENCH_SIZES (domyślnie 1k, 10k, 100k, 1M dealów). 1M dealów
+to kilka GB pamięci (surowe słowniki + modele) - na słabszej maszynie:
+BENCH_SIZES=1000,10000,100000.
+"""
+import os
+from datetime import datetime
+import pytest
+from src.business_logic import DealPrioritizer, QualificationValidator
+from src.models import SPA, Deal
+from src.testing.generator import FREE_ALL, FREE_CATEGORY_FIELDS, PortfolioGenerator
+
+
+SIZES = [int(size) for size in (os.getenv("BENCH_SIZES") or "1000,10000,100000,1000000").split(",")]
+KINDS = ("genderless", "gendered")
+
+# Stały punkt odniesienia i seed - te same dane w każdym przebiegu (porównania)
+NOW = datetime(2026, 3, 1, 12, 0)
+SEED = 2026
+
+# Limity miejsc SPA: kategorie szybko pełne / ujemne → allocate przechodzi całą listę
+FREE_SLOTS = dict(zip((FREE_ALL, *FREE_CATEGORY_FIELDS), (200, 60, 30, 0, 20, -2, 5)))
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("RUN_BENCHMARKS") == "1":
+        return
+    
+    skip = pytest.mark.skip(reason="Benchmarki: ustaw RUN_BENCHMARKS=1 (make bench)")
+    for item in items:
+        if "benchmarks" in item.nodeid.split("/"):
+            item.add_marker(skip)
+
+
+class BenchData:
+    """Wejście benchmarków dla jednego rozmiaru i typu SPA"""
+    
+    def __init__(self, size: int, kind: str):
+        generator = PortfolioGenerator(seed=SEED, now=NOW)
+        raw_spa = {**generator.spa(1, genderless=kind == "genderless"), **FREE_SLOTS}
+        
+        self.size = size
+        self.kind = kind
+        self.spa = SPA.from_api({"item": raw_spa})
+        self.raw_deals = generator.deals(raw_spa, size)
+        self.deals = [Deal.from_api(deal) for deal in self.raw_deals]
+        
+        # Wejście kolejnych kroków (jak w DealPromoter.process)
+        validator = QualificationValidator()
+        self.qualified = [deal for deal in self.deals if validator.validate_all(deal, self.spa)]
+        self.sorted = DealPrioritizer().sort(self.qualified, self.spa)
+
+
+@pytest.fixture(
+    scope="module",
+    params=[(size, kind) for size in SIZES for kind in KINDS],
+    ids=lambda param: f"{param[1]}-{param[0]}",
+)
+def bench_data(request):
+    """Dane budowane raz na rozmiar i typ SPA (pytest grupuje testy po parametrze)"""
+    return BenchData(*request.param)
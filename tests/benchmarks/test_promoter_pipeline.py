@@ -0,0 +1,77 @@
+"""
+Benchmarki ścieżki DealPromoter (1k-1M dealów, SPA bezpłciowe i płciowe)
+
+Uruchamianie:
+    make bench            # wyniki JSON w .benchmarks/ (autosave)
+    make bench-compare    # porównanie z ostatnim zapisem, błąd przy regresji
+
+Każdy krok mierzony na wejściu, jakie dostaje w DealPromoter.process:
+walidacja na wszystkich dealach, sortowanie na zakwalifikowanych,
+przydział na posortowanych.
+"""
+import pytest
+from src.business_logic import DealPrioritizer, DealPromoter, QualificationValidator, SlotAllocator
+from src.models import Deal
+
+
+def parse_deals(raw_deals):
+    return [Deal.from_api(deal) for deal in raw_deals]
+
+
+def validate_deals(validator, deals, spa):
+    return [deal for deal in deals if validator.validate_all(deal, spa)]
+
+
+def annotate(benchmark, data):
+    benchmark.extra_info.update({"deals": data.size, "spa": data.kind, "qualified": len(data.qualified)})
+
+
+@pytest.mark.benchmark(group="Deal.from_api")
+def test_deal_from_api(benchmark, bench_data):
+    """Parsowanie surowych dealów do modeli"""
+    annotate(benchmark, bench_data)
+    
+    deals = benchmark(parse_deals, bench_data.raw_deals)
+    
+    assert len(deals) == bench_data.size
+
+
+@pytest.mark.benchmark(group="QualificationValidator.validate_all")
+def test_validate_all(benchmark, bench_data):
+    """Walidacja wszystkich dealów (krok 1)"""
+    annotate(benchmark, bench_data)
+    
+    qualified = benchmark(validate_deals, QualificationValidator(), bench_data.deals, bench_data.spa)
+    
+    assert len(qualified) == len(bench_data.qualified)
+
+
+@pytest.mark.benchmark(group="DealPrioritizer.sort")
+def test_prioritizer_sort(benchmark, bench_data):
+    """Sortowanie zakwalifikowanych (krok 2)"""
+    annotate(benchmark, bench_data)
+    
+    ordered = benchmark(DealPrioritizer().sort, bench_data.qualified, bench_data.spa)
+    
+    assert [deal.id for deal in ordered] == [deal.id for deal in bench_data.sorted]
+
+
+@pytest.mark.benchmark(group="SlotAllocator.allocate")
+def test_allocator_allocate(benchmark, bench_data):
+    """Przydział miejsc na posortowanych (krok 3)"""
+    annotate(benchmark, bench_data)
+    
+    allocated = benchmark(SlotAllocator().allocate, bench_data.sorted, bench_data.spa)
+    
+    assert len(allocated) <= bench_data.spa.free_all
+
+
+@pytest.mark.benchmark(group="DealPromoter.process")
+def test_promoter_process(benchmark, bench_data):
+    """Cały przebieg: walidacja, sortowanie, przydział, rezerwa"""
+    annotate(benchmark, bench_data)
+    
+    promoted, reserve, stats = benchmark(DealPromoter().process, bench_data.spa, bench_data.deals)
+    
+    assert stats["qualified"] == len(bench_data.qualified)
+    assert len(promoted) + len(reserve) <= len(bench_data.qualified)
@@ -5,6 +5,7 @@ Wspólne dane testowe i helper functions
 import pytest
 from datetime import datetime, timedelta
 from src.models import SPA, Deal, Gender, Housing, DealPriority
+from src.testing.generator import generate_portfolio
 
 
 @pytest.fixture
@@ -127,3 +128,9 @@ def deal_late_arrival():
         UF_CRM_1741856527=datetime.now().isoformat(),
     )
 
+
+
+@pytest.fixture
+def synthetic_portfolio():
+    """Syntetyczny portfel (20 SPA, 2000 dealów) o rozkładach zbliżonych do produkcji"""
+    return generate_portfolio(spa_count=20, deal_count=2000, seed=42)
@@ -0,0 +1,74 @@
+"""
+Testy jednostkowe dla AsyncBitrixService
+
+BitrixService.call() jest zastąpiony atrapą w pamięci - bez połączenia z Bitrix24.
+"""
+import asyncio
+import threading
+import time
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.bitrix_service import BitrixService
+
+
+class RangeFakeService(BitrixService):
+    """Atrapa crm.deal.list - obsługuje >ID, <=ID, sortowanie po ID i total"""
+    
+    def __init__(self, ids, delay=0.0):
+        super().__init__()
+        self.ids = sorted(ids)
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+    
+    def call(self, method, data):
+        with self._lock:
+            self.calls.append(data)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        
+        filter = data["filter"]
+        matching = [
+            i for i in self.ids
+            if i > filter.get(">ID", 0) and i <= filter.get("<=ID", float("inf"))
+        ]
+        if data["order"]["ID"] == "DESC":
+            matching.reverse()
+        
+        page = [{"ID": str(i)} for i in matching[:self.PAGE_SIZE]]
+        return {"result": page, "total": len(matching)}
+
+
+class TestListDealsParallel:
+    """list_deals_parallel - podział zakresu ID i równoległe pobieranie"""
+    
+    def test_small_list_single_request(self):
+        """✅ total <= 50 → wystarcza jedno zapytanie (sonda)"""
+        fake = RangeFakeService(range(1, 31))
+        
+        deals = asyncio.run(AsyncBitrixService(fake).list_deals_parallel({}, ["ID"]))
+        
+        assert [int(d["ID"]) for d in deals] == list(range(1, 31))
+        assert len(fake.calls) == 1
+    
+    def test_ranges_fetched_concurrently_without_duplicates(self):
+        """✅ 500 dealów (rzadkie ID) → zakresy naraz, wynik kompletny i posortowany"""
+        ids = list(range(3, 1503, 3))
+        fake = RangeFakeService(ids, delay=0.02)
+        
+        deals = asyncio.run(AsyncBitrixService(fake, max_concurrency=4).list_deals_parallel({}, ["ID"]))
+        
+        assert [int(d["ID"]) for d in deals] == ids
+        assert fake.max_active == 4
+    
+    def test_respects_after_id(self):
+        """✅ Pobiera tylko ID > after_id"""
+        fake = RangeFakeService(range(1, 201))
+        
+        deals = asyncio.run(AsyncBitrixService(fake).list_deals_parallel({}, ["ID"], after_id=120))
+        
+        assert [int(d["ID"]) for d in deals] == list(range(121, 201))
@@ -0,0 +1,236 @@
+"""
+Testy jednostkowe dla BitrixService
+
+Bez połączenia z Bitrix24 - sesja HTTP jest podmieniana na atrapę,
+która zapisuje wysłane payloady i zwraca odpowiedź w formacie `batch`.
+"""
+import pytest
+from src.services import bitrix_service as bitrix_service_module
+from src.services.bitrix_service import BitrixService, BitrixAPIError
+from src.models import DealStage
+
+
+class FakeSession:
+    """Atrapa requests.Session - deleguje post() do podanej funkcji"""
+    
+    def __init__(self, post):
+        self.post = post
+
+
+class FakeResponse:
+    """Minimalna odpowiedź HTTP (tylko .json())"""
+    
+    def __init__(self, payload):
+        self._payload = payload
+    
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def sent_batches(monkeypatch):
+    """Podmienia sesję HTTP - każdy batch kończy się sukcesem poza dealem 'bad'"""
+    sent = []
+    
+    def fake_post(url, json=None, timeout=None):
+        sent.append({"url": url, "json": json})
+        
+        result, result_error = {}, {}
+        for key in json["cmd"]:
+            if key == "deal_bad":
+                result_error[key] = {"error": "NOT_FOUND", "error_description": "Not found"}
+            else:
+                result[key] = True
+        
+        return FakeResponse({"result": {"result": result, "result_error": result_error}})
+    
+    monkeypatch.setattr(bitrix_service_module, "get_http_session", lambda: FakeSession(fake_post))
+    return sent
+
+
+class TestBatchUpdateStages:
+    """Batch update etapów - jedno wywołanie `batch` na 50 dealów"""
+    
+    def test_single_batch_call_for_small_update(self, sent_batches):
+        """✅ Kilka dealów → jedno wywołanie batch"""
+        # Given
+        service = BitrixService()
+        updates = [
+            {"id": str(i), "stage": DealStage.MAIN_LIST.value}
+            for i in range(40)
+        ]
+        
+        # When
+        results = service.batch_update_stages(updates)
+        
+        # Then
+        assert len(sent_batches) == 1, "40 dealów powinno zmieścić się w jednym batch"
+        assert sent_batches[0]["url"].endswith("/batch")
+        assert len(sent_batches[0]["json"]["cmd"]) == 40
+        assert all(r["success"] for r in results.values())
+    
+    def test_splits_into_chunks_of_50(self, sent_batches):
+        """✅ 120 dealów → 3 wywołania batch (50 + 50 + 20)"""
+        # Given
+        service = BitrixService()
+        updates = [
+            {"id": str(i), "stage": DealStage.RESERVE.value}
+            for i in range(120)
+        ]
+        
+        # When
+        results = service.batch_update_stages(updates)
+        
+        # Then
+        assert [len(b["json"]["cmd"]) for b in sent_batches] == [50, 50, 20]
+        assert len(results) == 120
+    
+    def test_command_encoding(self, sent_batches):
+        """✅ Komenda zawiera id i STAGE_ID w formacie query string"""
+        # Given
+        service = BitrixService()
+        
+        # When
+        service.batch_update_stages([{"id": "123", "stage": "C25:UC_0LRPVJ"}])
+        
+        # Then
+        cmd = sent_batches[0]["json"]["cmd"]["deal_123"]
+        assert cmd.startswith("crm.deal.update?")
+        assert "id=123" in cmd
+        assert "fields[STAGE_ID]=C25%3AUC_0LRPVJ" in cmd
+    
+    def test_maps_errors_back_to_deal(self, sent_batches):
+        """❌ Błąd pojedynczej komendy trafia do właściwego deala"""
+        # Given
+        service = BitrixService()
+        updates = [
+            {"id": "1", "stage": DealStage.MAIN_LIST.value},
+            {"id": "bad", "stage": DealStage.MAIN_LIST.value},
+        ]
+        
+        # When
+        results = service.batch_update_stages(updates)
+        
+        # Then
+        assert results["1"] == {"success": True, "error": None}
+        assert results["bad"]["success"] is False
+        assert "NOT_FOUND" in results["bad"]["error"]
+    
+    def test_transport_error_marks_whole_chunk_failed(self, monkeypatch):
+        """❌ Błąd całego requestu → wszystkie deale z paczki mają błąd"""
+        # Given
+        def failing_post(url, json=None, timeout=None):
+            raise ConnectionError("portal niedostępny")
+        
+        monkeypatch.setattr(bitrix_service_module, "get_http_session", lambda: FakeSession(failing_post))
+        service = BitrixService()
+        
+        # When
+        results = service.batch_update_stages([{"id": "1", "stage": "X"}, {"id": "2", "stage": "X"}])
+        
+        # Then
+        assert all(not r["success"] for r in results.values())
+        assert all("portal niedostępny" in r["error"] for r in results.values())
+    
+    def test_batch_rejects_more_than_50_commands(self):
+        """❌ batch() nie przyjmuje więcej niż 50 komend"""
+        service = BitrixService()
+        commands = {f"k{i}": ("crm.deal.get", {"id": i}) for i in range(51)}
+        
+        with pytest.raises(ValueError):
+            service.batch(commands)
+
+
+class TestListDealsKeyset:
+    """Paginacja dealów keyset po ID (>ID, ORDER ID ASC, start=-1)"""
+    
+    def test_pages_by_last_id(self, monkeypatch):
+        """✅ Kolejna strona od ostatniego ID, koniec na niepełnej stronie"""
+        # Given - 120 dealów w portalu
+        all_ids = list(range(1, 121))
+        sent = []
+        
+        def fake_post(url, json=None, timeout=None):
+            sent.append(json)
+            after_id = json["filter"][">ID"]
+            page = [{"ID": str(i)} for i in all_ids if i > after_id][:50]
+            return FakeResponse({"result": page})
+        
+        monkeypatch.setattr(bitrix_service_module, "get_http_session", lambda: FakeSession(fake_post))
+        service = BitrixService()
+        
+        # When
+        deals = service.list_deals({"STAGE_ID": ["A", "B"]}, ["ID"])
+        
+        # Then
+        assert [int(d["ID"]) for d in deals] == all_ids
+        assert [p["filter"][">ID"] for p in sent] == [0, 50, 100]
+        assert all(p["start"] == -1 and p["order"] == {"ID": "ASC"} for p in sent)
+        assert sent[0]["filter"]["STAGE_ID"] == ["A", "B"]
+    
+    def test_full_last_page_needs_one_empty_request(self, monkeypatch):
+        """✅ Pełna strona → jedno dodatkowe (puste) zapytanie"""
+        # Given - dokładnie 50 dealów
+        sent = []
+        
+        def fake_post(url, json=None, timeout=None):
+            sent.append(json)
+            after_id = json["filter"][">ID"]
+            return FakeResponse({"result": [{"ID": str(i)} for i in range(1, 51) if i > after_id]})
+        
+        monkeypatch.setattr(bitrix_service_module, "get_http_session", lambda: FakeSession(fake_post))
+        
+        # When
+        deals = BitrixService().list_deals({}, ["ID"])
+        
+        # Then
+        assert len(deals) == 50
+        assert len(sent) == 2
+
+
+class TestListSpas:
+    """Lista SPA (crm.item.list) - keyset po id"""
+    
+    def test_pages_by_last_id(self, monkeypatch):
+        """✅ Kolejne strony od ostatniego id, wynik z result.items"""
+        # Given - 70 SPA w portalu
+        sent = []
+        
+        def fake_post(url, json=None, timeout=None):
+            sent.append((url, json))
+            after_id = json["filter"][">id"]
+            items = [{"id": i} for i in range(1, 71) if i > after_id][:50]
+            return FakeResponse({"result": {"items": items}})
+        
+        monkeypatch.setattr(bitrix_service_module, "get_http_session", lambda: FakeSession(fake_post))
+        
+        # When
+        spas = BitrixService().list_spas({"stageId": "DT1032_17:UC_CU0OTZ"}, select=["id"])
+        
+        # Then
+        assert [s["id"] for s in spas] == list(range(1, 71))
+        assert [json["filter"][">id"] for _, json in sent] == [0, 50]
+        assert all(url.endswith("/crm.item.list") for url, _ in sent)
+        assert sent[0][1]["entityTypeId"] == 1032
+        assert sent[0][1]["filter"]["stageId"] == "DT1032_17:UC_CU0OTZ"
+        assert sent[0][1]["select"] == ["id"]
+
+
+class TestGetSpaWithDeals:
+    """SPA + pierwsza strona dealów w jednym wywołaniu `batch`"""
+    
+    def test_command_error_raises(self, monkeypatch):
+        """❌ Błąd komendy crm.item.get → BitrixAPIError"""
+        def fake_post(url, json=None, timeout=None):
+            return FakeResponse({"result": {
+                "result": {"deals": []},
+                "result_error": {"spa": {"error": "NOT_FOUND", "error_description": "Item not found"}},
+            }})
+        
+        monkeypatch.setattr(bitrix_service_module, "get_http_session", lambda: FakeSession(fake_post))
+        
+        with pytest.raises(BitrixAPIError) as excinfo:
+            BitrixService().get_spa_with_first_page(1, {}, ["ID"])
+        
+        assert excinfo.value.method == "crm.item.get"
+        assert excinfo.value.error == "NOT_FOUND"
@@ -0,0 +1,178 @@
+"""
+Testy jednostkowe dla lokalnego zamiennika Bitrix24 (BitrixStandin)
+
+BitrixService rozmawia z zamiennikiem przez HTTP (serwer na losowym porcie),
+więc testowane jest to samo kodowanie parametrów i batch co przy portalu.
+"""
+import asyncio
+import threading
+import pytest
+import requests
+from werkzeug.serving import make_server
+from src.config import BitrixConfig
+from src.models import DealStage, SPAStage
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.bitrix_service import BitrixAPIError, BitrixService
+from src.services.projection import DEAL_SPA_FIELD
+from src.services.spa_processor import process_spa
+from src.testing.bitrix_standin import BitrixStandin, PortalState, parse_query
+
+
+SORTING = DealStage.SORTING.value
+MAIN = DealStage.MAIN_LIST.value
+AGE = "UF_CRM_1669643033481"
+
+
+def make_state(deal_count=120, spa_id=7):
+    spas = [{
+        "id": spa_id,
+        "title": "SPA",
+        "stageId": SPAStage.IN_PROGRESS.value,
+        "ufCrm9_1740930205": 2,
+        "ufCrm9_1747740109": 1991,
+    }]
+    deals = [
+        {
+            "ID": str(i),
+            "TITLE": f"Deal {i}",
+            "STAGE_ID": SORTING,
+            DEAL_SPA_FIELD: str(spa_id),
+            AGE: str(20 + i % 40) if i % 10 else "",
+            "DATE_MODIFY": "2026-03-01T10:00:00+01:00",
+        }
+        for i in range(1, deal_count + 1)
+    ]
+    return PortalState(spas, deals)
+
+
+@pytest.fixture
+def standin():
+    return BitrixStandin(make_state())
+
+
+@pytest.fixture
+def service(standin, monkeypatch):
+    """BitrixService skierowany na zamiennik (BITRIX_SCHEME=http, BITRIX_DOMAIN=host:port)"""
+    server = make_server("127.0.0.1", 0, standin.create_app(), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    
+    monkeypatch.setenv("BITRIX_SCHEME", "http")
+    monkeypatch.setenv("BITRIX_DOMAIN", f"127.0.0.1:{server.server_port}")
+    service = BitrixService()
+    service.base_url = BitrixConfig().base_url
+    service.session = requests.Session()
+    
+    yield service
+    server.shutdown()
+
+
+class TestDealList:
+    """crm.deal.list - strony po 50, filtry, sortowanie"""
+    
+    def test_keyset_pagination(self, service, standin):
+        """✅ 120 dealów → 3 strony keyset, rosnąco po ID"""
+        deals = service.list_deals({"STAGE_ID": [SORTING]}, ["ID"])
+        
+        assert [int(d["ID"]) for d in deals] == list(range(1, 121))
+        assert standin.stats()["requests"]["crm.deal.list"] == 3
+    
+    def test_offset_page_with_total_and_next(self, service):
+        """✅ start=50 → strona, total i next jak w portalu"""
+        page, next_start = service.list_deals_ordered_page({}, ["ID"], {"ID": "DESC"}, start=50)
+        
+        assert [d["ID"] for d in page][:2] == ["70", "69"]
+        assert next_start == 100
+    
+    def test_probe_counts_matching(self, service):
+        """✅ probe_deals: total i najwyższe ID"""
+        total, top_page = service.probe_deals({"STAGE_ID": SORTING}, ["ID"], after_id=100)
+        
+        assert total == 20
+        assert top_page[0]["ID"] == "120"
+    
+    def test_operator_and_empty_filters(self, service):
+        """✅ <= porównuje liczbowo, "" = pole puste"""
+        younger = service.list_deals({f"<={AGE}": 22}, ["ID"])
+        empty = service.list_deals({AGE: ""}, ["ID"])
+        
+        assert {d["ID"] for d in younger} == {"1", "2", "41", "42", "81", "82"}
+        assert len(empty) == 12
+    
+    def test_select_projection(self, service):
+        """✅ Tylko wybrane pola (+ ID)"""
+        deal = service.list_deals({"ID": ["5"]}, ["STAGE_ID"])[0]
+        
+        assert deal == {"ID": "5", "STAGE_ID": SORTING}
+
+
+class TestBatchAndUpdate:
+    """batch i crm.deal.update"""
+    
+    def test_spa_with_first_page(self, service):
+        """✅ batch z crm.item.get i crm.deal.list (parametry w query string)"""
+        spa, deals = service.get_spa_with_first_page(7, {"STAGE_ID": [SORTING], DEAL_SPA_FIELD: "7"}, ["ID"])
+        
+        assert spa["item"]["id"] == 7
+        assert len(deals) == 50
+    
+    def test_batch_update_stages(self, service, standin):
+        """✅ Zmiana etapu zapisana w stanie, DATE_MODIFY odświeżone"""
+        results = service.batch_update_stages([{"id": "1", "stage": MAIN}, {"id": "999", "stage": MAIN}])
+        
+        assert results["1"] == {"success": True, "error": None}
+        assert results["999"]["success"] is False
+        assert standin.state.deals[1]["STAGE_ID"] == MAIN
+        assert standin.state.deals[1]["DATE_MODIFY"] != "2026-03-01T10:00:00+01:00"
+    
+    def test_missing_spa_raises(self, service):
+        """❌ crm.item.get nieistniejącego SPA → BitrixAPIError NOT_FOUND"""
+        with pytest.raises(BitrixAPIError, match="NOT_FOUND"):
+            service.get_spa(404)
+    
+    def test_process_spa_end_to_end(self, service, standin):
+        """✅ process_spa przeciw zamiennikowi - awanse zapisane w portalu"""
+        result = asyncio.run(process_spa(7, bitrix=AsyncBitrixService(service)))
+        
+        assert len(result.promoted) == 2
+        assert sum(1 for d in standin.state.deals.values() if d["STAGE_ID"] == MAIN) == 2
+
+
+class TestProductionBehaviour:
+    """Opóźnienia, błędy i limit zapytań"""
+    
+    def test_rate_limit_leaky_bucket(self):
+        """✅ Po przepełnieniu kubełka → 503 QUERY_LIMIT_EXCEEDED, po wycieku znowu 200"""
+        # Given
+        now = [0.0]
+        standin = BitrixStandin(make_state(), rate_limit=2, rate_burst=3, clock=lambda: now[0])
+        
+        # When
+        statuses = [standin.handle("crm.item.get", {"entityTypeId": 1032, "id": 7})[0] for _ in range(4)]
+        now[0] += 1
+        after_drain = standin.handle("crm.item.get", {"entityTypeId": 1032, "id": 7})
+        
+        # Then
+        assert statuses == [200, 200, 200, 503]
+        assert after_drain[0] == 200
+        assert standin.stats()["throttled"] == 1
+    
+    def test_error_rate_and_latency(self):
+        """✅ error_rate=1 → 500, opóźnienie latency + jitter"""
+        sleeps = []
+        standin = BitrixStandin(make_state(), latency=0.2, jitter=0.1, error_rate=1.0, seed=1, sleep=sleeps.append)
+        
+        status, payload = standin.handle("crm.deal.list", {})
+        
+        assert (status, payload["error"]) == (500, "INTERNAL_SERVER_ERROR")
+        assert 0.2 <= sleeps[0] <= 0.3
+
+
+class TestParseQuery:
+    """parse_query - parametry komend batch"""
+    
+    def test_nested_keys_and_lists(self):
+        """✅ filter[STAGE_ID][0]=... → lista, filter[>ID] → klucz z operatorem"""
+        params = parse_query("filter[STAGE_ID][0]=A&filter[STAGE_ID][1]=B&filter[%3EID]=5&filter[UF]=&start=-1")
+        
+        assert params == {"filter": {"STAGE_ID": ["A", "B"], ">ID": "5", "UF": ""}, "start": "-1"}
@@ -0,0 +1,99 @@
+"""
+Testy jednostkowe dla filtrów kwalifikacji przenoszonych do crm.deal.list
+"""
+from datetime import datetime
+from src.models import SPA, Deal
+from src.business_logic.validators import QualificationValidator
+from src.services.deal_filters import qualification_filters, ARRIVAL_FIELD, EMPTY
+from src.services.projection import field_aliases
+
+
+AGE_FIELD = field_aliases(Deal, ("age",))[0]
+
+
+def make_spa(**fields):
+    """SPA z podanymi limitami (pozostałe pola domyślne)"""
+    return SPA(id=1, title="SPA", stage_id="DT1032_17:UC_CU0OTZ", free_all=5, **fields)
+
+
+class TestQualificationFilters:
+    """qualification_filters - rozłączne zapytania zachowujące "brak wartości → PASS" """
+    
+    def test_no_limits_single_unfiltered_query(self):
+        """✅ SPA bez limitów → jedno zapytanie bez klauzul"""
+        assert qualification_filters(make_spa()) == [{}]
+    
+    def test_age_limit_not_pushed_to_portal(self):
+        """✅ Limit wieku → bez klauzuli (wiek sprawdza tylko walidator)"""
+        assert qualification_filters(make_spa(age_limit=40)) == [{}]
+    
+    def test_arrival_bounds_widened_by_a_day(self):
+        """✅ Zakres przyjazdu poszerzony o dzień, górna granica = min(DO, szkolenie)"""
+        spa = make_spa(
+            arrival_from=datetime(2025, 10, 10),
+            arrival_to=datetime(2025, 10, 20),
+            training_date=datetime(2025, 10, 15),
+        )
+        
+        clause, empty = qualification_filters(spa)
+        
+        assert clause == {f">={ARRIVAL_FIELD}": "2025-10-09", f"<={ARRIVAL_FIELD}": "2025-10-16"}
+        assert empty == {ARRIVAL_FIELD: EMPTY}
+    
+    def test_both_limits_give_two_queries(self):
+        """✅ Wiek + przyjazd → 2 rozłączne zapytania (tylko przyjazd)"""
+        spa = make_spa(age_limit=40, training_date=datetime(2025, 10, 15))
+        
+        assert len(qualification_filters(spa)) == 2
+    
+    def test_unparseable_age_selected_by_both_paths(self):
+        """✅ Wiek "45.5" (double z portalu) → walidator: brak wieku (PASS), filtr go nie odrzuca"""
+        # Given
+        spa = make_spa(age_limit=40, training_date=datetime(2025, 10, 15))
+        raw_deal = {
+            "ID": "1", "TITLE": "Deal", "STAGE_ID": "C25:UC_10QO3W",
+            AGE_FIELD: "45.5", ARRIVAL_FIELD: "2025-10-12T00:00:00+03:00",
+        }
+        deal = Deal.from_api(raw_deal)
+        
+        # When
+        passes_validator = QualificationValidator().check_age(deal, spa)
+        filtered_fields = {key.lstrip("<>=!") for f in qualification_filters(spa) for key in f}
+        
+        # Then: Pole wieku nie trafia do filtra portalu - obie ścieżki wybierają deal
+        assert deal.age is None
+        assert passes_validator
+        assert AGE_FIELD not in filtered_fields
+    
+    def test_filter_never_excludes_qualifying_deal(self):
+        """✅ Każdy deal przechodzący walidator pasuje do któregoś filtra"""
+        spa = make_spa(age_limit=40, arrival_from=datetime(2025, 10, 10), training_date=datetime(2025, 10, 15))
+        validator = QualificationValidator()
+        filters = qualification_filters(spa)
+        
+        def matches(deal, filter):
+            for key, value in filter.items():
+                field = key.lstrip("<>=")
+                raw = {AGE_FIELD: deal.age, ARRIVAL_FIELD: deal.arrival_date}[field]
+                if value == EMPTY:
+                    if raw:
+                        return False
+                    continue
+                if raw is None:
+                    return False
+                actual = raw.date().isoformat() if isinstance(raw, datetime) else raw
+                if key.startswith("<=") and not actual <= value:
+                    return False
+                if key.startswith(">=") and not actual >= value:
+                    return False
+            return True
+        
+        for age in (None, 18, 40, 41):
+            for day in (None, 9, 10, 14, 15):
+                deal = Deal(
+                    ID="1", TITLE="Deal", STAGE_ID="C25:UC_10QO3W",
+                    UF_CRM_1669643033481=age,
+                    UF_CRM_1740931256=datetime(2025, 10, day) if day else None,
+                )
+                if validator.check_age(deal, spa) and validator.check_arrival_date(deal, spa):
+                    assert any(matches(deal, f) for f in filters), (age, day)
@@ -0,0 +1,285 @@
+"""
+Testy jednostkowe dla kolejki zdarzeń (DebouncedSPAQueue) i endpointu /events/bitrix
+"""
+import pytest
+from flask import Flask
+from src.services import event_queue as event_queue_module
+from src.services import local_store as local_store_module
+from src.services.event_queue import DebouncedSPAQueue
+from src.services.recent_writes import RecentWrites
+from src.webhooks import register_bitrix_events
+from src.webhooks.bitrix_events import parse_event
+from tests.unit.test_local_store import make_deal, make_spa, make_sync
+
+
+class FakeClock:
+    """Zegar monotoniczny przesuwany ręcznie"""
+    
+    def __init__(self):
+        self.now = 100.0
+    
+    def __call__(self):
+        return self.now
+
+
+def make_queue(spa_by_deal=None, **kwargs):
+    """Kolejka z atrapą zlecania i ustalania SPA"""
+    clock, dispatched, resolved = FakeClock(), [], []
+    
+    def resolve(deal_ids):
+        resolved.append(sorted(deal_ids))
+        return {d: spa for d, spa in (spa_by_deal or {}).items() if d in deal_ids}
+    
+    kwargs.setdefault("recent_writes", RecentWrites(clock=clock))
+    queue = DebouncedSPAQueue(dispatched.append, resolve, window=5, max_wait=30, clock=clock, **kwargs)
+    return queue, clock, dispatched, resolved
+
+
+class TestDebouncedSPAQueue:
+    """Seria zdarzeń → jedno przetwarzanie SPA"""
+    
+    def test_burst_collapsed_into_one_run(self):
+        """✅ 10 zdarzeń SPA w serii → jedno zlecenie po ciszy"""
+        # Given
+        queue, clock, dispatched, _ = make_queue()
+        
+        # When: Zdarzenia co sekundę
+        for _ in range(10):
+            queue.add_spa(7)
+            clock.now += 1
+            assert queue.flush() == []
+        
+        # Then: 5 s ciszy → jedno zlecenie
+        clock.now += 5
+        assert queue.flush() == [7]
+        assert dispatched == [7]
+        assert queue.flush() == []
+    
+    def test_max_wait_bounds_delay(self):
+        """✅ Ciągła seria → zlecenie najpóźniej po max_wait"""
+        queue, clock, dispatched, _ = make_queue()
+        
+        for _ in range(40):
+            queue.add_spa(7)
+            queue.flush()
+            clock.now += 1
+        
+        assert dispatched == [7]
+    
+    def test_deal_events_resolved_in_bulk(self):
+        """✅ Deale różnych SPA → jedno ustalenie SPA, jedno zlecenie na SPA"""
+        # Given
+        queue, clock, dispatched, resolved = make_queue({"1": 10, "2": 10, "3": 20})
+        
+        # When
+        for deal_id in ("1", "2", "3", "1"):
+            queue.add_deal(deal_id)
+        queue.flush()
+        clock.now += 5
+        queue.flush()
+        
+        # Then
+        assert resolved == [["1", "2", "3"]]
+        assert sorted(dispatched) == [10, 20]
+    
+    def test_deal_without_spa_ignored(self):
+        """✅ Deal bez SPA → brak zlecenia"""
+        queue, clock, dispatched, _ = make_queue({})
+        
+        queue.add_deal("99")
+        clock.now += 5
+        queue.flush()
+        
+        assert dispatched == []
+        assert queue.stats()["unresolved_deals"] == 1
+    
+    def test_resolve_error_retried_after_window(self):
+        """❌ Błąd ustalania SPA → ponowienie po kolejnym oknie, nie od razu"""
+        calls = []
+        
+        def failing(deal_ids):
+            calls.append(deal_ids)
+            raise RuntimeError("Bitrix niedostępny")
+        
+        clock, dispatched = FakeClock(), []
+        queue = DebouncedSPAQueue(
+            dispatched.append, failing, window=5, max_wait=30, clock=clock, recent_writes=RecentWrites(clock=clock),
+        )
+        queue.add_deal("1")
+        clock.now += 5
+        queue.flush()
+        queue.flush()
+        
+        assert len(calls) == 1
+        assert queue.stats()["pending_deals"] == 1
+    
+    def test_force_flush(self):
+        """✅ force=True - zleca bez czekania"""
+        queue, _, dispatched, _ = make_queue({"5": 50})
+        queue.add_spa(1)
+        queue.add_deal("5")
+        
+        assert sorted(queue.flush(force=True)) == [1, 50]
+
+
+class TestOwnWrites:
+    """Zdarzenia wywołane zapisami samego serwisu"""
+    
+    def test_own_writes_not_dispatched(self):
+        """✅ ONCRMDEALUPDATE dla dealów zapisanych przez serwis → brak zlecenia"""
+        # Given: Serwis właśnie awansował deale 1 i 2 SPA 10
+        clock = FakeClock()
+        recent_writes = RecentWrites(ttl=120, clock=clock)
+        queue, _, dispatched, resolved = make_queue({"1": 10, "2": 10}, recent_writes=recent_writes)
+        recent_writes.record(["1", "2"])
+        
+        # When: Portal odsyła zdarzenia o tych zapisach
+        clock.now += 1
+        added = [queue.add_deal(deal_id) for deal_id in ("1", "2", "1")]
+        clock.now += 5
+        queue.flush(force=True)
+        
+        # Then
+        assert added == [False, False, False]
+        assert dispatched == []
+        assert resolved == []
+        assert queue.stats()["ignored_own_writes"] == 3
+    
+    def test_events_after_ttl_dispatched(self):
+        """✅ Zdarzenie po wygaśnięciu wpisu (zmiana użytkownika) → zwykłe zlecenie"""
+        clock = FakeClock()
+        recent_writes = RecentWrites(ttl=120, clock=clock)
+        queue, _, dispatched, _ = make_queue({"1": 10}, recent_writes=recent_writes)
+        recent_writes.record(["1"])
+        
+        clock.now += 121
+        assert queue.add_deal("1") is True
+        queue.flush(force=True)
+        
+        assert dispatched == [10]
+    
+    def test_batch_update_records_deals(self, monkeypatch):
+        """✅ BitrixService.batch_update_stages zapisuje deale w rejestrze przed wysłaniem"""
+        # Given
+        from src.services.bitrix_service import BitrixService
+        service = BitrixService()
+        service.recent_writes = RecentWrites()
+        seen = []
+        
+        def batch(commands, halt=False):
+            seen.append([service.recent_writes.contains(d) for d in ("5", "6")])
+            raise ConnectionError("timeout")
+        
+        monkeypatch.setattr(service, "batch", batch)
+        
+        # When: Batch nie wrócił - zapis mógł jednak dotrzeć do portalu
+        service.batch_update_stages([{"id": "5", "stage": "X"}, {"id": "6", "stage": "X"}])
+        
+        # Then
+        assert seen == [[True, True]]
+
+
+class TestBitrixEventsEndpoint:
+    """POST /events/bitrix - parsowanie zdarzeń i kolejkowanie"""
+    
+    @pytest.fixture
+    def client(self, monkeypatch):
+        """Aplikacja z endpointem zdarzeń i kolejką bez wątku"""
+        queue, _, _, _ = make_queue()
+        monkeypatch.setattr(event_queue_module, "_queue", queue)
+        monkeypatch.delenv("BITRIX_EVENT_TOKEN", raising=False)
+        monkeypatch.delenv("LOCAL_STORE_PATH", raising=False)
+        
+        app = Flask(__name__)
+        register_bitrix_events(app, lambda spa_id: None)
+        return app.test_client(), queue
+    
+    def test_parse_form_event(self):
+        """✅ Formularz Bitrix24 (klucze data[FIELDS][...])"""
+        event, fields, token = parse_event({
+            "event": "ONCRMDEALUPDATE",
+            "data[FIELDS][ID]": "123",
+            "auth[application_token]": "abc",
+        })
+        
+        assert (event, fields, token) == ("ONCRMDEALUPDATE", {"ID": "123"}, "abc")
+    
+    def test_deal_event_queued(self, client):
+        """✅ ONCRMDEALUPDATE → deal w kolejce"""
+        client, queue = client
+        
+        response = client.post("/events/bitrix", data={"event": "ONCRMDEALUPDATE", "data[FIELDS][ID]": "123"})
+        
+        assert response.json == {"status": "queued", "event": "ONCRMDEALUPDATE", "deal_id": "123"}
+        assert queue.stats()["pending_deals"] == 1
+    
+    def test_spa_event_queued(self, client):
+        """✅ ONCRMDYNAMICITEMUPDATE dla 1032 → SPA w kolejce"""
+        client, queue = client
+        
+        response = client.post("/events/bitrix", data={
+            "event": "ONCRMDYNAMICITEMUPDATE",
+            "data[FIELDS][ID]": "112",
+            "data[FIELDS][ENTITY_TYPE_ID]": "1032",
+        })
+        
+        assert response.json["spa_id"] == 112
+        assert queue.stats()["pending_spas"] == 1
+    
+    def test_other_entity_ignored(self, client):
+        """✅ Inny smart process → ignorowane"""
+        client, queue = client
+        
+        response = client.post("/events/bitrix", data={
+            "event": "ONCRMDYNAMICITEMUPDATE",
+            "data[FIELDS][ID]": "5",
+            "data[FIELDS][ENTITY_TYPE_ID]": "1040",
+        })
+        
+        assert response.json["status"] == "ignored"
+        assert queue.stats()["events"] == 0
+    
+    def test_own_write_event_ignored(self, client):
+        """✅ Zdarzenie o własnym zapisie serwisu → "ignored", nic w kolejce"""
+        client, queue = client
+        queue.recent_writes.record(["77"])
+        
+        response = client.post("/events/bitrix", data={"event": "ONCRMDEALUPDATE", "data[FIELDS][ID]": "77"})
+        
+        assert response.json["status"] == "ignored"
+        assert queue.stats()["pending_deals"] == 0
+    
+    def test_deal_event_marks_local_store_stale(self, client, monkeypatch):
+        """✅ Zdarzenie deala → kopia lokalna odświeżona przed przebiegiem; własny zapis nie"""
+        # Given
+        client, _ = client
+        sync, bitrix, _ = make_sync([make_spa(10)], [make_deal(1, 10)], max_age=60)
+        sync.ensure_fresh()
+        bitrix.calls.clear()
+        monkeypatch.setenv("LOCAL_STORE_PATH", ":memory:")
+        monkeypatch.setattr(local_store_module, "_sync", sync)
+        
+        # When: Zdarzenie o własnym zapisie - kopia poprawiona już lokalnie
+        event_queue_module._queue.recent_writes.record(["1"])
+        client.post("/events/bitrix", data={"event": "ONCRMDEALUPDATE", "data[FIELDS][ID]": "1"})
+        sync.ensure_fresh()
+        own_write_calls = list(bitrix.calls)
+        client.post("/events/bitrix", data={"event": "ONCRMDEALUPDATE", "data[FIELDS][ID]": "2"})
+        sync.ensure_fresh()
+        
+        # Then
+        assert own_write_calls == []
+        assert [name for name, _ in bitrix.calls] == ["list_spas", "list_deals"]
+    
+    def test_wrong_token_rejected(self, client, monkeypatch):
+        """❌ Nieprawidłowy application_token → 403"""
+        client, _ = client
+        monkeypatch.setenv("BITRIX_EVENT_TOKEN", "secret")
+        
+        response = client.post("/events/bitrix", data={
+            "event": "ONCRMDEALUPDATE",
+            "data[FIELDS][ID]": "1",
+            "auth[application_token]": "wrong",
+        })
+        
+        assert response.status_code == 403
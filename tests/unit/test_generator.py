@@ -0,0 +1,98 @@
+"""
+Testy jednostkowe dla generatora syntetycznych portfeli (PortfolioGenerator)
+"""
+from collections import Counter
+from datetime import datetime
+from src.business_logic import DealPromoter
+from src.models import DealStage, Gender
+from src.services.projection import DEAL_SPA_FIELD
+from src.testing.bitrix_standin import BitrixStandin
+from src.testing.generator import (
+    DEAL_AGE, DEAL_ARRIVAL, DEAL_GENDER, FREE_ALL, FREE_CATEGORY_FIELDS,
+    PortfolioGenerator, generate_portfolio,
+)
+
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+class TestPortfolioGenerator:
+    """PortfolioGenerator - powtarzalność i kształt danych"""
+    
+    def test_same_seed_same_data(self):
+        """✅ Ten sam seed i punkt odniesienia → identyczny portfel"""
+        first = PortfolioGenerator(seed=7, now=NOW).portfolio(5, 200)
+        second = PortfolioGenerator(seed=7, now=NOW).portfolio(5, 200)
+        
+        assert first.spas == second.spas
+        assert first.deals == second.deals
+    
+    def test_production_like_distributions(self, synthetic_portfolio):
+        """✅ Mix płci, braki wieku i płci, priorytety przesunięte w stronę P4"""
+        deals = synthetic_portfolio.deals
+        genders = Counter(deal[DEAL_GENDER] for deal in deals)
+        missing_age = sum(1 for deal in deals if deal[DEAL_AGE] is None) / len(deals)
+        
+        assert genders[Gender.MALE.value] > genders[Gender.FEMALE.value] > genders[Gender.COUPLE.value]
+        assert genders[None] > 0
+        assert 0.15 < missing_age < 0.35
+        
+        levels = Counter(deal.get_priority_level() for deal in synthetic_portfolio.deal_models())
+        assert levels[4] > levels[1]
+        assert levels[999] > 0
+    
+    def test_negative_free_slots(self):
+        """✅ Liczniki wolnych miejsc bywają ujemne (nadkomplet)"""
+        spas = generate_portfolio(spa_count=100, deal_count=0, seed=1).spas
+        counters = [spa[field] for spa in spas for field in (FREE_ALL, *FREE_CATEGORY_FIELDS)]
+        
+        assert min(counters) < 0
+        assert any(spa[FREE_ALL] == 0 for spa in spas)
+    
+    def test_arrival_dates_clustered_per_spa(self):
+        """✅ Daty przyjazdu SPA skupione wokół kilku terminów"""
+        generator = PortfolioGenerator(seed=3, now=NOW)
+        spa = generator.spa(1)
+        deals = generator.deals(spa, 500)
+        
+        arrival_days = Counter(deal[DEAL_ARRIVAL][:10] for deal in deals if deal[DEAL_ARRIVAL])
+        top_days = sum(count for _, count in arrival_days.most_common(15))
+        
+        assert top_days / sum(arrival_days.values()) > 0.9
+    
+    def test_uneven_spa_sizes(self, synthetic_portfolio):
+        """✅ Nierówny rozkład dealów na SPA (duże projekty i długi ogon)"""
+        sizes = Counter(deal[DEAL_SPA_FIELD] for deal in synthetic_portfolio.deals).most_common()
+        
+        assert sizes[0][1] > 3 * sizes[-1][1]
+    
+    def test_closed_share(self):
+        """✅ closed_share → część dealów poza Sortowaniem / Rezerwą"""
+        deals = generate_portfolio(spa_count=5, deal_count=1000, seed=2, closed_share=0.3).deals
+        open_stages = {DealStage.SORTING.value, DealStage.RESERVE.value}
+        closed = sum(1 for deal in deals if deal["STAGE_ID"] not in open_stages)
+        
+        assert 200 < closed < 400
+
+
+class TestPortfolioOutputs:
+    """Modele, przetwarzanie i stan zamiennika"""
+    
+    def test_models_processed_by_promoter(self, synthetic_portfolio):
+        """✅ Modele z generatora przechodzą przez DealPromoter (daty ze strefą portalu)"""
+        spa = synthetic_portfolio.spa_models()[0]
+        deals = [deal for deal in synthetic_portfolio.deal_models() if deal.spa_id_alt == str(spa.id)]
+        
+        promoted, reserved, _ = DealPromoter().process(spa, deals)
+        
+        assert len(promoted) + len(reserved) <= len(deals)
+    
+    def test_portal_state_for_standin(self, synthetic_portfolio):
+        """✅ portal_state() → zamiennik zwraca deale SPA"""
+        standin = BitrixStandin(synthetic_portfolio.portal_state())
+        spa_id = synthetic_portfolio.spas[0]["id"]
+        
+        status, payload = standin.handle("crm.deal.list", {"filter": {DEAL_SPA_FIELD: str(spa_id)}, "start": 0})
+        
+        assert status == 200
+        assert payload["total"] == len(synthetic_portfolio.deals_for(spa_id))
@@ -0,0 +1,180 @@
+"""
+Testy jednostkowe dla hedged reads (LatencyTracker, HedgePolicy, AsyncBitrixService)
+"""
+import asyncio
+import threading
+import time
+from src import webhook
+from src.models import SPAStage
+from src.services import async_bitrix as async_bitrix_module
+from src.services import hedging as hedging_module
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.bitrix_service import BitrixService
+from src.services.hedging import HedgePolicy, LatencyTracker
+from src.services.rate_limiter import TokenBucketRateLimiter
+
+
+class SlowFirstService(BitrixService):
+    """Atrapa get_spa - pierwsze wywołanie wolne, kolejne szybkie"""
+    
+    def __init__(self, slow=0.5):
+        super().__init__()
+        self.slow = slow
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def get_spa(self, spa_id):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.slow if call == 1 else 0.01)
+        return {"item": {"id": spa_id, "call": call}}
+
+
+class SlowFirstPageService(BitrixService):
+    """Atrapa odczytu SPA z pierwszą stroną - pierwsze wywołanie wolne"""
+    
+    def __init__(self, slow=1.0):
+        super().__init__()
+        self.slow = slow
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def get_spa_with_first_page(self, spa_id, filter, select):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.slow if call == 1 else 0.01)
+        return {"item": {
+            "id": spa_id,
+            "title": "SPA",
+            "stageId": SPAStage.IN_PROGRESS.value,
+            "ufCrm9_1740930205": 2,
+            "ufCrm9_1747740109": 1991,
+        }}, []
+
+
+def make_policy(tokens=50, operation="get_spa", **kwargs):
+    """Polityka z rozgrzanym trackerem (p95 ≈ 10 ms)"""
+    tracker = LatencyTracker(min_samples=5)
+    for _ in range(20):
+        tracker.record(operation, 0.01)
+    limiter = TokenBucketRateLimiter(rate=10, capacity=tokens)
+    return HedgePolicy(limiter=limiter, min_delay=0.05, tracker=tracker, **kwargs)
+
+
+class TestLatencyTracker:
+    """Percentyle opóźnień per metoda"""
+    
+    def test_percentile_needs_min_samples(self):
+        """✅ Za mało pomiarów → None (bez hedgingu)"""
+        tracker = LatencyTracker(min_samples=3)
+        tracker.record("get_spa", 0.1)
+        
+        assert tracker.percentile("get_spa", 95) is None
+    
+    def test_percentile_per_operation(self):
+        """✅ p95 ze 100 pomiarów 1..100 ms"""
+        tracker = LatencyTracker(min_samples=1)
+        for ms in range(1, 101):
+            tracker.record("get_spa", ms / 1000)
+        
+        assert tracker.percentile("get_spa", 95) == 0.096
+        assert tracker.percentile("probe_deals", 95) is None
+
+
+class TestHedgePolicy:
+    """Limity duplikatów: budżet i rate limiter"""
+    
+    def test_budget_caps_hedges(self):
+        """❌ Budżet 10% → po pierwszym duplikacie kolejny dopiero po 10 odczytach"""
+        policy = make_policy(budget=0.1)
+        
+        policy.hedge_delay("get_spa")
+        assert policy.try_hedge()
+        policy.hedge_delay("get_spa")
+        assert not policy.try_hedge()
+    
+    def test_no_hedge_without_free_tokens(self):
+        """❌ Pusty bufor rate limitera → bez duplikatu"""
+        policy = make_policy()
+        policy.limiter.penalize()
+        
+        policy.hedge_delay("get_spa")
+        
+        assert not policy.try_hedge()
+        assert policy.stats()["denied"] == 1
+
+
+class TestHedgedReads:
+    """AsyncBitrixService - duplikat spóźnionego odczytu"""
+    
+    def test_slow_read_is_hedged(self):
+        """✅ Wolny odczyt → duplikat po p95, wygrywa szybsza odpowiedź"""
+        service = SlowFirstService(slow=0.5)
+        policy = make_policy()
+        
+        # Czas całego asyncio.run() - bez czekania na wątek przegranego
+        started = time.monotonic()
+        result = asyncio.run(AsyncBitrixService(service, hedging=policy).get_spa(1))
+        elapsed = time.monotonic() - started
+        
+        assert result["item"]["call"] == 2
+        assert elapsed < 0.4
+        assert policy.stats()["hedge_wins"] == 1
+    
+    def test_fast_read_not_hedged(self):
+        """✅ Odpowiedź przed p95 → bez duplikatu"""
+        service = SlowFirstService(slow=0.01)
+        policy = make_policy()
+        
+        asyncio.run(AsyncBitrixService(service, hedging=policy).get_spa(1))
+        
+        assert service.calls == 1
+        assert policy.stats()["hedged"] == 0
+    
+    def test_without_samples_no_hedge(self):
+        """✅ Brak pomiarów → czekamy na pierwszy request"""
+        service = SlowFirstService(slow=0.1)
+        policy = HedgePolicy(limiter=TokenBucketRateLimiter(rate=10, capacity=50))
+        
+        result = asyncio.run(AsyncBitrixService(service, hedging=policy).get_spa(1))
+        
+        assert result["item"]["call"] == 1
+        assert service.calls == 1
+    
+    def test_none_disables_hedging(self, monkeypatch):
+        """✅ hedging=None wyłącza hedging mimo globalnej polityki; domyślnie - globalna"""
+        # Given: Globalna polityka z rozgrzanym trackerem
+        policy = make_policy()
+        monkeypatch.setattr(hedging_module, "_policy", policy)
+        service = SlowFirstService(slow=0.2)
+        
+        # When
+        disabled = AsyncBitrixService(service, hedging=None)
+        result = asyncio.run(disabled.get_spa(1))
+        
+        # Then: Bez duplikatu - czekamy na wolny pierwszy request
+        assert disabled.hedging is None
+        assert result["item"]["call"] == 1
+        assert service.calls == 1
+        assert policy.stats()["hedged"] == 0
+        assert AsyncBitrixService(service).hedging is policy
+    
+    def test_run_spa_does_not_wait_for_loser(self, monkeypatch):
+        """✅ run_spa: wolny odczyt (1 s) za szybkim duplikatem → odpowiedź bez czekania na przegranego"""
+        # Given: Globalna polityka, BitrixService z wolnym pierwszym odczytem
+        monkeypatch.setattr(hedging_module, "_policy", make_policy(operation="get_spa_with_first_page"))
+        monkeypatch.setattr(async_bitrix_module, "BitrixService", SlowFirstPageService)
+        monkeypatch.setenv("RUN_CACHE_SIZE", "0")
+        monkeypatch.delenv("LOCAL_STORE_PATH", raising=False)
+        monkeypatch.delenv("PROMOTION_JOURNAL_PATH", raising=False)
+        
+        # When
+        started = time.monotonic()
+        payload = webhook.run_spa(1)
+        elapsed = time.monotonic() - started
+        
+        # Then
+        assert payload["status"] == "success"
+        assert elapsed < 0.6
@@ -0,0 +1,54 @@
+"""
+Testy jednostkowe dla wspólnej sesji HTTP i singletona klienta Bitrix24
+"""
+import importlib
+from b24pysdk.bitrix_api.requesters import BitrixAPIRequester
+from src.config import BitrixConfig, get_bitrix_client
+from src.services.http_session import create_http_session, get_http_session
+
+
+class TestHttpSession:
+    """Jedna sesja z pulą połączeń dla całego procesu"""
+    
+    def test_session_is_singleton(self):
+        """✅ get_http_session() zawsze zwraca tę samą sesję"""
+        assert get_http_session() is get_http_session()
+    
+    def test_pool_size_from_config(self, monkeypatch):
+        """✅ Rozmiar puli pochodzi z BITRIX_POOL_SIZE"""
+        # Given
+        monkeypatch.setenv("BITRIX_POOL_SIZE", "4")
+        
+        # When
+        session = create_http_session(BitrixConfig())
+        adapter = session.get_adapter("https://example.bitrix24.pl")
+        
+        # Then
+        assert adapter._pool_maxsize == 4
+        assert adapter._pool_connections == 4
+    
+    def test_timeout_from_config(self, monkeypatch):
+        """✅ Timeout (connect, read) pochodzi z konfiguracji"""
+        monkeypatch.setenv("BITRIX_CONNECT_TIMEOUT", "2")
+        monkeypatch.setenv("BITRIX_READ_TIMEOUT", "7")
+        
+        assert BitrixConfig().timeout == (2.0, 7.0)
+
+
+class TestBitrixClientSingleton:
+    """get_bitrix_client() - jeden klient na proces"""
+    
+    def test_client_is_singleton(self):
+        """✅ Kolejne wywołania zwracają ten sam obiekt"""
+        assert get_bitrix_client() is get_bitrix_client()
+    
+    def test_sdk_module_not_patched(self):
+        """✅ Utworzenie klienta nie podmienia requestera b24pysdk"""
+        # Given: Moduł, nie funkcja `call` re-eksportowana przez pakiet
+        sdk_call_module = importlib.import_module("b24pysdk.bitrix_api.functions.call")
+        
+        # When
+        get_bitrix_client()
+        
+        # Then
+        assert sdk_call_module.BitrixAPIRequester is BitrixAPIRequester
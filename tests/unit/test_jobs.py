@@ -0,0 +1,103 @@
+"""
+Testy jednostkowe dla JobManager (zadania w tle)
+"""
+import threading
+import pytest
+from src.services.jobs import Job, JobManager, JobQueueFullError
+
+
+def wait_done(manager, job_id):
+    """Czeka aż zadanie się zakończy"""
+    for _ in range(200):
+        job = manager.get(job_id)
+        if not job.active:
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError(f"Zadanie {job_id} nie zakończyło się")
+
+
+class TestJobManager:
+    """Przyjmowanie, wykonanie i stan zadań"""
+    
+    def test_job_succeeds_with_result(self):
+        """✅ Zadanie zwraca wynik i czasy"""
+        # Given
+        manager = JobManager(workers=2)
+        
+        # When
+        job = manager.submit((1, False), lambda: {"status": "success", "spa_id": 1})
+        done = wait_done(manager, job.id)
+        
+        # Then
+        state = done.to_dict()
+        assert state["status"] == Job.SUCCEEDED
+        assert state["result"] == {"status": "success", "spa_id": 1}
+        assert state["timings"]["run_seconds"] is not None
+        manager.shutdown()
+    
+    def test_job_failure_recorded(self):
+        """❌ Błąd przetwarzania → status failed z typem błędu"""
+        manager = JobManager(workers=1)
+        
+        def failing():
+            raise RuntimeError("Bitrix niedostępny")
+        
+        done = wait_done(manager, manager.submit(1, failing).id)
+        
+        assert done.status == Job.FAILED
+        assert done.error == "Bitrix niedostępny"
+        assert done.error_type == "RuntimeError"
+        manager.shutdown()
+    
+    def test_active_job_reused_for_same_key(self):
+        """✅ Ponowienie w trakcie → to samo zadanie, brak drugiego przebiegu"""
+        # Given: Zadanie zablokowane w toku
+        manager = JobManager(workers=2)
+        release = threading.Event()
+        calls = []
+        
+        def job_func():
+            calls.append(1)
+            release.wait(2)
+            return {}
+        
+        first = manager.submit((1, False), job_func)
+        
+        # When
+        second = manager.submit((1, False), job_func)
+        release.set()
+        wait_done(manager, first.id)
+        
+        # Then
+        assert second.id == first.id
+        assert len(calls) == 1
+        
+        # Then: Po zakończeniu - nowe zadanie
+        assert manager.submit((1, False), lambda: {}).id != first.id
+        manager.shutdown()
+    
+    def test_queue_full_rejected(self):
+        """❌ Limit aktywnych zadań → JobQueueFullError"""
+        manager = JobManager(workers=1, queue_size=1)
+        release = threading.Event()
+        manager.submit(1, lambda: release.wait(2) and {})
+        
+        with pytest.raises(JobQueueFullError):
+            manager.submit(2, lambda: {})
+        
+        release.set()
+        manager.shutdown()
+    
+    def test_finished_jobs_evicted_beyond_retention(self):
+        """✅ Pamiętamy najwyżej `retention` zakończonych zadań"""
+        manager = JobManager(workers=1, retention=2)
+        ids = [manager.submit(i, lambda: {}).id for i in range(4)]
+        manager.shutdown()
+        
+        assert manager.get(ids[0]) is None
+        assert manager.get(ids[-1]).status == Job.SUCCEEDED
+        assert manager.stats()["succeeded"] == 2
+    
+    def test_unknown_job(self):
+        """❌ Nieznane ID → None"""
+        assert JobManager(workers=1).get("brak") is None
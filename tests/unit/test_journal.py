@@ -0,0 +1,143 @@
+"""
+Testy jednostkowe dla dziennika awansów (PromotionJournal, resume_pending)
+"""
+import asyncio
+from src.models import DealStage
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.journal import APPLIED, FAILED, PLANNED, SKIPPED, PromotionJournal, resume_pending
+from src.services.spa_processor import process_spa
+from tests.unit.test_spa_processor import FakeBitrixService
+
+
+MAIN = DealStage.MAIN_LIST.value
+RESERVE = DealStage.RESERVE.value
+SORTING = DealStage.SORTING.value
+
+
+class FakeAsyncBitrix:
+    """Atrapa odczytu etapów i zapisu paczek"""
+    
+    def __init__(self, stages):
+        self.stages = stages
+        self.updates = []
+    
+    async def list_deals(self, filter, select):
+        return [{"ID": deal_id, "STAGE_ID": self.stages[deal_id]} for deal_id in filter["ID"] if deal_id in self.stages]
+    
+    async def batch_update_stages(self, updates, on_chunk=None):
+        self.updates.extend(updates)
+        outcomes = {u["id"]: {"success": True, "error": None} for u in updates}
+        for update in updates:
+            self.stages[update["id"]] = update["stage"]
+        if on_chunk is not None:
+            on_chunk(outcomes)
+        return outcomes
+
+
+def planned_run(journal, updates, applied=()):
+    """Plan przebiegu SPA 7; `applied` - deale zapisane przed awarią"""
+    run_id = journal.plan({7: updates})
+    stages = {u["id"]: u["stage"] for u in updates}
+    journal.record(run_id, stages, {deal_id: {"success": True} for deal_id in applied})
+    return run_id
+
+
+class TestPromotionJournal:
+    """PromotionJournal - plan, wyniki, oczekujące"""
+    
+    def test_pending_without_outcome(self):
+        """✅ Oczekujące = zaplanowane bez wyniku"""
+        journal = PromotionJournal(":memory:")
+        planned_run(journal, [{"id": "1", "stage": MAIN}, {"id": "2", "stage": MAIN}], applied=["1"])
+        
+        assert [p["deal_id"] for p in journal.pending()] == ["2"]
+        assert journal.pending()[0]["spa_id"] == 7
+    
+    def test_failed_write_not_pending(self):
+        """✅ Zapis z błędem to wynik - nie jest wznawiany"""
+        journal = PromotionJournal(":memory:")
+        run_id = journal.plan({7: [{"id": "1", "stage": MAIN}]})
+        
+        journal.record(run_id, {"1": MAIN}, {"1": {"success": False, "error": "ACCESS_DENIED"}})
+        
+        assert journal.pending() == []
+        assert journal.stats()["events"] == {PLANNED: 1, FAILED: 1}
+    
+    def test_history_for_spa(self):
+        """✅ Historia SPA - plan i wyniki, najnowsze pierwsze"""
+        journal = PromotionJournal(":memory:")
+        planned_run(journal, [{"id": "1", "stage": MAIN}], applied=["1"])
+        journal.plan({8: [{"id": "9", "stage": MAIN}]})
+        
+        history = journal.history(spa_id=7)
+        
+        assert [(e["deal_id"], e["event"]) for e in history] == [("1", APPLIED), ("1", PLANNED)]
+
+
+class TestResumePending:
+    """resume_pending - wznowienie po awarii"""
+    
+    def test_resumes_only_pending_writes(self):
+        """✅ 3 z 5 zapisane przed awarią → wznowienie tylko 2"""
+        # Given
+        journal = PromotionJournal(":memory:")
+        updates = [{"id": str(i), "stage": MAIN} for i in range(1, 6)]
+        planned_run(journal, updates, applied=["1", "2", "3"])
+        bitrix = FakeAsyncBitrix({"1": MAIN, "2": MAIN, "3": MAIN, "4": SORTING, "5": RESERVE})
+        
+        # When
+        counts = asyncio.run(resume_pending(journal, bitrix))
+        
+        # Then
+        assert [u["id"] for u in bitrix.updates] == ["4", "5"]
+        assert counts == {APPLIED: 2, FAILED: 0, SKIPPED: 0}
+        assert journal.pending() == []
+    
+    def test_write_landed_before_crash(self):
+        """✅ Deal już w etapie docelowym (wynik nie trafił do dziennika) → applied bez zapisu"""
+        journal = PromotionJournal(":memory:")
+        planned_run(journal, [{"id": "1", "stage": RESERVE}])
+        bitrix = FakeAsyncBitrix({"1": RESERVE})
+        
+        counts = asyncio.run(resume_pending(journal, bitrix))
+        
+        assert bitrix.updates == []
+        assert counts[APPLIED] == 1
+    
+    def test_moved_deal_skipped(self):
+        """✅ Deal przeniesiony ręcznie po planie → skipped"""
+        journal = PromotionJournal(":memory:")
+        planned_run(journal, [{"id": "1", "stage": MAIN}])
+        bitrix = FakeAsyncBitrix({"1": "C17:LOSE"})
+        
+        counts = asyncio.run(resume_pending(journal, bitrix))
+        
+        assert bitrix.updates == []
+        assert counts[SKIPPED] == 1
+        assert journal.pending() == []
+    
+    def test_stale_plan_skipped(self):
+        """✅ Plan starszy niż max_age → bez zapisu"""
+        journal = PromotionJournal(":memory:")
+        planned_run(journal, [{"id": "1", "stage": MAIN}])
+        bitrix = FakeAsyncBitrix({"1": SORTING})
+        
+        counts = asyncio.run(resume_pending(journal, bitrix, max_age=-1))
+        
+        assert bitrix.updates == []
+        assert counts[SKIPPED] == 1
+
+
+class TestProcessSpaJournal:
+    """process_spa z dziennikiem"""
+    
+    def test_plan_and_outcomes_recorded(self):
+        """✅ Plan przed zapisem, wynik każdego deala po paczce"""
+        spa = {"id": 7, "title": "SPA", "stageId": "DT1032_17:UC_CU0OTZ", "ufCrm9_1740930205": 2, "ufCrm9_1747740109": 1991}
+        deals = [{"ID": str(i), "TITLE": f"Deal {i}", "STAGE_ID": SORTING} for i in range(1, 4)]
+        journal = PromotionJournal(":memory:")
+        
+        asyncio.run(process_spa(7, bitrix=AsyncBitrixService(FakeBitrixService(spa, deals)), journal=journal))
+        
+        assert journal.stats()["events"] == {PLANNED: 3, APPLIED: 3}
+        assert journal.pending() == []
@@ -0,0 +1,288 @@
+"""
+Testy jednostkowe dla kopii lokalnej (LocalStore, StoreSync)
+"""
+import asyncio
+from datetime import datetime, timezone
+from src.models import DealStage, DealPriority, SPAStage
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.local_store import LocalStore, StoreSync
+from src.services.projection import DEAL_SPA_FIELD
+from src.services.spa_processor import process_spa
+from tests.unit.test_spa_processor import FakeBitrixService
+
+
+def make_spa(spa_id, stage=SPAStage.IN_PROGRESS.value, updated="2026-03-01T10:00:00+01:00"):
+    return {
+        "id": spa_id,
+        "title": f"SPA {spa_id}",
+        "stageId": stage,
+        "ufCrm9_1740930205": 2,
+        "ufCrm9_1747740109": 1991,
+        "updatedTime": updated,
+    }
+
+
+def make_deal(deal_id, spa_id, stage=DealStage.SORTING.value, modified="2026-03-01T10:00:00+01:00"):
+    return {
+        "ID": str(deal_id),
+        "TITLE": f"Deal {deal_id}",
+        "STAGE_ID": stage,
+        "UF_CRM_1743329864": DealPriority.P1.value,
+        "DATE_MODIFY": modified,
+        DEAL_SPA_FIELD: str(spa_id),
+    }
+
+
+class FakeClock:
+    """Zegar monotoniczny przesuwany ręcznie"""
+    
+    def __init__(self):
+        self.now = 100.0
+    
+    def __call__(self):
+        return self.now
+
+
+class FakeAsyncBitrix:
+    """Atrapa odczytów synchronizacji - zapisuje filtry zapytań"""
+    
+    def __init__(self, spas, deals):
+        self.spas = spas
+        self.deals = deals
+        self.calls = []
+    
+    async def list_spas(self, filter, select=None):
+        self.calls.append(("list_spas", filter))
+        return self.spas
+    
+    async def list_deals(self, filter, select):
+        self.calls.append(("list_deals", filter))
+        return self.deals
+    
+    async def list_deals_parallel(self, filter, select, after_id=0):
+        self.calls.append(("list_deals_parallel", filter))
+        return self.deals
+
+
+SYNC_STARTED = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def make_sync(spas, deals, **kwargs):
+    clock = FakeClock()
+    bitrix = FakeAsyncBitrix(spas, deals)
+    kwargs.setdefault("wall_clock", lambda: SYNC_STARTED)
+    kwargs.setdefault("spawn", lambda run: run())
+    sync = StoreSync(LocalStore(":memory:"), bitrix=bitrix, clock=clock, **kwargs)
+    return sync, bitrix, clock
+
+
+class TestLocalStore:
+    """LocalStore - schemat, odczyt po (spa_id, stage_id)"""
+    
+    def test_indexes_created(self):
+        """✅ Indeksy (spa_id, stage_id) i DATE_MODIFY"""
+        store = LocalStore(":memory:")
+        
+        indexes = {row[0] for row in store._conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        
+        assert {"idx_deals_spa_stage", "idx_deals_date_modify"} <= indexes
+    
+    def test_deals_for_spa_filters_and_orders(self):
+        """✅ Tylko deale SPA z etapów SORTING/RESERVE, rosnąco po ID"""
+        store = LocalStore(":memory:")
+        store.upsert_deals([
+            make_deal(3, 10),
+            make_deal(1, 10, stage=DealStage.RESERVE.value),
+            make_deal(2, 20),
+            make_deal(4, 10, stage=DealStage.MAIN_LIST.value),
+        ])
+        
+        assert [d["ID"] for d in store.deals_for_spa(10)] == ["1", "3"]
+    
+    def test_set_stages_updates_row_and_data(self):
+        """✅ Własny zapis etapu → kolumna i JSON deala"""
+        store = LocalStore(":memory:")
+        store.upsert_deals([make_deal(1, 10)])
+        
+        store.set_stages({"1": DealStage.MAIN_LIST.value})
+        
+        assert store.deals_for_spa(10) == []
+        assert store.deals_for_spa(10, [DealStage.MAIN_LIST.value])[0]["STAGE_ID"] == DealStage.MAIN_LIST.value
+
+
+class TestStoreSync:
+    """StoreSync - pełna i przyrostowa synchronizacja"""
+    
+    def test_first_sync_is_full(self):
+        """✅ Pusta kopia → SPA "W trakcie" + deale SORTING/RESERVE"""
+        sync, bitrix, _ = make_sync([make_spa(10)], [make_deal(1, 10), make_deal(2, 10)])
+        
+        sync.ensure_fresh()
+        
+        assert [name for name, _ in bitrix.calls] == ["list_spas", "list_deals_parallel"]
+        assert bitrix.calls[1][1]["STAGE_ID"] == [DealStage.SORTING.value, DealStage.RESERVE.value]
+        assert sync.store.counts() == {"spas": 1, "deals": 2}
+    
+    def test_incremental_uses_watermark_with_overlap(self):
+        """✅ Kolejna synchronizacja → DATE_MODIFY > najnowsza data - zapas"""
+        # Given
+        sync, bitrix, clock = make_sync([make_spa(10)], [make_deal(1, 10, modified="2026-03-01T10:05:00+01:00")])
+        sync.ensure_fresh()
+        
+        # When: Deal 1 wyszedł z Sortowania, deal 2 nowy
+        bitrix.calls.clear()
+        bitrix.spas = []
+        bitrix.deals = [
+            make_deal(1, 10, stage=DealStage.MAIN_LIST.value, modified="2026-03-01T10:06:00+01:00"),
+            make_deal(2, 10, modified="2026-03-01T10:07:00+01:00"),
+        ]
+        clock.now += 10
+        sync.ensure_fresh()
+        
+        # Then
+        assert bitrix.calls[1] == ("list_deals", {">DATE_MODIFY": "2026-03-01T10:04:00+01:00"})
+        assert [d["ID"] for d in sync.store.deals_for_spa(10)] == ["2"]
+        assert sync.stats()["deals_watermark"] == "2026-03-01T10:07:00+01:00"
+    
+    def test_fresh_copy_not_synced(self):
+        """✅ Kopia młodsza niż max_age → bez zapytań"""
+        sync, bitrix, clock = make_sync([make_spa(10)], [make_deal(1, 10)], max_age=5)
+        sync.ensure_fresh()
+        bitrix.calls.clear()
+        
+        clock.now += 2
+        sync.ensure_fresh()
+        
+        assert bitrix.calls == []
+    
+    def test_closed_spa_removed(self):
+        """✅ SPA poza "W trakcie" wypada z kopii"""
+        sync, bitrix, clock = make_sync([make_spa(10)], [make_deal(1, 10)])
+        sync.ensure_fresh()
+        
+        bitrix.spas = [make_spa(10, stage="DT1032_17:SUCCESS", updated="2026-03-01T11:00:00+01:00")]
+        clock.now += 10
+        sync.ensure_fresh()
+        
+        assert sync.store.get_spa(10) is None
+    
+    def test_full_sync_after_interval(self):
+        """✅ Po full_interval → ponowna pełna synchronizacja (usuwa skasowane deale)"""
+        sync, bitrix, clock = make_sync([make_spa(10)], [make_deal(1, 10)], full_interval=3600)
+        sync.ensure_fresh()
+        
+        bitrix.deals = []
+        clock.now += 3600
+        sync.ensure_fresh()
+        
+        assert sync.stats()["full_syncs"] == 2
+        assert sync.store.counts()["deals"] == 0
+    
+    def test_full_sync_runs_in_background(self):
+        """✅ Pusta kopia → pełna synchronizacja tylko zlecona, przebieg czyta z API"""
+        # Given
+        spawned = []
+        sync, bitrix, _ = make_sync([make_spa(10)], [make_deal(1, 10)], spawn=spawned.append)
+        
+        # When
+        ready = sync.ensure_fresh()
+        ready_again = sync.ensure_fresh()
+        
+        # Then: Bez zapytań w wątku requestu, jedna synchronizacja naraz
+        assert (ready, ready_again) == (False, False)
+        assert bitrix.calls == []
+        assert len(spawned) == 1
+        
+        spawned[0]()
+        assert sync.ensure_fresh()
+        assert sync.store.counts() == {"spas": 1, "deals": 1}
+    
+    def test_expired_full_interval_only_incremental_inline(self):
+        """✅ Po full_interval request robi przyrostową, pełna idzie w tle"""
+        # Given
+        spawned = []
+        sync, bitrix, clock = make_sync([make_spa(10)], [make_deal(1, 10)], full_interval=3600)
+        sync.ensure_fresh()
+        sync._spawn = spawned.append
+        bitrix.calls.clear()
+        
+        # When
+        clock.now += 3600
+        assert sync.ensure_fresh()
+        
+        # Then
+        assert [name for name, _ in bitrix.calls] == ["list_spas", "list_deals"]
+        assert len(spawned) == 1
+        assert sync.stats()["full_sync_running"]
+    
+    def test_full_sync_watermark_not_after_start(self):
+        """✅ Po pełnej synchronizacji znacznik ≤ start - zmiany w trakcie pobierania nie giną"""
+        # Given: Przyrostowa w trakcie pełnej przesunęła znacznik za start
+        sync, _, _ = make_sync([make_spa(10)], [make_deal(1, 10, modified="2026-03-01T14:00:00+01:00")])
+        sync.store.set_meta("deals_watermark", "2026-03-01T15:00:00+01:00")
+        
+        # When
+        sync.sync(full=True)
+        
+        # Then: min(najnowsza data z portalu, start)
+        assert sync.stats()["deals_watermark"] == SYNC_STARTED.isoformat()
+    
+    def test_empty_full_sync_sets_watermark_to_start(self):
+        """✅ Pełna synchronizacja bez dealów → znacznik = start, kolejne przyrostowe"""
+        # Given: Cichy portal - brak SPA i dealów
+        sync, bitrix, clock = make_sync([], [])
+        sync.ensure_fresh()
+        
+        # When
+        bitrix.calls.clear()
+        clock.now += 10
+        sync.ensure_fresh()
+        
+        # Then
+        assert sync.stats()["deals_watermark"] == SYNC_STARTED.isoformat()
+        assert sync.stats()["full_syncs"] == 1
+        assert ("list_deals", {">DATE_MODIFY": "2026-03-01T11:59:00+00:00"}) in bitrix.calls
+    
+    def test_stale_copy_synced_before_max_age(self):
+        """✅ mark_stale() (zdarzenie Bitrix24) → synchronizacja mimo młodej kopii"""
+        sync, bitrix, clock = make_sync([make_spa(10)], [make_deal(1, 10)], max_age=5)
+        sync.ensure_fresh()
+        bitrix.calls.clear()
+        
+        sync.mark_stale()
+        clock.now += 1
+        sync.ensure_fresh()
+        sync.ensure_fresh()
+        
+        assert [name for name, _ in bitrix.calls] == ["list_spas", "list_deals"]
+
+
+class TestProcessSpaFromStore:
+    """process_spa z kopią lokalną"""
+    
+    def test_reads_locally_and_records_writes(self):
+        """✅ Odczyt bez API, zapis przez API, etapy w kopii od razu poprawione"""
+        # Given
+        store = LocalStore(":memory:")
+        store.upsert_spas([make_spa(10)])
+        store.upsert_deals([make_deal(i, 10) for i in range(1, 4)])
+        fake = FakeBitrixService({}, [])
+        
+        # When
+        result = asyncio.run(process_spa(10, bitrix=AsyncBitrixService(fake), store=store))
+        
+        # Then
+        assert fake.requests == []
+        assert len(fake.updates) == 3
+        assert {d.id for d in result.promoted} == {u["id"] for u in fake.updates if u["stage"] == DealStage.MAIN_LIST.value}
+        assert [d["STAGE_ID"] for d in store.deals_for_spa(10)] == [DealStage.RESERVE.value]
+    
+    def test_spa_missing_from_store_read_from_api(self):
+        """✅ SPA spoza kopii → odczyt z API"""
+        store = LocalStore(":memory:")
+        fake = FakeBitrixService(make_spa(10), [make_deal(1, 10)])
+        
+        result = asyncio.run(process_spa(10, dry_run=True, bitrix=AsyncBitrixService(fake), store=store))
+        
+        assert fake.requests == ["batch"]
+        assert len(result.promoted) == 1
@@ -215,3 +215,46 @@ class TestEdgeCases:
         assert len(result) == 1
         assert result[0].id == sample_deal.id
 
+
+class TestTimezoneAwareDates:
+    """Daty EXECUTING z API mają strefę czasową (np. +03:00)"""
+    
+    def test_aware_dates_with_missing_date(self, genderless_spa):
+        """✅ Daty ze strefą + deal bez daty w tym samym priorytecie → bez TypeError, brak daty na końcu"""
+        # Given
+        prioritizer = DealPrioritizer()
+        
+        deals = [
+            Deal(ID="no_date", TITLE="Bez daty", STAGE_ID="C25:UC_5I8UBF",
+                 UF_CRM_1743329864=DealPriority.P1.value),
+            Deal(ID="later", TITLE="Później", STAGE_ID="C25:UC_5I8UBF",
+                 UF_CRM_1743329864=DealPriority.P1.value,
+                 UF_CRM_1741856527="2025-10-02T10:00:00+03:00"),
+            Deal(ID="earlier", TITLE="Wcześniej", STAGE_ID="C25:UC_5I8UBF",
+                 UF_CRM_1743329864=DealPriority.P1.value,
+                 UF_CRM_1741856527="2025-10-01T10:00:00+03:00"),
+        ]
+        
+        # When
+        sorted_deals = prioritizer.sort(deals, genderless_spa)
+        
+        # Then
+        assert [d.id for d in sorted_deals] == ["earlier", "later", "no_date"]
+    
+    def test_dates_compared_as_instants(self, genderless_spa):
+        """✅ Różne strefy - porównanie momentów, nie zapisu (09:00+01:00 po 09:30+02:00)"""
+        prioritizer = DealPrioritizer()
+        
+        deals = [
+            Deal(ID="cet", TITLE="CET", STAGE_ID="C25:UC_5I8UBF",
+                 UF_CRM_1743329864=DealPriority.P2.value,
+                 UF_CRM_1741856527="2025-10-01T09:00:00+01:00"),
+            Deal(ID="eet", TITLE="EET", STAGE_ID="C25:UC_5I8UBF",
+                 UF_CRM_1743329864=DealPriority.P2.value,
+                 UF_CRM_1741856527="2025-10-01T09:30:00+02:00"),
+        ]
+        
+        sorted_deals = prioritizer.sort_genderless(deals)
+        
+        assert [d.id for d in sorted_deals] == ["eet", "cet"]
+
@@ -0,0 +1,35 @@
+"""
+Testy jednostkowe dla projekcji pól (select)
+"""
+import pytest
+from src.models import Deal
+from src.services.projection import deal_select, field_aliases
+
+
+class TestDealSelect:
+    """deal_select - minimalna projekcja z aliasów modelu Deal"""
+    
+    def test_uses_model_aliases(self):
+        """✅ Wszystkie pola select to aliasy pól modelu Deal"""
+        aliases = {field.alias for field in Deal.model_fields.values()}
+        
+        assert set(deal_select()) <= aliases
+    
+    def test_gendered_includes_gender_and_housing(self):
+        """✅ SPA płciowe / nieznane - płeć i mieszkanie w projekcji"""
+        for select in (deal_select(), deal_select(genderless=False)):
+            assert "UF_CRM_1740931105" in select
+            assert "UF_CRM_1740931164" in select
+    
+    def test_genderless_skips_gender_and_housing(self):
+        """✅ SPA bezpłciowe - bez płci i mieszkania"""
+        select = deal_select(genderless=True)
+        
+        assert "UF_CRM_1740931105" not in select
+        assert "UF_CRM_1740931164" not in select
+        assert {"ID", "TITLE", "STAGE_ID", "UF_CRM_1743329864", "UF_CRM_1741856527"} <= set(select)
+    
+    def test_unknown_field_raises(self):
+        """❌ Nieistniejące pole modelu → KeyError"""
+        with pytest.raises(KeyError):
+            field_aliases(Deal, ("no_such_field",))
@@ -0,0 +1,189 @@
+"""
+Testy jednostkowe dla TokenBucketRateLimiter i RateLimitedAdapter
+
+Zegar i sleep są podmienione - testy nie czekają naprawdę.
+"""
+import asyncio
+import io
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from src.services.rate_limiter import (
+    RateLimitedAdapter,
+    RateLimitTimeout,
+    count_requests,
+    record_request,
+    TokenBucketRateLimiter,
+    is_throttled,
+)
+
+
+class FakeClock:
+    """Zegar sterowany ręcznie - sleep() przesuwa czas"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_limiter(clock, rate=2.0, capacity=5, **kwargs):
+    return TokenBucketRateLimiter(rate=rate, capacity=capacity, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def make_response(status_code, payload=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = (payload or b"{}")
+    response.raw = io.BytesIO(response._content)
+    response.headers.update(headers or {})
+    return response
+
+
+class TestTokenBucket:
+    """Token bucket - burst do pojemności, potem tempo portalu"""
+    
+    def test_burst_without_waiting(self, clock):
+        """✅ Pierwsze `capacity` requestów bez czekania"""
+        limiter = make_limiter(clock, capacity=5)
+        
+        waits = [limiter.acquire() for _ in range(5)]
+        
+        assert waits == [0.0] * 5
+        assert limiter.stats()["waited"] == 0
+    
+    def test_waits_at_portal_rate_after_burst(self, clock):
+        """✅ Po wyczerpaniu bufora - czekanie 1/rate na token"""
+        limiter = make_limiter(clock, rate=2.0, capacity=1)
+        limiter.acquire()
+        
+        waited = limiter.acquire()
+        
+        assert waited == pytest.approx(0.5)
+        stats = limiter.stats()
+        assert stats["waited"] == 1
+        assert stats["total_wait_seconds"] == pytest.approx(0.5)
+    
+    def test_try_acquire_does_not_block(self, clock):
+        """✅ try_acquire() zwraca False zamiast czekać"""
+        limiter = make_limiter(clock, capacity=1)
+        
+        assert limiter.try_acquire() is True
+        assert limiter.try_acquire() is False
+    
+    def test_acquire_timeout_raises_without_sleeping(self, clock):
+        """❌ Token za 0.5 s, timeout 0.2 s → RateLimitTimeout od razu"""
+        limiter = make_limiter(clock, rate=2.0, capacity=1)
+        limiter.acquire()
+        
+        with pytest.raises(RateLimitTimeout):
+            limiter.acquire(timeout=0.2)
+        
+        assert clock.now == 0.0
+        assert limiter.acquire(timeout=1.0) == pytest.approx(0.5)
+
+
+class TestAdaptiveBackoff:
+    """Backoff po QUERY_LIMIT_EXCEEDED"""
+    
+    def test_penalize_blocks_callers(self, clock):
+        """✅ Po limicie wszyscy czekają na koniec pauzy"""
+        limiter = make_limiter(clock, capacity=5, base_backoff=1.0)
+        
+        limiter.penalize()
+        waited = limiter.acquire()
+        
+        assert waited >= 1.0
+        assert limiter.stats()["throttled"] == 1
+    
+    def test_backoff_grows_exponentially(self, clock):
+        """✅ Kolejne limity z rzędu → coraz dłuższa pauza"""
+        limiter = make_limiter(clock, base_backoff=1.0, max_backoff=3.0)
+        
+        assert [limiter.penalize() for _ in range(4)] == [1.0, 2.0, 3.0, 3.0]
+    
+    def test_retry_after_header_respected(self, clock):
+        """✅ Retry-After dłuższy niż backoff wygrywa"""
+        limiter = make_limiter(clock, base_backoff=1.0)
+        
+        assert limiter.penalize(retry_after=7) == 7
+    
+    def test_rate_halves_and_recovers(self, clock):
+        """✅ Tempo spada o połowę i wraca stopniowo po sukcesach"""
+        limiter = make_limiter(clock, rate=2.0)
+        
+        limiter.penalize()
+        assert limiter.stats()["current_rate"] == 1.0
+        
+        for _ in range(20):
+            limiter.record_success()
+        assert limiter.stats()["current_rate"] == 2.0
+
+
+class TestRateLimitedAdapter:
+    """Adapter HTTP - limiter dla każdego requestu, ponowienie po limicie"""
+    
+    def test_retries_after_query_limit_exceeded(self, clock, monkeypatch):
+        """✅ QUERY_LIMIT_EXCEEDED → backoff i ponowienie"""
+        # Given
+        responses = [
+            make_response(503, b'{"error": "QUERY_LIMIT_EXCEEDED"}'),
+            make_response(200, b'{"result": true}'),
+        ]
+        monkeypatch.setattr(HTTPAdapter, "send", lambda self, request, **kw: responses.pop(0))
+        limiter = make_limiter(clock)
+        adapter = RateLimitedAdapter(limiter=limiter)
+        
+        # When
+        response = adapter.send(requests.Request("POST", "https://x/rest/crm.deal.list").prepare())
+        
+        # Then
+        assert response.status_code == 200
+        assert limiter.stats()["throttled"] == 1
+        assert limiter.stats()["acquired"] == 2
+    
+    def test_gives_up_after_max_retries(self, clock, monkeypatch):
+        """❌ Ciągły limit → zwraca ostatnią odpowiedź po max ponowieniach"""
+        monkeypatch.setattr(
+            HTTPAdapter, "send",
+            lambda self, request, **kw: make_response(503, b'{"error": "QUERY_LIMIT_EXCEEDED"}'),
+        )
+        limiter = make_limiter(clock, max_backoff=1.0)
+        adapter = RateLimitedAdapter(limiter=limiter, max_throttle_retries=2)
+        
+        response = adapter.send(requests.Request("POST", "https://x/rest/batch").prepare())
+        
+        assert response.status_code == 503
+        assert limiter.stats()["throttled"] == 3
+    
+    def test_is_throttled_detection(self):
+        """✅ Rozpoznaje 503 i QUERY_LIMIT_EXCEEDED, ignoruje inne błędy"""
+        assert is_throttled(make_response(503))
+        assert is_throttled(make_response(400, b'{"error": "QUERY_LIMIT_EXCEEDED"}'))
+        assert not is_throttled(make_response(400, b'{"error": "NOT_FOUND"}'))
+        assert not is_throttled(make_response(200, b'{"result": []}'))
+
+
+class TestCountRequests:
+    """count_requests - requesty jednego przebiegu"""
+    
+    def test_counts_requests_in_to_thread(self):
+        """✅ Requesty z wątków asyncio.to_thread liczone w kontekście przebiegu"""
+        async def run():
+            await asyncio.gather(*(asyncio.to_thread(record_request) for _ in range(3)))
+        
+        with count_requests() as counter:
+            asyncio.run(run())
+        record_request()
+        
+        assert counter.count == 3
+
@@ -0,0 +1,285 @@
+"""
+Testy jednostkowe dla CircuitBreaker i ResilientAdapter
+
+Zegar, sleep i jitter są podmienione - testy nie czekają naprawdę.
+"""
+import io
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from src.services.rate_limiter import RateLimitTimeout, TokenBucketRateLimiter
+from src.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientAdapter,
+    is_idempotent,
+)
+
+
+class FakeClock:
+    """Zegar sterowany ręcznie - sleep() przesuwa czas"""
+    
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_response(status_code, payload=b"{}"):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = payload
+    response.raw = io.BytesIO(payload)
+    return response
+
+
+def make_request(method, body=None):
+    return requests.Request("POST", f"https://x/rest/1/key/{method}", json=body).prepare()
+
+
+def make_adapter(clock, breaker=None, **kwargs):
+    limiter = TokenBucketRateLimiter(rate=100, capacity=100, clock=clock, sleep=clock.sleep)
+    return ResilientAdapter(
+        limiter=limiter,
+        breaker=breaker or CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock),
+        clock=clock,
+        sleep=clock.sleep,
+        jitter=lambda low, high: high,
+        **kwargs
+    )
+
+
+def fail_then(responses):
+    """Atrapa HTTPAdapter.send - kolejno rzuca wyjątki / zwraca odpowiedzi"""
+    calls = []
+    
+    def send(self, request, **kwargs):
+        calls.append(kwargs.get("timeout"))
+        outcome = responses.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    return send, calls
+
+
+class TestCircuitBreaker:
+    """Circuit breaker - closed → open → half-open → closed"""
+    
+    def test_opens_after_threshold(self, clock):
+        """❌ 3 błędy z rzędu → breaker otwarty, requesty odrzucane"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+        
+        for _ in range(3):
+            assert breaker.allow()
+            breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert breaker.stats()["rejected"] == 1
+    
+    def test_success_resets_failures(self, clock):
+        """✅ Sukces zeruje licznik błędów"""
+        breaker = CircuitBreaker(failure_threshold=3, clock=clock)
+        
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_half_open_allows_single_probe(self, clock):
+        """✅ Po reset_timeout jedna próba; sukces zamyka, błąd otwiera ponownie"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        
+        clock.now = 30
+        assert breaker.allow()
+        assert not breaker.allow(), "Tylko jedna próba w half-open"
+        
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        
+        clock.now = 60
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestIdempotency:
+    """is_idempotent - które requesty można ponowić"""
+    
+    def test_methods(self):
+        """✅ Odczyty - tak, update/add/delete - nie"""
+        assert is_idempotent(make_request("crm.deal.list"))
+        assert is_idempotent(make_request("crm.item.get.json"))
+        assert not is_idempotent(make_request("crm.deal.update"))
+        assert not is_idempotent(make_request("crm.deal.add"))
+        assert not is_idempotent(make_request("crm.deal.delete"))
+    
+    def test_batch_checks_every_command(self):
+        """✅ Batch idempotentny tylko gdy wszystkie komendy są idempotentne"""
+        safe = {"cmd": {"a": "crm.deal.list?start=-1", "b": "crm.item.get?id=2"}}
+        updates = {"cmd": {"a": "crm.deal.update?id=1", "b": "crm.deal.update?id=2"}}
+        unsafe = {"cmd": {"a": "crm.item.get?id=2", "b": "crm.deal.add?fields[TITLE]=x"}}
+        
+        assert is_idempotent(make_request("batch", safe))
+        assert not is_idempotent(make_request("batch", updates))
+        assert not is_idempotent(make_request("batch", unsafe))
+
+
+class TestResilientAdapter:
+    """Adapter - ponowienia z backoffem, deadline, fail fast"""
+    
+    def test_retries_idempotent_read_with_backoff(self, clock, monkeypatch):
+        """✅ 502, timeout, potem 200 → sukces po 2 ponowieniach (0.5 s, 1 s)"""
+        send, calls = fail_then([
+            make_response(502),
+            requests.ReadTimeout(),
+            make_response(200, b'{"result": []}'),
+        ])
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        
+        response = make_adapter(clock).send(make_request("crm.deal.list"), timeout=(3.05, 10))
+        
+        assert response.status_code == 200
+        assert len(calls) == 3
+        assert clock.sleeps == [0.5, 1.0]
+    
+    def test_does_not_retry_non_idempotent(self, clock, monkeypatch):
+        """❌ crm.deal.add z timeoutem → bez ponowienia"""
+        send, calls = fail_then([requests.ReadTimeout()])
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        
+        with pytest.raises(requests.ReadTimeout):
+            make_adapter(clock).send(make_request("crm.deal.add"))
+        
+        assert len(calls) == 1
+    
+    def test_connect_timeout_always_retried(self, clock, monkeypatch):
+        """✅ ConnectTimeout (request nie wysłany) → ponowienie także dla add"""
+        send, calls = fail_then([requests.ConnectTimeout(), make_response(200)])
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        
+        response = make_adapter(clock).send(make_request("crm.deal.add"))
+        
+        assert response.status_code == 200
+    
+    def test_timeout_capped_by_deadline(self, clock, monkeypatch):
+        """✅ Timeout próby nie przekracza czasu do deadline; brak ponowień po deadline"""
+        send, calls = fail_then([requests.ReadTimeout()] * 5)
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        adapter = make_adapter(clock, deadline=2.0, retry_attempts=5)
+        
+        with pytest.raises(requests.ReadTimeout):
+            adapter.send(make_request("crm.deal.list"), timeout=(3.05, 10))
+        
+        # Pauzy 0.5 s i 1 s mieszczą się w 2 s, kolejna (2 s) już nie
+        assert calls == [(2.0, 2.0), (1.5, 1.5), (0.5, 0.5)]
+    
+    def test_open_breaker_fails_fast(self, clock, monkeypatch):
+        """❌ Po serii błędów kolejne wywołania odrzucane bez wysyłania"""
+        send, calls = fail_then([requests.ConnectionError()] * 3)
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        adapter = make_adapter(clock, retry_attempts=0)
+        
+        for _ in range(3):
+            with pytest.raises(requests.ConnectionError):
+                adapter.send(make_request("crm.deal.list"))
+        
+        with pytest.raises(CircuitOpenError):
+            adapter.send(make_request("crm.deal.list"))
+        
+        assert len(calls) == 3
+    
+    def test_throttling_does_not_trip_breaker(self, clock, monkeypatch):
+        """✅ QUERY_LIMIT_EXCEEDED to nie awaria portalu"""
+        send, _ = fail_then([make_response(503, b'{"error": "QUERY_LIMIT_EXCEEDED"}')] * 3)
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        breaker = CircuitBreaker(failure_threshold=1, clock=clock)
+        
+        response = make_adapter(clock, breaker=breaker, max_throttle_retries=2).send(make_request("crm.deal.list"))
+        
+        assert response.status_code == 503
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_update_not_retried_after_read_timeout(self, clock, monkeypatch):
+        """❌ crm.deal.update z ReadTimeout → bez ponowienia (zapis mógł dotrzeć do portalu)"""
+        send, calls = fail_then([requests.ReadTimeout(), make_response(200)])
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        
+        with pytest.raises(requests.ReadTimeout):
+            make_adapter(clock).send(make_request("crm.deal.update"))
+        
+        assert len(calls) == 1
+
+
+class TestDeadlineWithThrottling:
+    """Deadline obejmuje czekanie na token i pauzy po QUERY_LIMIT_EXCEEDED"""
+    
+    def test_throttled_call_ends_within_deadline(self, clock, monkeypatch):
+        """✅ Ciągłe 503 (backoff do 60 s) → wywołanie kończy się przed deadline 5 s"""
+        # Given
+        throttled = make_response(503, b'{"error": "QUERY_LIMIT_EXCEEDED"}')
+        send, calls = fail_then([throttled] * 10)
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        adapter = make_adapter(clock, deadline=5.0, max_throttle_retries=5)
+        
+        # When
+        response = adapter.send(make_request("crm.deal.list"), timeout=(3.05, 10))
+        
+        # Then - pauzy 1 s i 2 s mieszczą się, 4 s już nie
+        assert response.status_code == 503
+        assert clock.now <= 5.0
+        assert len(calls) == 3
+        assert all(read <= 5.0 for _, read in calls)
+    
+    def test_blocked_limiter_raises_before_sending(self, clock, monkeypatch):
+        """❌ Limiter wstrzymany na 60 s, deadline 5 s → RateLimitTimeout bez czekania i wysyłki"""
+        # Given
+        send, calls = fail_then([make_response(200)])
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        breaker = CircuitBreaker(failure_threshold=1, clock=clock)
+        adapter = make_adapter(clock, breaker=breaker, deadline=5.0)
+        adapter.limiter.penalize(retry_after=60)
+        
+        # When / Then
+        with pytest.raises(RateLimitTimeout):
+            adapter.send(make_request("crm.deal.list"))
+        
+        assert calls == []
+        assert clock.now == 0.0
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_limiter_timeout_releases_half_open_probe(self, clock, monkeypatch):
+        """✅ RateLimitTimeout w half-open → próba zwolniona, kolejne wywołanie zamyka breaker"""
+        # Given: Breaker otwarty, limiter wstrzymany na 100 s
+        send, calls = fail_then([make_response(200)])
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        adapter = make_adapter(clock, breaker=breaker, deadline=5.0)
+        adapter.limiter.penalize(retry_after=100)
+        clock.now = 30.0
+        
+        # When
+        with pytest.raises(RateLimitTimeout):
+            adapter.send(make_request("crm.deal.list"))
+        clock.now = 200.0
+        response = adapter.send(make_request("crm.deal.list"))
+        
+        # Then
+        assert response.status_code == 200
+        assert breaker.state == CircuitBreaker.CLOSED
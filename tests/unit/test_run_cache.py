@@ -0,0 +1,206 @@
+"""
+Testy jednostkowe dla cache przebiegów (odcisk danych wejściowych, ETag/304)
+"""
+import asyncio
+import pytest
+from src import webhook
+from src.models import SPA, Deal, DealStage, DealPriority
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.run_cache import RunCache, input_fingerprint
+from src.services.spa_processor import process_spa
+from tests.unit.test_spa_processor import FakeBitrixService
+
+
+@pytest.fixture
+def spa_data():
+    """Surowe dane SPA bezpłciowego z 2 wolnymi miejscami"""
+    return {
+        "id": 200,
+        "title": "SPA testowe",
+        "stageId": "DT1032_17:UC_CU0OTZ",
+        "ufCrm9_1740930205": 2,
+        "ufCrm9_1747740109": 1991,
+    }
+
+
+@pytest.fixture
+def deals_data():
+    """3 deale w Sortowaniu z datą modyfikacji"""
+    return [
+        {
+            "ID": str(i),
+            "TITLE": f"Deal {i}",
+            "STAGE_ID": DealStage.SORTING.value,
+            "UF_CRM_1743329864": DealPriority.P1.value,
+            "DATE_MODIFY": "2026-03-01T10:00:00+01:00",
+        }
+        for i in range(1, 4)
+    ]
+
+
+class FailingWrites(FakeBitrixService):
+    """Atrapa, w której każdy zapis etapu się nie udaje"""
+    
+    def batch_update_stages(self, updates):
+        self.updates.extend(updates)
+        return {u["id"]: {"success": False, "error": "ACCESS_DENIED"} for u in updates}
+
+
+class TestInputFingerprint:
+    """input_fingerprint - pola SPA + (ID, etap, DATE_MODIFY) dealów"""
+    
+    def test_deal_order_irrelevant(self, spa_data, deals_data):
+        """✅ Ta sama zawartość w innej kolejności → ten sam odcisk"""
+        spa = SPA.from_api(spa_data)
+        deals = [Deal.from_api(d) for d in deals_data]
+        
+        assert input_fingerprint(spa, deals) == input_fingerprint(spa, list(reversed(deals)))
+    
+    def test_deal_change_changes_fingerprint(self, spa_data, deals_data):
+        """✅ Zmiana DATE_MODIFY lub etapu deala → inny odcisk"""
+        spa = SPA.from_api(spa_data)
+        base = input_fingerprint(spa, [Deal.from_api(d) for d in deals_data])
+        
+        modified = [{**deals_data[0], "DATE_MODIFY": "2026-03-02T10:00:00+01:00"}] + deals_data[1:]
+        moved = [{**deals_data[0], "STAGE_ID": DealStage.RESERVE.value}] + deals_data[1:]
+        
+        assert input_fingerprint(spa, [Deal.from_api(d) for d in modified]) != base
+        assert input_fingerprint(spa, [Deal.from_api(d) for d in moved]) != base
+    
+    def test_spa_fields(self, spa_data, deals_data):
+        """✅ Pole reguł SPA zmienia odcisk, metadane (updatedTime, tytuł) nie"""
+        deals = [Deal.from_api(d) for d in deals_data]
+        base = input_fingerprint(SPA.from_api(spa_data), deals)
+        
+        metadata = SPA.from_api({**spa_data, "title": "Inny", "updatedTime": "2026-03-01T12:00:00+00:00"})
+        limits = SPA.from_api({**spa_data, "ufCrm9_1740930205": 3})
+        
+        assert input_fingerprint(metadata, deals) == base
+        assert input_fingerprint(limits, deals) != base
+
+
+class TestRunCache:
+    """RunCache - ostatni wynik per klucz, LRU"""
+    
+    def test_hit_only_for_same_fingerprint(self):
+        """✅ Wynik tylko dla identycznego odcisku"""
+        cache = RunCache()
+        cache.put((1, False), "abc", "wynik")
+        
+        assert cache.get((1, False), "abc") == "wynik"
+        assert cache.get((1, False), "xyz") is None
+        assert cache.get((1, True), "abc") is None
+        assert cache.stats()["hits"] == 1
+    
+    def test_evicts_least_recently_used(self):
+        """✅ Ponad max_entries → usuwany najdawniej używany"""
+        cache = RunCache(max_entries=2)
+        cache.put(1, "a", 1)
+        cache.put(2, "b", 2)
+        cache.get(1, "a")
+        cache.put(3, "c", 3)
+        
+        assert cache.get(2, "b") is None
+        assert cache.get(1, "a") == 1
+
+
+class TestProcessSpaCache:
+    """process_spa z cache - pominięcie decyzji i zapisu"""
+    
+    def test_unchanged_input_skips_writes(self, spa_data, deals_data):
+        """✅ Drugi przebieg bez zmian → wynik z cache, brak zapisu"""
+        # Given: Pierwszy przebieg zapisuje 2 awanse i 1 rezerwę
+        cache = RunCache()
+        fake = FakeBitrixService(spa_data, deals_data)
+        first = asyncio.run(process_spa(200, bitrix=AsyncBitrixService(fake), cache=cache))
+        writes = len(fake.updates)
+        
+        # When: Te same dane (np. zapis nie zmienił DATE_MODIFY w atrapie)
+        second = asyncio.run(process_spa(200, bitrix=AsyncBitrixService(fake), cache=cache))
+        
+        # Then
+        assert writes == 3
+        assert len(fake.updates) == writes
+        assert second.cached and not first.cached
+        assert second.fingerprint == first.fingerprint
+        assert [d.id for d in second.promoted] == [d.id for d in first.promoted]
+        
+        # Then: Bez zapisów w tym przebiegu (nie liczymy awansów drugi raz)
+        assert first.updates_count == 3
+        assert second.updates_count == 0
+        assert second.update_results == {}
+    
+    def test_changed_deal_reprocessed(self, spa_data, deals_data):
+        """✅ Zmieniony deal → pełne przetwarzanie"""
+        cache = RunCache()
+        fake = FakeBitrixService(spa_data, deals_data)
+        asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake), cache=cache))
+        
+        fake.deals[0]["DATE_MODIFY"] = "2026-03-01T11:00:00+01:00"
+        result = asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake), cache=cache))
+        
+        assert not result.cached
+    
+    def test_failed_writes_not_cached(self, spa_data, deals_data):
+        """❌ Nieudany zapis → przebieg nie trafia do cache, kolejny ponawia zapis"""
+        cache = RunCache()
+        fake = FailingWrites(spa_data, deals_data)
+        
+        asyncio.run(process_spa(200, bitrix=AsyncBitrixService(fake), cache=cache))
+        result = asyncio.run(process_spa(200, bitrix=AsyncBitrixService(fake), cache=cache))
+        
+        assert not result.cached
+        assert len(fake.updates) == 6
+    
+    def test_dry_run_and_live_cached_separately(self, spa_data, deals_data):
+        """✅ Wynik dry-run nie zastępuje przebiegu z zapisem"""
+        cache = RunCache()
+        fake = FakeBitrixService(spa_data, deals_data)
+        
+        asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake), cache=cache))
+        result = asyncio.run(process_spa(200, bitrix=AsyncBitrixService(fake), cache=cache))
+        
+        assert not result.cached
+        assert len(fake.updates) == 3
+
+
+class TestConditionalResponse:
+    """ETag i 304 w webhooku"""
+    
+    @pytest.fixture
+    def client(self, monkeypatch):
+        """Webhook z podmienionym przetwarzaniem"""
+        payloads = {
+            7: {"status": "success", "spa_id": 7, "fingerprint": "abc123", "cached": True},
+            8: {"status": "success", "spa_id": 8, "fingerprint": "abc123", "cached": False, "stats": {"updates_executed": 2}},
+        }
+        monkeypatch.setattr(webhook, "run_spa", payloads.get)
+        return webhook.app.test_client()
+    
+    def test_etag_set(self, client):
+        """✅ Odpowiedź z ETag = odcisk"""
+        response = client.get("/webhook/spa/7")
+        
+        assert response.status_code == 200
+        assert response.headers["ETag"] == '"abc123"'
+    
+    def test_matching_etag_returns_304(self, client):
+        """✅ If-None-Match = odcisk, wynik z cache → 304 bez treści"""
+        response = client.get("/webhook/spa/7", headers={"If-None-Match": '"abc123"'})
+        
+        assert response.status_code == 304
+        assert response.data == b""
+    
+    def test_matching_etag_on_live_run_returns_body(self, client):
+        """✅ If-None-Match = odcisk, przebieg z zapisem → 200 z liczbą zapisów"""
+        response = client.get("/webhook/spa/8", headers={"If-None-Match": '"abc123"'})
+        
+        assert response.status_code == 200
+        assert response.json["stats"]["updates_executed"] == 2
+    
+    def test_stale_etag_returns_body(self, client):
+        """✅ Inny ETag klienta → 200 z wynikiem"""
+        response = client.get("/webhook/spa/7", headers={"If-None-Match": '"old"'})
+        
+        assert response.status_code == 200
+        assert response.json["spa_id"] == 7
@@ -0,0 +1,254 @@
+"""
+Testy jednostkowe dla AdaptiveScheduler (adaptacyjne odpytywanie SPA)
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+from src.services.rate_limiter import record_request
+from src.services.recent_writes import RecentWrites
+from src.services.scheduler import AdaptiveScheduler, SPAPollState
+from src.services.sweep import DEAL_SPA_FIELD
+
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    """Zegar monotoniczny przesuwany ręcznie"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+class FakeAsyncBitrix:
+    """Atrapa list_spas / list_deals - każde wywołanie = 1 request"""
+    
+    def __init__(self, spas):
+        self.spas = spas
+        self.changed_deals = []
+        self.deal_filters = []
+    
+    async def list_spas(self, filter, select=None):
+        record_request()
+        return self.spas
+    
+    async def list_deals(self, filter, select, after_id=0):
+        record_request()
+        self.deal_filters.append(filter)
+        return self.changed_deals
+
+
+def make_spa(spa_id, updated="2026-02-01T10:00:00+00:00", training=None):
+    return {
+        "id": spa_id,
+        "title": f"SPA {spa_id}",
+        "stageId": "DT1032_17:UC_CU0OTZ",
+        "ufCrm9_1740930205": 2,
+        "updatedTime": updated,
+        "ufCrm9_1740930537": training,
+    }
+
+
+def make_scheduler(spas, run_cost=0, **kwargs):
+    """Harmonogram z atrapami; każdy przebieg SPA zużywa `run_cost` requestów"""
+    clock, runs = FakeClock(), []
+    bitrix = FakeAsyncBitrix(spas)
+    
+    def run(spa_id):
+        for _ in range(run_cost):
+            record_request()
+        runs.append(spa_id)
+    
+    kwargs.setdefault("recent_writes", RecentWrites(clock=clock))
+    scheduler = AdaptiveScheduler(
+        run, bitrix=bitrix, clock=clock, now=lambda: NOW,
+        refresh_interval=60, base_interval=300, min_interval=60, max_interval=3600,
+        **kwargs
+    )
+    return scheduler, clock, bitrix, runs
+
+
+class TestAdaptiveScheduler:
+    """Odstępy zależne od zmian, szkolenia i budżetu"""
+    
+    def test_first_tick_processes_all_spas(self):
+        """✅ Pierwszy takt - wszystkie aktywne SPA (bez zapytania o deale)"""
+        scheduler, _, bitrix, runs = make_scheduler([make_spa(1), make_spa(2)])
+        
+        assert scheduler.run_once() == [1, 2]
+        assert bitrix.deal_filters == []
+    
+    def test_unchanged_spa_backs_off(self):
+        """✅ Brak zmian → odstęp rośnie 2x, SPA nie jest przetwarzane co takt"""
+        # Given
+        scheduler, clock, _, runs = make_scheduler([make_spa(1)])
+        scheduler.run_once()
+        
+        # When: Bazowy odstęp minął, bez zmian
+        clock.now += 300
+        scheduler.run_once()
+        
+        # Then: Przetworzone ponownie, odstęp 600 s
+        assert runs == [1, 1]
+        assert scheduler.status()["spas"][0]["interval_seconds"] == 600
+        
+        # Then: Po kolejnych 300 s - jeszcze nie
+        clock.now += 300
+        assert scheduler.run_once() == []
+    
+    def test_deal_change_triggers_run(self):
+        """✅ Zmieniony deal SPA → przetworzenie przy najbliższym odświeżeniu"""
+        # Given
+        scheduler, clock, bitrix, runs = make_scheduler([make_spa(1), make_spa(2)])
+        scheduler.run_once()
+        
+        # When: Deal SPA 2 zmieniony
+        bitrix.changed_deals = [{"ID": "9", DEAL_SPA_FIELD: "2"}]
+        clock.now += 60
+        
+        # Then
+        assert scheduler.run_once() == [2]
+        assert ">DATE_MODIFY" in bitrix.deal_filters[0]
+        assert bitrix.deal_filters[0][DEAL_SPA_FIELD] == ["1", "2"]
+    
+    def test_spa_update_triggers_run(self):
+        """✅ Zmiana updatedTime SPA → przetworzenie"""
+        scheduler, clock, bitrix, runs = make_scheduler([make_spa(1)])
+        scheduler.run_once()
+        
+        bitrix.spas = [make_spa(1, updated="2026-03-01T11:59:00+00:00")]
+        clock.now += 60
+        
+        assert scheduler.run_once() == [1]
+    
+    def test_upcoming_training_shortens_interval(self):
+        """✅ Szkolenie za 3 dni → odstęp min. po zmianie, bazowy bez zmian"""
+        training = (NOW + timedelta(days=3)).isoformat()
+        scheduler, clock, _, _ = make_scheduler([make_spa(1, training=training)])
+        
+        scheduler.run_once()
+        assert scheduler.status()["spas"][0]["interval_seconds"] == 60
+        
+        clock.now += 60
+        scheduler.run_once()
+        clock.now += 120
+        scheduler.run_once()
+        assert scheduler.status()["spas"][0]["interval_seconds"] <= 300
+    
+    def test_budget_defers_runs(self):
+        """✅ Budżet 10 requestów/min, przebieg = 4 → reszta SPA czeka"""
+        # Given
+        spas = [make_spa(i) for i in range(1, 6)]
+        scheduler, clock, _, runs = make_scheduler(spas, run_cost=4, budget=10)
+        
+        # When
+        first = scheduler.run_once()
+        
+        # Then: Odświeżenie (1) + 2 przebiegi (8) - kolejne po uzupełnieniu budżetu
+        assert len(first) == 2
+        assert scheduler.status()["deferred"] == 1
+        
+        clock.now += 60
+        assert len(scheduler.run_once()) >= 1
+    
+    def test_error_retried_after_base_interval(self):
+        """❌ Błąd przetwarzania → ponowienie po bazowym odstępie"""
+        scheduler, clock, _, _ = make_scheduler([make_spa(1)])
+        
+        def failing(spa_id):
+            raise RuntimeError("Bitrix niedostępny")
+        
+        scheduler.run = failing
+        scheduler.run_once()
+        
+        state = scheduler.status()["spas"][0]
+        assert state["last_error"] == "Bitrix niedostępny"
+        assert state["interval_seconds"] == 300
+        assert scheduler.status()["errors"] == 1
+    
+    def test_inactive_spa_removed(self):
+        """✅ SPA bez wolnych miejsc / zamknięte znika z harmonogramu"""
+        scheduler, clock, bitrix, _ = make_scheduler([make_spa(1), make_spa(2)])
+        scheduler.run_once()
+        
+        bitrix.spas = [make_spa(2)]
+        clock.now += 60
+        scheduler.run_once()
+        
+        assert [s["spa_id"] for s in scheduler.status()["spas"]] == [2]
+    
+    def test_past_training_not_urgent(self):
+        """✅ Szkolenie, które już się odbyło → zwykłe odstępy (nie pilne)"""
+        training = (NOW - timedelta(days=2)).isoformat()
+        scheduler, _, _, _ = make_scheduler([make_spa(1, training=training)])
+        
+        scheduler.run_once()
+        
+        state = SPAPollState(1, 300, 0)
+        state.training_date = NOW - timedelta(days=2)
+        
+        assert scheduler.status()["spas"][0]["interval_seconds"] == 300
+        assert not scheduler.is_urgent(state)
+
+
+class TestChangeDetection:
+    """Własne zapisy i zakładka odświeżeń nie są zmianą"""
+    
+    def test_own_writes_do_not_count_as_change(self):
+        """✅ DATE_MODIFY odświeżone przez awans serwisu → SPA nadal zwalnia"""
+        # Given: Serwis zapisał deal 9 SPA 1
+        scheduler, clock, bitrix, runs = make_scheduler([make_spa(1)])
+        scheduler.run_once()
+        scheduler.recent_writes.record(["9"])
+        
+        # When
+        bitrix.changed_deals = [{"ID": "9", DEAL_SPA_FIELD: "1", "DATE_MODIFY": "2026-03-01T12:00:30+00:00"}]
+        clock.now += 60
+        
+        # Then
+        assert scheduler.run_once() == []
+        assert scheduler.status()["spas"][0]["changed"] is False
+    
+    def test_change_seen_once_despite_overlap(self):
+        """✅ Ta sama zmiana w zakładce dwóch odświeżeń → jedno przetworzenie"""
+        scheduler, clock, bitrix, runs = make_scheduler([make_spa(1)])
+        scheduler.run_once()
+        
+        bitrix.changed_deals = [{"ID": "9", DEAL_SPA_FIELD: "1", "DATE_MODIFY": "2026-03-01T12:00:30+00:00"}]
+        clock.now += 60
+        assert scheduler.run_once() == [1]
+        
+        clock.now += 60
+        assert scheduler.run_once() == []
+
+
+class TestRunCost:
+    """Koszt przebiegu = requesty harmonogramu, nie całego procesu"""
+    
+    def test_concurrent_traffic_not_charged(self):
+        """✅ Równoległy ruch innego wątku (webhooki) nie zjada budżetu harmonogramu"""
+        # Given: Przebieg SPA = 2 requesty, w tym czasie inny wątek wysyła 50
+        scheduler, clock, _, _ = make_scheduler([make_spa(1)], run_cost=2, budget=100)
+        
+        def other_traffic():
+            for _ in range(50):
+                record_request()
+        
+        original = scheduler.run
+        
+        def run(spa_id):
+            thread = threading.Thread(target=other_traffic)
+            thread.start()
+            thread.join()
+            original(spa_id)
+        
+        scheduler.run = run
+        
+        # When
+        scheduler.run_once()
+        
+        # Then: Odświeżenie (1) + przebieg (2)
+        assert scheduler.status()["budget_available"] == 97
+
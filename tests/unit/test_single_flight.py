@@ -0,0 +1,218 @@
+"""
+Testy jednostkowe dla SingleFlight (koalescencja przetwarzania SPA)
+"""
+import threading
+import time
+import pytest
+from src.services.single_flight import SingleFlight
+
+
+class BlockingJob:
+    """Atrapa przetwarzania - czeka na sygnał, liczy wywołania"""
+    
+    def __init__(self, error=None):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+        self._lock = threading.Lock()
+    
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        self.started.set()
+        self.release.wait(2)
+        if self.error:
+            raise self.error
+        return f"run-{call}"
+
+
+def run_in_thread(flight, key, job, results, **kwargs):
+    """Wywołuje flight.do w wątku, wynik/błąd dopisuje do results"""
+    def target():
+        try:
+            results.append(flight.do(key, job, **kwargs))
+        except Exception as error:
+            results.append(error)
+    
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def wait_for_waiters(flight, key, count):
+    """Czeka aż `count` wywołań dołączy do przebiegu w toku"""
+    deadline = time.monotonic() + 2
+    while flight.in_flight().get(key, 0) < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+class TestSingleFlight:
+    """Jeden przebieg per klucz, współdzielony wynik, jeden follow-up"""
+    
+    def test_single_call_runs_func(self):
+        """✅ Pojedyncze wywołanie - wynik niewspółdzielony"""
+        flight = SingleFlight()
+        
+        assert flight.do("spa", lambda: 42) == (42, False)
+        assert flight.in_flight() == {}
+    
+    def test_concurrent_callers_share_one_run(self):
+        """✅ Równoczesne wywołania - jedno wykonanie, ten sam wynik"""
+        # Given: Lider w toku, follow-up przechwycony
+        follow_ups = []
+        flight = SingleFlight(spawn=follow_ups.append)
+        job = BlockingJob()
+        results = []
+        threads = [run_in_thread(flight, 1, job, results)]
+        job.started.wait(2)
+        
+        # When: 3 kolejne wywołania w trakcie
+        threads += [run_in_thread(flight, 1, job, results) for _ in range(3)]
+        wait_for_waiters(flight, 1, 3)
+        job.release.set()
+        for thread in threads:
+            thread.join(2)
+        
+        # Then: func wykonane raz, wszyscy dostali "run-1"
+        assert job.calls == 1
+        assert [result for result, _ in results] == ["run-1"] * 4
+        assert all(shared for _, shared in results)
+        
+        # Then: najwyżej jeden przebieg uzupełniający
+        assert len(follow_ups) == 1
+    
+    def test_follow_up_runs_func_again(self):
+        """✅ Przebieg uzupełniający wykonuje func ponownie"""
+        follow_ups = []
+        flight = SingleFlight(spawn=follow_ups.append)
+        job = BlockingJob()
+        results = []
+        leader = run_in_thread(flight, 1, job, results)
+        job.started.wait(2)
+        waiter = run_in_thread(flight, 1, job, results)
+        wait_for_waiters(flight, 1, 1)
+        job.release.set()
+        leader.join(2)
+        waiter.join(2)
+        
+        # When: Uruchom zleconego follow-upa
+        follow_ups[0]()
+        
+        # Then: Drugie wykonanie, bez kolejnego follow-upa
+        assert job.calls == 2
+        assert len(follow_ups) == 1
+    
+    def test_no_follow_up_when_disabled(self):
+        """✅ follow_up=False (dry-run) - tylko współdzielenie wyniku"""
+        follow_ups = []
+        flight = SingleFlight(spawn=follow_ups.append)
+        job = BlockingJob()
+        results = []
+        leader = run_in_thread(flight, 1, job, results, follow_up=False)
+        job.started.wait(2)
+        waiter = run_in_thread(flight, 1, job, results, follow_up=False)
+        wait_for_waiters(flight, 1, 1)
+        job.release.set()
+        leader.join(2)
+        waiter.join(2)
+        
+        assert job.calls == 1
+        assert follow_ups == []
+    
+    def test_different_keys_run_independently(self):
+        """✅ Różne SPA - osobne przebiegi"""
+        flight = SingleFlight(spawn=lambda target: None)
+        
+        assert flight.do(1, lambda: "a") == ("a", False)
+        assert flight.do(2, lambda: "b") == ("b", False)
+    
+    def test_error_propagates_to_waiters(self):
+        """❌ Błąd przebiegu trafia do lidera i czekających"""
+        flight = SingleFlight(spawn=lambda target: None)
+        job = BlockingJob(error=RuntimeError("Bitrix niedostępny"))
+        results = []
+        leader = run_in_thread(flight, 1, job, results)
+        job.started.wait(2)
+        waiter = run_in_thread(flight, 1, job, results)
+        wait_for_waiters(flight, 1, 1)
+        job.release.set()
+        leader.join(2)
+        waiter.join(2)
+        
+        assert len(results) == 2
+        assert all(isinstance(result, RuntimeError) for result in results)
+        
+        # Then: Klucz zwolniony - kolejne wywołanie startuje od nowa
+        assert flight.do(1, lambda: "ok") == ("ok", False)
+    
+    def test_follow_up_error_is_logged_not_raised(self):
+        """❌ Błąd przebiegu uzupełniającego tylko logowany"""
+        flight = SingleFlight()
+        
+        def failing():
+            raise RuntimeError("boom")
+        
+        # When/Then: Nie rzuca
+        flight._run_follow_up(1, failing)
+        
+        with pytest.raises(RuntimeError):
+            flight.do(1, failing)
+
+
+class TestClaim:
+    """claim() / release() - przebieg zbiorczy zajmuje wiele kluczy"""
+    
+    def test_claim_skips_keys_in_flight(self):
+        """✅ Klucz z przebiegiem w toku nie jest zajmowany"""
+        flight = SingleFlight(spawn=lambda target: None)
+        job = BlockingJob()
+        results = []
+        leader = run_in_thread(flight, 1, job, results)
+        job.started.wait(2)
+        
+        claimed = flight.claim([1, 2, 3])
+        job.release.set()
+        leader.join(2)
+        
+        assert claimed == [2, 3]
+        assert set(flight.in_flight()) == {2, 3}
+    
+    def test_waiters_get_released_result_and_follow_up(self):
+        """✅ do() zajętego klucza czeka na release() i dostaje jego wynik; follow-up z func czekającego"""
+        # Given
+        follow_ups = []
+        flight = SingleFlight(spawn=follow_ups.append)
+        job = BlockingJob()
+        job.release.set()
+        results = []
+        flight.claim([1])
+        
+        # When
+        waiter = run_in_thread(flight, 1, job, results)
+        wait_for_waiters(flight, 1, 1)
+        flight.release(1, "sweep-result")
+        waiter.join(2)
+        
+        # Then: Wynik przebiegu zbiorczego, func nie wykonane
+        assert results == [("sweep-result", True)]
+        assert job.calls == 0
+        assert flight.in_flight() == {}
+        
+        # Then: Przebieg uzupełniający wykonuje func czekającego
+        follow_ups[0]()
+        assert job.calls == 1
+    
+    def test_release_error_propagates(self):
+        """❌ release(error=...) → czekający dostają błąd"""
+        flight = SingleFlight(spawn=lambda target: None)
+        results = []
+        flight.claim([1])
+        waiter = run_in_thread(flight, 1, BlockingJob(), results, follow_up=False)
+        wait_for_waiters(flight, 1, 1)
+        
+        flight.release(1, error=RuntimeError("sweep failed"))
+        waiter.join(2)
+        
+        assert isinstance(results[0], RuntimeError)
@@ -0,0 +1,177 @@
+"""
+Testy jednostkowe dla nagrywania i odtwarzania odpowiedzi Bitrix24 (snapshoty)
+"""
+import gzip
+import io
+import json
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from src.config import BitrixConfig
+from src.models import DealStage
+from src.services.bitrix_service import BitrixAPIError, BitrixService
+from src.services.http_session import create_http_session
+from src.services.snapshots import ReplayAdapter, SnapshotRecorder, load_snapshots
+
+
+class FakePortal(BaseAdapter):
+    """Portal w pamięci: crm.deal.list zwraca kolejne "wersje" listy"""
+    
+    def __init__(self):
+        super().__init__()
+        self.version = 0
+    
+    def send(self, request, **kwargs):
+        self.version += 1
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"result": [{"ID": "1", "TITLE": f"v{self.version}"}]}).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.request = request
+        return response
+    
+    def close(self):
+        pass
+
+
+def make_service(adapter, recorder=None):
+    """BitrixService na sesji z podanym adapterem"""
+    session = requests.Session()
+    session.mount("https://", adapter)
+    if recorder is not None:
+        recorder.attach(session)
+    
+    service = BitrixService()
+    service.session = session
+    return service
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """Nagranie dwóch identycznych zapytań crm.deal.list"""
+    path = str(tmp_path / "snapshots" / "run.jsonl.gz")
+    recorder = SnapshotRecorder(path)
+    service = make_service(FakePortal(), recorder)
+    
+    service.list_deals_page({"STAGE_ID": "C17:NEW"}, ["ID", "TITLE"])
+    service.list_deals_page({"STAGE_ID": "C17:NEW"}, ["ID", "TITLE"])
+    recorder.close()
+    return path
+
+
+class TestSnapshotRecorder:
+    """SnapshotRecorder - gzip JSON Lines bez tokenu webhooka"""
+    
+    def test_records_method_params_and_body(self, snapshot_path):
+        """✅ Każda odpowiedź - metoda, parametry, treść"""
+        entries = load_snapshots(snapshot_path)
+        
+        assert [e["method"] for e in entries] == ["crm.deal.list", "crm.deal.list"]
+        assert entries[0]["params"]["filter"]["STAGE_ID"] == "C17:NEW"
+        assert json.loads(entries[1]["body"])["result"][0]["TITLE"] == "v2"
+    
+    def test_webhook_token_not_recorded(self, snapshot_path):
+        """✅ URL z tokenem webhooka nie trafia do pliku"""
+        with gzip.open(snapshot_path, "rt") as snapshot:
+            content = snapshot.read()
+        
+        assert BitrixConfig().webhook_key not in content
+    
+    def test_directory_loaded(self, snapshot_path, tmp_path):
+        """✅ Katalog → wszystkie *.jsonl.gz"""
+        assert len(load_snapshots(str(tmp_path / "snapshots"))) == 2
+    
+    def test_recording_readable_without_close(self, tmp_path):
+        """✅ Recorder bez close() (proces zabity) → wszystkie wpisy do odczytu"""
+        # Given
+        path = str(tmp_path / "run.jsonl.gz")
+        service = make_service(FakePortal(), SnapshotRecorder(path))
+        
+        # When
+        service.list_deals_page({}, ["ID"])
+        service.list_deals_page({}, ["ID"])
+        
+        # Then
+        assert len(load_snapshots(path)) == 2
+    
+    def test_truncated_last_member_skipped(self, snapshot_path):
+        """✅ Obcięty ostatni człon gzip → wcześniejsze wpisy wczytane"""
+        with open(snapshot_path, "ab") as snapshot:
+            snapshot.write(gzip.compress(b'{"method": "crm.deal.list"}\n')[:-12])
+        
+        assert len(load_snapshots(snapshot_path)) == 2
+    
+    def test_unclosed_gzip_stream_loaded(self, tmp_path):
+        """✅ Strumień gzip bez trailera (flush bez close) → wpisy sprzed przerwania"""
+        # Given: Plik jak po SIGTERM w trakcie nagrywania jednym strumieniem
+        buffer = io.BytesIO()
+        stream = gzip.GzipFile(fileobj=buffer, mode="wb")
+        stream.write(b'{"key": "a"}\n{"key": "b"}\n{"key": "c')
+        stream.flush()
+        path = tmp_path / "run.jsonl.gz"
+        path.write_bytes(buffer.getvalue())
+        
+        # When
+        entries = load_snapshots(str(path))
+        
+        # Then
+        assert entries == [{"key": "a"}, {"key": "b"}]
+
+
+class TestReplayAdapter:
+    """ReplayAdapter - deterministyczne odtwarzanie bez sieci"""
+    
+    def test_repeated_query_served_in_recorded_order(self, snapshot_path):
+        """✅ Powtórzone zapytanie → odpowiedzi w kolejności nagrania, potem ostatnia"""
+        service = make_service(ReplayAdapter(load_snapshots(snapshot_path)))
+        
+        titles = [
+            service.list_deals_page({"STAGE_ID": "C17:NEW"}, ["ID", "TITLE"])[0]["TITLE"]
+            for _ in range(3)
+        ]
+        
+        assert titles == ["v1", "v2", "v2"]
+    
+    def test_missing_read_raises_bitrix_error(self, snapshot_path):
+        """❌ Odczyt spoza nagrania → BitrixAPIError SNAPSHOT_MISS"""
+        replay = ReplayAdapter(load_snapshots(snapshot_path))
+        service = make_service(replay)
+        
+        with pytest.raises(BitrixAPIError, match="SNAPSHOT_MISS"):
+            service.list_deals_page({"STAGE_ID": "C17:OTHER"}, ["ID"])
+        assert replay.stats()["misses"] == 1
+    
+    def test_writes_synthesized(self):
+        """✅ Zapis spoza nagrania → syntetyczny sukces, nic nie wychodzi do portalu"""
+        replay = ReplayAdapter([])
+        service = make_service(replay)
+        
+        results = service.batch_update_stages([
+            {"id": "1", "stage": DealStage.MAIN_LIST.value},
+            {"id": "2", "stage": DealStage.RESERVE.value},
+        ])
+        
+        assert all(result["success"] for result in results.values())
+        assert replay.stats()["synthesized"] == 1
+    
+    def test_recorded_latency(self, snapshot_path):
+        """✅ latency="recorded" - opóźnienie z nagrania, liczba - stałe"""
+        entries = load_snapshots(snapshot_path)
+        for entry in entries:
+            entry["elapsed"] = 0.25
+        sleeps = []
+        
+        service = make_service(ReplayAdapter(entries, latency="recorded", sleep=sleeps.append))
+        service.list_deals_page({"STAGE_ID": "C17:NEW"}, ["ID", "TITLE"])
+        service = make_service(ReplayAdapter(entries, latency=0.1, sleep=sleeps.append))
+        service.list_deals_page({"STAGE_ID": "C17:NEW"}, ["ID", "TITLE"])
+        
+        assert sleeps == [0.25, 0.1]
+    
+    def test_session_replays_when_configured(self, snapshot_path, monkeypatch):
+        """✅ BITRIX_REPLAY_PATH → sesja bez połączenia z portalem"""
+        monkeypatch.setenv("BITRIX_REPLAY_PATH", snapshot_path)
+        
+        session = create_http_session(BitrixConfig())
+        
+        assert isinstance(session.get_adapter("https://example.bitrix24.pl"), ReplayAdapter)
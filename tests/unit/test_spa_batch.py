@@ -0,0 +1,125 @@
+"""
+Testy jednostkowe dla przetwarzania wielu SPA (run_batch, open_spa_ids)
+"""
+import asyncio
+import threading
+import time
+from src.services.spa_batch import FREE_ALL_FIELD, open_spa_filter, open_spa_ids, run_batch
+
+
+class FakeAsyncBitrix:
+    """Atrapa AsyncBitrixService.list_spas - zapisuje filtr"""
+    
+    def __init__(self, items):
+        self.items = items
+        self.filters = []
+    
+    async def list_spas(self, filter, select=None):
+        self.filters.append(filter)
+        return self.items
+
+
+class TestOpenSpaIds:
+    """Lista SPA 'W trakcie' z wolnymi miejscami - jedno crm.item.list"""
+    
+    def test_filter_pushes_stage_and_free_slots(self):
+        """✅ Filtr: etap W trakcie + free_all > 0"""
+        assert open_spa_filter() == {"stageId": "DT1032_17:UC_CU0OTZ", f">{FREE_ALL_FIELD}": 0}
+        assert open_spa_filter(with_free_slots=False) == {"stageId": "DT1032_17:UC_CU0OTZ"}
+    
+    def test_skips_spa_without_free_slots(self):
+        """✅ SPA z free_all = 0 / brak pomijane (także gdy portal zignoruje filtr)"""
+        # Given
+        bitrix = FakeAsyncBitrix([
+            {"id": 1, FREE_ALL_FIELD: 3},
+            {"id": 2, FREE_ALL_FIELD: 0},
+            {"id": 3, FREE_ALL_FIELD: None},
+            {"id": 4, FREE_ALL_FIELD: 1},
+        ])
+        
+        # When
+        ids = asyncio.run(open_spa_ids(bitrix))
+        
+        # Then
+        assert ids == [1, 4]
+        assert len(bitrix.filters) == 1
+
+
+def make_tracked_run():
+    """Atrapa przetwarzania SPA mierząca szczyt równoległości"""
+    running, peak = [0], [0]
+    lock = threading.Lock()
+    
+    def run(spa_id):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {"spa_id": spa_id}
+    
+    return run, peak
+
+
+class TestRunBatch:
+    """Ograniczona równoległość, wyniki w kolejności zakończenia"""
+    
+    def test_results_in_completion_order(self):
+        """✅ Szybsze SPA zwracane wcześniej"""
+        delays = {1: 0.2, 2: 0.0, 3: 0.1}
+        
+        def run(spa_id):
+            time.sleep(delays[spa_id])
+            return {"status": "success", "spa_id": spa_id}
+        
+        results = list(run_batch([1, 2, 3], run, concurrency=3))
+        
+        assert [r["spa_id"] for r in results] == [2, 3, 1]
+    
+    def test_concurrency_is_bounded(self):
+        """✅ Nie więcej niż `concurrency` SPA naraz"""
+        # Given
+        run, peak = make_tracked_run()
+        
+        # When
+        results = list(run_batch(range(10), run, concurrency=3))
+        
+        # Then
+        assert len(results) == 10
+        assert peak[0] <= 3
+    
+    def test_oversized_concurrency_clamped(self, monkeypatch):
+        """❌ concurrency=500 z requestu → najwyżej BATCH_CONCURRENCY wątków"""
+        # Given
+        monkeypatch.setenv("BATCH_CONCURRENCY", "2")
+        run, peak = make_tracked_run()
+        
+        # When
+        results = list(run_batch(range(10), run, concurrency=500))
+        
+        # Then
+        assert len(results) == 10
+        assert peak[0] == 2
+    
+    def test_error_does_not_stop_batch(self):
+        """❌ Błąd jednego SPA → linia z błędem, reszta przetworzona"""
+        def run(spa_id):
+            if spa_id == 2:
+                raise RuntimeError("SPA nie istnieje")
+            return {"status": "success", "spa_id": spa_id}
+        
+        results = {r["spa_id"]: r for r in run_batch([1, 2, 3], run, concurrency=2)}
+        
+        assert results[2]["status"] == "error"
+        assert results[2]["error_type"] == "RuntimeError"
+        assert results[1]["status"] == results[3]["status"] == "success"
+    
+    def test_duplicates_and_empty(self):
+        """✅ Duplikaty przetwarzane raz, pusta lista → brak wyników"""
+        calls = []
+        
+        list(run_batch([5, 5, 6], lambda spa_id: calls.append(spa_id) or {}, concurrency=2))
+        
+        assert sorted(calls) == [5, 6]
+        assert list(run_batch([], lambda spa_id: {})) == []
@@ -0,0 +1,285 @@
+"""
+Testy jednostkowe dla process_spa (asynchroniczne przetwarzanie SPA)
+
+BitrixService jest zastąpiony atrapą w pamięci - bez połączenia z Bitrix24.
+"""
+import asyncio
+import pytest
+from src.models import SPA, Deal, DealStage, DealPriority
+from src.business_logic import DealPromoter
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.bitrix_service import BitrixService
+from src.services.spa_processor import process_spa
+
+
+class FakeBitrixService(BitrixService):
+    """Atrapa BitrixService - dane w pamięci, liczy round tripy"""
+    
+    def __init__(self, spa, deals):
+        super().__init__()
+        self.spa = spa
+        self.deals = deals
+        self.updates = []
+        self.requests = []
+        self.selects = []
+    
+    def _execute(self, method, params):
+        """Wykonuje pojedynczą metodę REST na danych w pamięci"""
+        if method == "crm.item.get":
+            return {"item": self.spa}
+        
+        if method == "crm.deal.list":
+            self.selects.append(params["select"])
+            matching = [d for d in self.deals if self._matches(d, params["filter"])]
+            
+            for field, direction in reversed(list(params.get("order", {"ID": "ASC"}).items())):
+                matching.sort(
+                    key=lambda d: int(d[field]) if field == "ID" else d.get(field) or "",
+                    reverse=direction == "DESC",
+                )
+            
+            start = max(0, params.get("start", 0))
+            return matching[start:start + self.PAGE_SIZE]
+        
+        raise AssertionError(f"Nieoczekiwana metoda: {method}")
+    
+    @staticmethod
+    def _matches(deal, filter):
+        """Obsługuje podzbiór filtrów Bitrix: IN, >ID, równość, puste / niepuste (pozostałe ignoruje)"""
+        for key, value in filter.items():
+            if key == ">ID":
+                if int(deal["ID"]) <= value:
+                    return False
+            elif key == "<=ID":
+                if int(deal["ID"]) > value:
+                    return False
+            elif key.startswith("!"):
+                if value == "" and not deal.get(key[1:]):
+                    return False
+            elif key[0] in "<>=":
+                continue
+            elif isinstance(value, list):
+                if deal.get(key) not in value:
+                    return False
+            elif key != "UF_CRM_1740931330" and (deal.get(key) or "") != value:
+                return False
+        return True
+    
+    def call(self, method, data):
+        self.requests.append(method)
+        result = self._execute(method, data)
+        
+        if method == "crm.deal.list" and data.get("start", 0) >= 0:
+            start = data.get("start", 0) + self.PAGE_SIZE
+            matching = [d for d in self.deals if self._matches(d, data["filter"])]
+            return {"result": result, "next": start if start < len(matching) else None, "total": len(matching)}
+        
+        return {"result": result}
+    
+    def batch(self, commands, halt=False):
+        self.requests.append("batch")
+        return {
+            "result": {key: self._execute(method, params) for key, (method, params) in commands.items()},
+            "result_error": {},
+            "result_total": {},
+            "result_next": {},
+        }
+    
+    def batch_update_stages(self, updates):
+        self.updates.extend(updates)
+        return {u["id"]: {"success": True, "error": None} for u in updates}
+
+
+@pytest.fixture
+def spa_data():
+    """Surowe dane SPA bezpłciowego z 2 wolnymi miejscami"""
+    return {
+        "id": 200,
+        "title": "SPA testowe",
+        "stageId": "DT1032_17:UC_CU0OTZ",
+        "ufCrm9_1740930205": 2,
+        "ufCrm9_1747740109": 1991,
+    }
+
+
+@pytest.fixture
+def gendered_spa_data(spa_data):
+    """Surowe dane SPA płciowego"""
+    return {**spa_data, "ufCrm9_1747740109": 1993}
+
+
+@pytest.fixture
+def deals_data():
+    """5 dealów w Sortowaniu i Rezerwie"""
+    return [
+        {
+            "ID": str(i),
+            "TITLE": f"Deal {i}",
+            "STAGE_ID": DealStage.SORTING.value if i % 2 else DealStage.RESERVE.value,
+            "UF_CRM_1743329864": DealPriority.P1.value if i < 3 else DealPriority.P2.value,
+        }
+        for i in range(1, 6)
+    ]
+
+
+class TestProcessSpa:
+    """process_spa - odczyt równoległy, decyzje, zapis batch"""
+    
+    def test_promotes_and_writes(self, spa_data, deals_data):
+        """✅ Awansuje do limitu i wysyła zmiany etapów"""
+        # Given
+        fake = FakeBitrixService(spa_data, deals_data)
+        
+        # When
+        result = asyncio.run(process_spa(200, bitrix=AsyncBitrixService(fake)))
+        
+        # Then
+        assert {d.id for d in result.promoted} == {"1", "2"}
+        assert result.stats["reserve"] == 3
+        assert result.updates_count == len(fake.updates)
+        promoted_updates = [u for u in fake.updates if u["stage"] == DealStage.MAIN_LIST.value]
+        assert {u["id"] for u in promoted_updates} == {"1", "2"}
+    
+    def test_dry_run_does_not_write(self, spa_data, deals_data):
+        """✅ Dry-run nie wysyła żadnych zmian"""
+        fake = FakeBitrixService(spa_data, deals_data)
+        
+        result = asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        assert result.dry_run is True
+        assert len(result.promoted) == 2
+        assert fake.updates == []
+    
+    def test_small_spa_reads_in_one_round_trip(self, spa_data, deals_data):
+        """✅ SPA + deale (<50) pobierane jednym wywołaniem batch"""
+        fake = FakeBitrixService(spa_data, deals_data)
+        
+        asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        assert fake.requests == ["batch"]
+    
+    def test_full_first_page_fetches_id_ranges_in_parallel(self, gendered_spa_data):
+        """✅ SPA płciowe, pełna pierwsza strona → total + zakresy ID równolegle"""
+        # Given - 120 dealów w Sortowaniu
+        deals = [
+            {"ID": str(i), "TITLE": f"Deal {i}", "STAGE_ID": DealStage.SORTING.value, "UF_CRM_1743329864": DealPriority.P1.value}
+            for i in range(1, 121)
+        ]
+        fake = FakeBitrixService(gendered_spa_data, deals)
+        
+        # When
+        result = asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        # Then - batch, sonda (total=70 → 2 strony), 2 zakresy ID
+        assert fake.requests == ["batch"] + ["crm.deal.list"] * 3
+        assert result.stats["total_input"] == 120
+    
+    def test_follow_up_pages_push_down_qualification_filters(self, gendered_spa_data):
+        """✅ Data szkolenia → dalsze deale jako 2 rozłączne zapytania (przyjazd)"""
+        # Given - SPA płciowe z datą szkolenia, 60 dealów
+        spa_data = {**gendered_spa_data, "ufCrm9_1740930537": "2025-10-15T00:00:00+03:00"}
+        deals = [
+            {"ID": str(i), "TITLE": f"Deal {i}", "STAGE_ID": DealStage.SORTING.value}
+            for i in range(1, 61)
+        ]
+        fake = FakeBitrixService(spa_data, deals)
+        
+        # When
+        result = asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        # Then - atrapa ignoruje klauzule przyjazdu, więc oba zapytania zwracają te same deale
+        assert fake.requests == ["batch", "crm.deal.list", "crm.deal.list"]
+        assert result.stats["total_input"] == 60, "Deale z obu zapytań powinny być zdeduplikowane"
+
+
+class TestGenderlessStreaming:
+    """SPA bezpłciowe - odczyt w kolejności sortowania z wczesnym zakończeniem"""
+    
+    @staticmethod
+    def make_deals():
+        """60 dealów P2 (z datą EXECUTING) + 120 dealów P1 bez daty + 5 P1 z datą"""
+        deals = [
+            {
+                "ID": str(i), "TITLE": f"Deal {i}", "STAGE_ID": DealStage.SORTING.value,
+                "UF_CRM_1743329864": DealPriority.P2.value,
+                "UF_CRM_1741856527": f"2025-01-{(i % 28) + 1:02d}T10:00:00+03:00",
+            }
+            for i in range(1, 61)
+        ]
+        deals += [
+            {"ID": str(i), "TITLE": f"Deal {i}", "STAGE_ID": DealStage.SORTING.value, "UF_CRM_1743329864": DealPriority.P1.value}
+            for i in range(61, 181)
+        ]
+        deals += [
+            {
+                "ID": str(i), "TITLE": f"Deal {i}", "STAGE_ID": DealStage.RESERVE.value,
+                "UF_CRM_1743329864": DealPriority.P1.value,
+                "UF_CRM_1741856527": f"2025-02-0{i - 180}T10:00:00+03:00",
+            }
+            for i in range(181, 186)
+        ]
+        return deals
+    
+    def test_stops_after_target_qualified(self, spa_data):
+        """✅ free_all=2 → wystarczy 6 pierwszych dealów w kolejności sortowania"""
+        fake = FakeBitrixService(spa_data, self.make_deals())
+        
+        result = asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        # batch + jedna strona P1 z datą (5) + jedna strona P1 bez daty (wystarczy)
+        assert fake.requests == ["batch", "crm.deal.list", "crm.deal.list"]
+        assert result.stats["total_input"] == 6
+        assert result.streamed is True
+        assert [d.id for d in result.promoted] == ["181", "182"]
+        assert [d.id for d in result.reserve] == ["183", "184", "185", "61"]
+    
+    def test_same_decisions_as_full_fetch(self, spa_data):
+        """✅ Awans i rezerwa identyczne jak przy pobraniu wszystkich dealów"""
+        deals = self.make_deals()
+        spa_data = {**spa_data, "ufCrm9_1740930205": 30}
+        
+        streamed = asyncio.run(process_spa(
+            200, dry_run=True, bitrix=AsyncBitrixService(FakeBitrixService(spa_data, deals))
+        ))
+        promoted, reserve, _ = DealPromoter().process(
+            SPA.from_api({"item": spa_data}), [Deal.from_api(d) for d in deals]
+        )
+        
+        assert [d.id for d in streamed.promoted] == [d.id for d in promoted]
+        assert [d.id for d in streamed.reserve] == [d.id for d in reserve]
+    
+    def test_streaming_uses_genderless_projection(self, spa_data):
+        """✅ Strumień bez pól płci i mieszkania"""
+        fake = FakeBitrixService(spa_data, self.make_deals())
+        
+        asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        first, *streamed = fake.selects
+        assert "UF_CRM_1740931105" in first
+        assert all("UF_CRM_1740931105" not in select for select in streamed)
+    
+    def test_rest_reuses_first_page(self, spa_data):
+        """✅ Deale bez priorytetu: pierwsza strona z batcha nie jest pobierana ponownie"""
+        # Given: 70 dealów bez priorytetu - strumień dochodzi do "reszty"
+        deals = [
+            {"ID": str(i), "TITLE": f"Deal {i}", "STAGE_ID": DealStage.SORTING.value}
+            for i in range(1, 71)
+        ]
+        fake = FakeBitrixService(spa_data, deals)
+        rest_filters = []
+        call = fake.call
+        
+        def recording_call(method, data):
+            if method == "crm.deal.list" and ">ID" in data["filter"]:
+                rest_filters.append(data["filter"])
+            return call(method, data)
+        
+        fake.call = recording_call
+        
+        # When
+        result = asyncio.run(process_spa(200, dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        # Then: Reszta od ID > 50 (koniec pierwszej strony), wynik kompletny
+        assert rest_filters and all(f[">ID"] >= 50 for f in rest_filters)
+        assert result.stats["total_input"] == 70
+        assert result.streamed is True
@@ -0,0 +1,154 @@
+"""
+Testy jednostkowe dla przeglądu portfela (sweep_open_spas)
+
+Portal zastąpiony atrapą w pamięci (jak w test_spa_processor) - liczy round tripy.
+"""
+import asyncio
+from src.models import DealStage, DealPriority
+from src.services.async_bitrix import AsyncBitrixService
+from src.services.single_flight import SingleFlight
+from src.services.sweep import sweep_open_spas
+from tests.unit.test_spa_processor import FakeBitrixService
+
+
+class FakePortfolioService(FakeBitrixService):
+    """Atrapa z wieloma SPA (crm.item.list)"""
+    
+    def __init__(self, spas, deals):
+        super().__init__(None, deals)
+        self.spas = spas
+    
+    def _execute(self, method, params):
+        if method == "crm.item.list":
+            after_id = params["filter"][">id"]
+            return {"items": [s for s in self.spas if s["id"] > after_id][:self.PAGE_SIZE]}
+        return super()._execute(method, params)
+
+
+def make_spa(spa_id, free_all, genderless=True):
+    return {
+        "id": spa_id,
+        "title": f"SPA {spa_id}",
+        "stageId": "DT1032_17:UC_CU0OTZ",
+        "ufCrm9_1740930205": free_all,
+        "ufCrm9_1747740109": 1991 if genderless else 1993,
+    }
+
+
+def make_deals(spa_id, first_id, count):
+    return [
+        {
+            "ID": str(i),
+            "TITLE": f"Deal {i}",
+            "STAGE_ID": DealStage.SORTING.value,
+            "UF_CRM_1743329864": DealPriority.P1.value,
+            "UF_CRM_1740931330": str(spa_id),
+        }
+        for i in range(first_id, first_id + count)
+    ]
+
+
+class TestSweepOpenSpas:
+    """Hurtowy odczyt SPA i dealów, decyzje per SPA, wspólny zapis"""
+    
+    def test_round_trips_do_not_scale_with_spa_count(self):
+        """✅ 3 SPA → jedno crm.item.list + zapytania o deale, nie 3x na SPA"""
+        # Given: 3 SPA po 4 deale
+        spas = [make_spa(10, 1), make_spa(20, 2), make_spa(30, 3)]
+        deals = make_deals(10, 1, 4) + make_deals(20, 5, 4) + make_deals(30, 9, 4)
+        fake = FakePortfolioService(spas, deals)
+        
+        # When
+        results = asyncio.run(sweep_open_spas(bitrix=AsyncBitrixService(fake)))
+        
+        # Then: Odczyt: 1x crm.item.list + 1x sonda crm.deal.list (12 dealów < strona)
+        assert fake.requests == ["crm.item.list", "crm.deal.list"]
+        
+        # Then: Każde SPA awansuje do swojego limitu
+        promoted = {r.spa.id: r.stats["promoted"] for r in results}
+        assert promoted == {10: 1, 20: 2, 30: 3}
+        assert {r.spa.id: r.stats["total_input"] for r in results} == {10: 4, 20: 4, 30: 4}
+        
+        # Then: Zmiany wszystkich SPA wysłane razem, przypisane do właściwych SPA
+        assert sum(r.updates_count for r in results) == len(fake.updates)
+        assert set(results[0].update_results) <= {"1", "2", "3", "4"}
+        assert set(results[1].update_results) <= {"5", "6", "7", "8"}
+    
+    def test_skips_spa_without_free_slots(self):
+        """✅ SPA z free_all = 0 pomijane"""
+        spas = [make_spa(10, 0), make_spa(20, 1)]
+        fake = FakePortfolioService(spas, make_deals(10, 1, 2) + make_deals(20, 3, 2))
+        
+        results = asyncio.run(sweep_open_spas(bitrix=AsyncBitrixService(fake)))
+        
+        assert [r.spa.id for r in results] == [20]
+    
+    def test_dry_run_writes_nothing(self):
+        """✅ Dry-run - decyzje bez zapisu"""
+        fake = FakePortfolioService([make_spa(10, 1)], make_deals(10, 1, 3))
+        
+        results = asyncio.run(sweep_open_spas(dry_run=True, bitrix=AsyncBitrixService(fake)))
+        
+        assert results[0].stats["promoted"] == 1
+        assert results[0].dry_run
+        assert fake.updates == []
+    
+    def test_no_open_spas(self):
+        """✅ Brak aktywnych SPA → bez zapytań o deale"""
+        fake = FakePortfolioService([], [])
+        
+        assert asyncio.run(sweep_open_spas(bitrix=AsyncBitrixService(fake))) == []
+        assert fake.requests == ["crm.item.list"]
+
+
+class TestSweepSingleFlight:
+    """Przegląd z zapisem a przebiegi pojedynczych SPA"""
+    
+    def test_skips_spa_in_flight(self):
+        """✅ SPA przetwarzane właśnie przez inny przebieg → pominięte, bez zapisu jego dealów"""
+        # Given: SPA 10 w toku (np. webhook)
+        spas = [make_spa(10, 1), make_spa(20, 1)]
+        fake = FakePortfolioService(spas, make_deals(10, 1, 2) + make_deals(20, 3, 2))
+        flight = SingleFlight(spawn=lambda target: None)
+        flight.claim([(10, False)])
+        
+        # When
+        results = asyncio.run(sweep_open_spas(bitrix=AsyncBitrixService(fake), flight=flight))
+        
+        # Then
+        assert [r.spa.id for r in results] == [20]
+        assert {u["id"] for u in fake.updates} <= {"3", "4"}
+        assert list(flight.in_flight()) == [(10, False)]
+    
+    def test_holds_spas_until_written(self):
+        """✅ SPA zajęte od odczytu dealów do końca zapisu, potem zwolnione"""
+        # Given
+        fake = FakePortfolioService([make_spa(10, 1)], make_deals(10, 1, 3))
+        flight = SingleFlight(spawn=lambda target: None)
+        held = []
+        original = fake.batch_update_stages
+        
+        def batch_update_stages(updates):
+            held.append(set(flight.in_flight()))
+            return original(updates)
+        
+        fake.batch_update_stages = batch_update_stages
+        
+        # When
+        results = asyncio.run(sweep_open_spas(bitrix=AsyncBitrixService(fake), flight=flight))
+        
+        # Then
+        assert held == [{(10, False)}]
+        assert results[0].stats["promoted"] == 1
+        assert flight.in_flight() == {}
+    
+    def test_dry_run_does_not_claim(self):
+        """✅ Dry-run niczego nie zapisuje - nie blokuje przebiegów SPA"""
+        fake = FakePortfolioService([make_spa(10, 1)], make_deals(10, 1, 3))
+        flight = SingleFlight(spawn=lambda target: None)
+        flight.claim([(10, False)])
+        
+        results = asyncio.run(sweep_open_spas(dry_run=True, bitrix=AsyncBitrixService(fake), flight=flight))
+        
+        assert [r.spa.id for r in results] == [10]
+